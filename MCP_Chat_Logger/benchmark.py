@@ -0,0 +1,446 @@
+"""
+Offline benchmarks for the ingestion and dashboard hot paths.
+
+Gemini is replaced by FakeGenerativeModel (configurable latency and replies),
+conversations come from a seeded synthetic generator, and every stage runs in a
+fresh process so its peak RSS is its own. Each stage reports throughput and
+p50/p99 latency:
+
+    python benchmark.py                                   # all stages, default sizes
+    python benchmark.py --stages api_projects --corpus-sizes 1000,10000,100000
+    python benchmark.py --save baseline.json
+    python benchmark.py --baseline baseline.json --max-regression 0.25   # exit 1 on regression
+"""
+from typing import Any, Callable, Dict, List, Optional
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import tempfile
+import resource
+import multiprocessing
+
+_THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+_FRONT_END_DIR = os.path.join(os.path.dirname(_THIS_DIR), "front_end")
+
+STAGES = ("extract_code_blocks", "find_semantic_matches", "save_chat_history", "process_log_files", "api_projects")
+
+_WORDS = (
+    "the handler retries request cache token session config parser schema query index "
+    "worker queue latency update model response client server error timeout value"
+).split()
+_CODE_LINES = [
+    "def handle(request):",
+    "    payload = json.loads(request.body)",
+    "    if not payload.get('id'):",
+    "        raise ValueError('missing id')",
+    "    result = store.upsert(payload)",
+    "    return {'ok': True, 'result': result}",
+]
+
+
+# ----------------------------
+# Synthetic conversations
+# ----------------------------
+def make_message(rng: random.Random, length: int, code_density: float) -> str:
+    """Prose of about `length` characters; with probability `code_density`, a before/after code pair."""
+    words: List[str] = []
+    size = 0
+    while size < length:
+        w = rng.choice(_WORDS)
+        words.append(w)
+        size += len(w) + 1
+    text = " ".join(words).capitalize() + "."
+    if rng.random() < code_density:
+        block = "\n".join(rng.sample(_CODE_LINES, k=len(_CODE_LINES)))
+        text += f"\nBefore:\n```python\n{block}\n```\nAfter:\n```python\n{block}\n    # fixed\n```\n"
+    elif rng.random() < 0.2:
+        text = "How does the " + " ".join(words[:6]) + " work?"
+    return text
+
+
+def make_conversation(
+    rng: random.Random,
+    n_messages: int,
+    length: int = 400,
+    code_density: float = 0.3,
+) -> List[Dict[str, Any]]:
+    return [
+        {"content": make_message(rng, length, code_density), "timestamp": f"2025-01-01T00:{i // 60:02d}:{i % 60:02d}"}
+        for i in range(n_messages)
+    ]
+
+
+def make_log_payload(rng: random.Random, project: str, n_messages: int, length: int, code_density: float) -> Dict[str, Any]:
+    convo_id = str(uuid.UUID(int=rng.getrandbits(128)))
+    messages = [
+        {
+            "content": m["content"],
+            "timestamp": m["timestamp"],
+            "type": rng.choice(["code-change", "question", "discussion"]),
+            "tags": ["function modify"],
+            "ai_model": "fake",
+            "before_code": "",
+            "after_code": "",
+        }
+        for m in make_conversation(rng, n_messages, length, code_density)
+    ]
+    return {
+        "id": convo_id,
+        "project_name": project,
+        "title": " ".join(rng.sample(_WORDS, 4)),
+        "summary": make_message(rng, 200, 0.0),
+        "messages": messages,
+        "message_count": len(messages),
+        "conversation_id": convo_id,
+    }
+
+
+def write_corpus(log_dir: str, n_logs: int, seed: int, messages_per_log: int = 8, projects: int = 20) -> None:
+    rng = random.Random(seed)
+    os.makedirs(log_dir, exist_ok=True)
+    for i in range(n_logs):
+        payload = make_log_payload(rng, f"project-{i % projects}", messages_per_log, 200, 0.2)
+        path = os.path.join(log_dir, f"conversation_{payload['id']}_20250101_{i:06d}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+
+
+# ----------------------------
+# Gemini stand-in
+# ----------------------------
+class _FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+        self.candidates: List[Any] = []
+
+
+class FakeGenerativeModel:
+    """
+    Drop-in for genai.GenerativeModel: sleeps `latency` (+/- `jitter`) seconds and
+    answers summary, single and batched classification prompts with fixed JSON.
+    """
+
+    latency = 0.2
+    jitter = 0.0
+    message_type = "code-change"
+    calls = 0
+
+    def __init__(self, model_name: str = "fake-gemini", **_: Any):
+        self.model_name = model_name
+
+    def generate_content(self, prompt: str, generation_config: Optional[Dict[str, Any]] = None, **_: Any) -> _FakeResponse:
+        type(self).calls += 1
+        time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        item = {"type": self.message_type, "tags": ["benchmark"], "before_code": None, "after_code": None}
+        batch = re.search(r"with exactly (\d+) objects", prompt)
+        if batch:
+            return _FakeResponse(json.dumps([{**item, "index": n} for n in range(int(batch.group(1)))]))
+        if "<CONVERSATION>" in prompt or "<PREVIOUS_SUMMARY>" in prompt:
+            return _FakeResponse(json.dumps({"title": "Synthetic conversation", "summary": "**Updated** the handler."}))
+        return _FakeResponse(json.dumps(item))
+
+
+class FakeGenAI:
+    """Stands in for the google.generativeai module."""
+
+    GenerativeModel = FakeGenerativeModel
+
+    @staticmethod
+    def configure(**_: Any) -> None:
+        pass
+
+
+# ----------------------------
+# Stages (each runs in its own process)
+# ----------------------------
+def _percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))]
+
+
+def _report(stage: str, latencies: List[float], items: int, seconds: float, **extra: Any) -> Dict[str, Any]:
+    return {
+        "stage": stage,
+        "items": items,
+        "seconds": round(seconds, 4),
+        "throughput_per_s": round(items / seconds, 2) if seconds else 0.0,
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 3),
+        **extra,
+    }
+
+
+def _timed(fn: Callable[[], Any], repeat: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+
+def stage_extract_code_blocks(args: Dict[str, Any]) -> Dict[str, Any]:
+    from code_fences import extract_before_after
+
+    rng = random.Random(args["seed"])
+    messages = [make_message(rng, args["message_chars"], args["code_density"]) for _ in range(args["messages"] * 20)]
+    t0 = time.perf_counter()
+    latencies = [_timed(lambda m=m: extract_before_after(m), 1)[0] for m in messages]
+    return _report("extract_code_blocks", latencies, len(messages), time.perf_counter() - t0)
+
+
+def stage_find_semantic_matches(args: Dict[str, Any]) -> Dict[str, Any]:
+    # a fresh embedding cache per run: hits carried over from earlier runs would skew --baseline comparisons
+    os.environ["EMBED_CACHE_DIR"] = os.path.join(tempfile.mkdtemp(prefix="bench_embed_"), "embeddings")
+    from process import find_semantic_matches, get_concept_embeddings
+
+    rng = random.Random(args["seed"])
+    get_concept_embeddings()  # model load is not part of the per-message cost
+    messages = make_conversation(rng, args["messages"], args["message_chars"], args["code_density"])
+    t0 = time.perf_counter()
+    latencies = [
+        _timed(lambda m=m: find_semantic_matches({"messages": [m]}, "feature_development", top_n=10), 1)[0]
+        for m in messages
+    ]
+    return _report("find_semantic_matches", latencies, len(messages), time.perf_counter() - t0)
+
+
+def stage_save_chat_history(args: Dict[str, Any]) -> Dict[str, Any]:
+    work = tempfile.mkdtemp(prefix="bench_save_")
+    os.environ.update({
+        "GEMINI_API_KEY": "fake",
+        "LLM_CACHE_DISABLED": "1",
+        "GEMINI_RPM": "0",  # measure the pipeline, not the quota
+        "GEMINI_TPM": "0",
+        "ENRICH_WORKERS": "0",
+        "CHAT_LOG_DB": os.path.join(work, "chat_logs.sqlite3"),
+        "VECTOR_INDEX_DIR": os.path.join(work, "vectors"),
+        "JOB_QUEUE_PATH": os.path.join(work, "jobs.sqlite3"),
+        "METRICS_DIR": os.path.join(work, "metrics"),
+        "EMBED_CACHE_DIR": os.path.join(work, "embeddings"),  # start cold, leave the real cache alone
+    })
+    import chat_logger
+
+    FakeGenerativeModel.latency = args["latency_ms"] / 1000.0
+    FakeGenerativeModel.jitter = FakeGenerativeModel.latency / 4
+    chat_logger.genai = FakeGenAI
+    chat_logger._THIS_DIR = work  # logs go to <work>/chat_logs
+
+    rng = random.Random(args["seed"])
+    conversations = [
+        make_conversation(rng, args["messages"], args["message_chars"], args["code_density"])
+        for _ in range(args["conversations"])
+    ]
+
+    async def run() -> List[float]:
+        samples = []
+        for convo in conversations:
+            t0 = time.perf_counter()
+            await chat_logger.save_chat_history(convo, project_name="benchmark", wait=True)
+            samples.append(time.perf_counter() - t0)
+        return samples
+
+    t0 = time.perf_counter()
+    latencies = asyncio.run(run())
+    return _report(
+        "save_chat_history", latencies, len(conversations), time.perf_counter() - t0,
+        llm_calls=FakeGenerativeModel.calls,
+        messages_per_conversation=args["messages"],
+    )
+
+
+def _load_dashboard(log_dir: str, db_path: str):
+    sys.path.insert(0, _FRONT_END_DIR)
+    import app as dashboard
+
+    dashboard.app.config["CHAT_LOGS_DIR"] = log_dir
+    dashboard.app.config["CHAT_LOG_DB"] = db_path
+    return dashboard
+
+
+def process_log_files(log_dir: str) -> Dict[str, Any]:
+    """The dashboard's original read path (parse every JSON log per request), kept as a baseline."""
+    files = sorted(
+        (os.path.join(log_dir, n) for n in os.listdir(log_dir) if n.endswith(".json") and not n.startswith(".")),
+        key=os.path.getmtime,
+        reverse=True,
+    )
+    project_summaries = []
+    for path in files:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception:
+            continue
+        project_summaries.append({
+            "id": data.get("id"),
+            "projectName": data.get("project_name"),
+            "title": data.get("title"),
+            "summary": data.get("summary"),
+            "messages": data.get("messages"),
+            "messageCount": data.get("message_count"),
+        })
+
+    project_map: Dict[str, Dict[str, Any]] = {}
+    for summary in project_summaries:
+        name = summary["projectName"]
+        if name in project_map:
+            project_map[name]["updates"] += 1
+        else:
+            project_map[name] = {"name": name, "updates": 1, "status": "Active"}
+    return {"projects": list(project_map.values()), "projectSummaries": project_summaries}
+
+
+def stage_process_log_files(args: Dict[str, Any]) -> Dict[str, Any]:
+    work = tempfile.mkdtemp(prefix="bench_logs_")
+    log_dir = os.path.join(work, "chat_logs")
+    write_corpus(log_dir, args["corpus_size"], args["seed"])
+
+    repeat = args["requests"]
+    t0 = time.perf_counter()
+    latencies = _timed(lambda: process_log_files(log_dir), repeat)
+    return _report(
+        f"process_log_files[n={args['corpus_size']}]", latencies, repeat, time.perf_counter() - t0,
+        corpus_size=args["corpus_size"],
+    )
+
+
+def stage_api_projects(args: Dict[str, Any]) -> Dict[str, Any]:
+    work = tempfile.mkdtemp(prefix="bench_api_")
+    log_dir = os.path.join(work, "chat_logs")
+    write_corpus(log_dir, args["corpus_size"], args["seed"])
+    dashboard = _load_dashboard(log_dir, os.path.join(work, "chat_logs.sqlite3"))
+    client = dashboard.app.test_client()
+
+    # first request imports the corpus into the store
+    t0 = time.perf_counter()
+    client.get("/api/projects?limit=50")
+    cold = time.perf_counter() - t0
+
+    def page() -> None:
+        response = client.get("/api/projects?limit=50")
+        if response.status_code != 200:
+            raise RuntimeError(f"/api/projects answered {response.status_code}")
+
+    repeat = args["requests"]
+    t0 = time.perf_counter()
+    latencies = _timed(page, repeat)
+    return _report(
+        f"api_projects[n={args['corpus_size']}]", latencies, repeat, time.perf_counter() - t0,
+        corpus_size=args["corpus_size"],
+        cold_sync_seconds=round(cold, 4),
+    )
+
+
+_STAGE_FUNCS = {
+    "extract_code_blocks": stage_extract_code_blocks,
+    "find_semantic_matches": stage_find_semantic_matches,
+    "save_chat_history": stage_save_chat_history,
+    "process_log_files": stage_process_log_files,
+    "api_projects": stage_api_projects,
+}
+
+
+def _stage_entry(name: str, args: Dict[str, Any], out: Any) -> None:
+    try:
+        result = _STAGE_FUNCS[name](args)
+    except ImportError as e:
+        result = {"stage": name, "skipped": f"missing dependency: {e}"}
+    except Exception as e:
+        result = {"stage": name, "error": f"{type(e).__name__}: {e}"}
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result["peak_rss_mb"] = round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    out.put(result)
+
+
+def run_stage(name: str, args: Dict[str, Any]) -> Dict[str, Any]:
+    """Run one stage in a fresh process so peak RSS and imports are isolated."""
+    ctx = multiprocessing.get_context("spawn")
+    out = ctx.Queue()
+    proc = ctx.Process(target=_stage_entry, args=(name, args, out))
+    proc.start()
+    result = out.get()
+    proc.join()
+    return result
+
+
+# ----------------------------
+# Regression check
+# ----------------------------
+def compare(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], max_regression: float) -> List[str]:
+    """Stages whose p50/p99 grew, or throughput fell, by more than `max_regression` (a fraction)."""
+    previous = {r["stage"]: r for r in baseline if "p50_ms" in r}
+    failures = []
+    for r in results:
+        old = previous.get(r["stage"])
+        if old is None or "p50_ms" not in r:
+            continue
+        for key in ("p50_ms", "p99_ms"):
+            if old[key] and r[key] > old[key] * (1 + max_regression):
+                failures.append(f"{r['stage']}: {key} {old[key]} -> {r[key]}")
+        if old["throughput_per_s"] and r["throughput_per_s"] < old["throughput_per_s"] * (1 - max_regression):
+            failures.append(f"{r['stage']}: throughput {old['throughput_per_s']} -> {r['throughput_per_s']}/s")
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline benchmarks for chat_logger and the dashboard API")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"comma-separated subset of {', '.join(STAGES)}")
+    parser.add_argument("--messages", type=int, default=50, help="messages per synthetic conversation")
+    parser.add_argument("--message-chars", type=int, default=400)
+    parser.add_argument("--code-density", type=float, default=0.3, help="fraction of messages with code blocks")
+    parser.add_argument("--conversations", type=int, default=5, help="conversations saved by save_chat_history")
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="fake Gemini latency per call")
+    parser.add_argument("--corpus-sizes", default="1000,10000", help="log counts for the dashboard stages")
+    parser.add_argument("--requests", type=int, default=50, help="timed calls per dashboard stage")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="write results as JSON")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.25)
+    args = parser.parse_args()
+
+    base = {
+        "messages": args.messages,
+        "message_chars": args.message_chars,
+        "code_density": args.code_density,
+        "conversations": args.conversations,
+        "latency_ms": args.latency_ms,
+        "requests": args.requests,
+        "seed": args.seed,
+    }
+    results: List[Dict[str, Any]] = []
+    for name in [s.strip() for s in args.stages.split(",") if s.strip()]:
+        if name not in _STAGE_FUNCS:
+            parser.error(f"unknown stage: {name}")
+        if name in ("process_log_files", "api_projects"):
+            runs = [{**base, "corpus_size": int(n)} for n in args.corpus_sizes.split(",")]
+        else:
+            runs = [base]
+        for stage_args in runs:
+            result = run_stage(name, stage_args)
+            results.append(result)
+            print(json.dumps(result))
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            failures = compare(results, json.load(f), args.max_regression)
+        for line in failures:
+            print(f"REGRESSION {line}")
+        if failures:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
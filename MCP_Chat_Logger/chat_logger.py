@@ -1,23 +1,66 @@
-from typing import List, Dict, Any, Optional, Tuple
+import time
+_IMPORT_START = time.perf_counter()
+
+from typing import IO, Iterator, List, Dict, Any, Optional, Tuple
 import os
+import asyncio
+import glob
 import json
 import re
+import sys
+import tempfile
 import uuid
+import threading
+from contextlib import asynccontextmanager
 from datetime import datetime
-from pydantic import BaseModel
+from functools import lru_cache
+from pydantic import BaseModel, Field
 from dotenv import load_dotenv
-import google.generativeai as genai
 from mcp.server.fastmcp import FastMCP
+from llm_cache import LLMCache, get_llm_cache
+from log_store import get_log_store
+from job_queue import get_job_queue, run_worker
+from enrich_pool import get_enrichment_pool
+from lazy_imports import LazyModule, IMPORT_TIMINGS
+from code_fences import extract_before_after, first_brace_object, json_candidates
+from llm_router import ROUTER_MODEL, ROUTING_STATS, route_message
+from llm_client import CircuitBreaker, GeminiClient, LLMUnavailable
+from metrics import METRICS
 from process import (
     get_type_from_tag,
     extract_functions,
     extract_bug_fixes,
+    batch_semantic_matches,
+    batch_keywords,
+    get_concept_embeddings,
+    get_semantic_model,
+    get_embedding_cache_stats as _embedding_cache_stats,
     normalize_llm_type,
 )
 
+# deferred: google.generativeai and numpy are imported on first use
+genai = LazyModule("google.generativeai")
+np = LazyModule("numpy")
+
 _THIS_DIR = os.path.dirname(os.path.abspath(__file__))
 load_dotenv(os.path.join(_THIS_DIR, ".env"))
-mcp = FastMCP("chat_logger")
+
+@asynccontextmanager
+async def _server_lifespan(server: FastMCP):
+    # jobs left queued (or mid-lease) by a previous run resume without waiting for a new save
+    _ensure_background_worker()
+    yield {}
+
+mcp = FastMCP("chat_logger", lifespan=_server_lifespan)
+
+# bump when a prompt changes so cached responses for the old wording are not reused
+SUMMARY_PROMPT_VERSION = "summary-v1"
+CLASSIFY_PROMPT_VERSION = "classify-v1"
+SUMMARY_DELTA_PROMPT_VERSION = "summary-delta-v1"
+CLASSIFY_BATCH_PROMPT_VERSION = "classify-batch-v1"
+CLASSIFY_GENERATION_CONFIG = {"temperature": 0.1, "max_output_tokens": 500}
+# a batch request gets max_output_tokens_per_message * len(batch) output tokens
+CLASSIFY_BATCH_GENERATION_CONFIG = {"temperature": 0.1, "max_output_tokens_per_message": 500}
 
 
 class ChatMessage(BaseModel):
@@ -28,6 +71,7 @@ class ChatMessage(BaseModel):
     ai_model: str
     before_code: str
     after_code: str
+    enrichment: Dict[str, Any] = Field(default_factory=dict)  # {"keywords": [...]} from the KeyBERT pass
 
 class ConversationSummary(BaseModel):
     id: str
@@ -36,6 +80,7 @@ class ConversationSummary(BaseModel):
     summary: str
     messages: List[ChatMessage]
     message_count: int
+    enrichment: Dict[str, Any] = Field(default_factory=dict)
 
 def ensure_logs_directory() -> None:
     out_dir = os.path.join(_THIS_DIR, "chat_logs")
@@ -48,17 +93,75 @@ def require_gemini() -> str:
         raise RuntimeError(
             "GEMINI_API_KEY is missing. Put it in MCP_Chat_Logger/.env or export it in your shell."
         )
-    genai.configure(api_key=api_key)
+    get_gemini_client()
     return api_key
 
+@lru_cache(maxsize=1)
+def get_gemini_client() -> GeminiClient:
+    """The process-wide Gemini client: SDK configured once, rate limited, retrying (see llm_client)."""
+    return GeminiClient(
+        genai,
+        os.getenv("GEMINI_API_KEY", "").strip(),
+        requests_per_minute=float(os.getenv("GEMINI_RPM", "60")),
+        tokens_per_minute=float(os.getenv("GEMINI_TPM", "1000000")),
+        max_retries=int(os.getenv("GEMINI_MAX_RETRIES", "5")),
+        timeout=float(os.getenv("GEMINI_TIMEOUT", "60")),
+        breaker=CircuitBreaker(
+            int(os.getenv("GEMINI_BREAKER_FAILURES", "5")),
+            float(os.getenv("GEMINI_BREAKER_RESET_SECONDS", "30")),
+        ),
+    )
+
+def _generate(model_name: str, prompt: str, generation_config: Dict[str, Any], kind: str) -> Any:
+    """One Gemini call through the shared client, recording latency, outcome and token counts under `kind`."""
+    start = time.perf_counter()
+    try:
+        response = get_gemini_client().generate(
+            model_name,
+            prompt,
+            generation_config,
+            _estimate_tokens(prompt) + int(generation_config.get("max_output_tokens", 0)),
+            kind,
+        )
+    except LLMUnavailable as e:
+        METRICS.inc("llm_calls_total", kind=kind, outcome="unavailable")
+        METRICS.inc("errors_total", stage=f"llm_{kind}", cause=type(e).__name__)
+        raise
+    except Exception as e:
+        METRICS.inc("llm_calls_total", kind=kind, outcome="error")
+        METRICS.inc("errors_total", stage=f"llm_{kind}", cause=type(e).__name__)
+        raise
+    finally:
+        METRICS.observe("llm_request_seconds", time.perf_counter() - start, kind=kind)
+    METRICS.inc("llm_calls_total", kind=kind, outcome="ok")
+    # prefer the API's usage numbers; fall back to the ~4 chars/token estimate
+    usage = getattr(response, "usage_metadata", None)
+    METRICS.inc(
+        "llm_tokens_total",
+        getattr(usage, "prompt_token_count", None) or _estimate_tokens(prompt),
+        kind=kind, direction="prompt",
+    )
+    METRICS.inc(
+        "llm_tokens_total",
+        getattr(usage, "candidates_token_count", None) or _estimate_tokens(_response_text(response)),
+        kind=kind, direction="output",
+    )
+    return response
+
+def _fallback_summary(conversation_text: str) -> Dict[str, str]:
+    """Placeholder title/summary when Gemini is unavailable (never cached, so a later save can replace it)."""
+    words = conversation_text.split()
+    return {
+        "title": " ".join(words[:8]) or "Untitled Conversation",
+        "summary": "Summary unavailable: the Gemini API was rate limited or unreachable.",
+    }
+
 def summarize_conversation_with_gemini(messages: List[Dict[str, Any]]) -> Dict[str, str]:
     api_key = os.getenv("GEMINI_API_KEY").strip()
     if not api_key:
         return {"title": "Analysis Failed", "summary": "GEMINI_API_KEY not configured"}
 
-    genai.configure(api_key=api_key)
     model_name = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
-    model = genai.GenerativeModel(model_name)
     conversation_text = "\n".join(f"{m.get('content','')}" for m in messages).strip()
     if not conversation_text:
         return {"title": "Empty Conversation", "summary": "No content to summarize."}
@@ -78,131 +181,174 @@ def summarize_conversation_with_gemini(messages: List[Dict[str, Any]]) -> Dict[s
         }}
     """.strip()
 
-    response = model.generate_content(
-        prompt,
-        generation_config={
-            "temperature": float(os.getenv("GEMINI_TEMPERATURE", "0.3")),
-            "max_output_tokens": int(os.getenv("GEMINI_MAX_TOKENS", "800")),
-        },
-    )
+    generation_config = {
+        "temperature": float(os.getenv("GEMINI_TEMPERATURE", "0.3")),
+        "max_output_tokens": int(os.getenv("GEMINI_MAX_TOKENS", "800")),
+    }
+    cache = get_llm_cache()
+    cache_key = LLMCache.make_key(model_name, SUMMARY_PROMPT_VERSION, generation_config, conversation_text)
+    if cache is not None:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    try:
+        response = _generate(model_name, prompt, generation_config, "summary")
+    except LLMUnavailable:
+        return _fallback_summary(conversation_text)
     text = getattr(response, "text", "")
     m = parse_json_payload(text)
     if not m:
         return {"title": "Analysis Failed", "summary": "Could not parse AI response."}
-    try:
-        return json.loads(m.group(0))
-    except Exception:
+    if not isinstance(m, dict):
         return {"title": "Analysis Failed", "summary": "Invalid JSON from model."}
+    if cache is not None:
+        cache.put(cache_key, m)
+    return m
 
-def parse_json_payload(raw: str):
-    import json, re
-    for pattern in [
-        r"```json\s*([\s\S]*?)```",
-        r"```\s*([\s\S]*?)```",
-        r"\{[\s\S]*?\}",
-    ]:
-        m = re.search(pattern, raw, re.DOTALL)
-        if m:
-            try:
-                return json.loads(m.group(1) if "```" in pattern else m.group(0))
-            except Exception:
-                continue
-    return None
+def summarize_conversation_delta_with_gemini(
+    previous_title: str,
+    previous_summary: str,
+    new_messages: List[Dict[str, Any]],
+) -> Dict[str, str]:
+    """Update an existing title/summary with only the messages added since it was written."""
+    api_key = os.getenv("GEMINI_API_KEY", "").strip()
+    if not api_key:
+        return {"title": previous_title or "Analysis Failed", "summary": previous_summary or "GEMINI_API_KEY not configured"}
 
-def _parse_json_payload(raw: str) -> Optional[Dict[str, Any]]:
-    # try fenced ```json
-    m = re.search(r"```json\s*([\s\S]*?)```", raw, re.DOTALL | re.IGNORECASE)
-    if m:
-        try:
-            return json.loads(m.group(1))
-        except Exception:
-            pass
-    # try generic ```
-    m = re.search(r"```\s*([\s\S]*?)```", raw, re.DOTALL)
-    if m:
+    delta_text = "\n".join(f"{m.get('content','')}" for m in new_messages).strip()
+    if not delta_text:
+        return {"title": previous_title, "summary": previous_summary}
+
+    model_name = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+
+    prompt = f"""
+        You are an expert technical summarizer. <PREVIOUS_SUMMARY> describes the earlier part of a programming
+        conversation; <NEW_MESSAGES> is what was said since. Produce an updated title and summary for the whole
+        conversation and output JSON.
+
+        <PREVIOUS_SUMMARY>
+        Title: {previous_title}
+        {previous_summary}
+        </PREVIOUS_SUMMARY>
+
+        <NEW_MESSAGES>
+        {delta_text}
+        </NEW_MESSAGES>
+
+        Respond with ONLY valid JSON:
+        {{
+        "title": "max 8 words capturing the main theme",
+        "summary": "2-4 sentences; use **bold** for actions (modified/added/fixed/updated/created) and for key files/functions; focus on concrete outcomes"
+        }}
+    """.strip()
+
+    generation_config = {
+        "temperature": float(os.getenv("GEMINI_TEMPERATURE", "0.3")),
+        "max_output_tokens": int(os.getenv("GEMINI_MAX_TOKENS", "800")),
+    }
+    cache = get_llm_cache()
+    cache_key = LLMCache.make_key(
+        model_name,
+        SUMMARY_DELTA_PROMPT_VERSION,
+        generation_config,
+        f"{previous_title}\0{previous_summary}\0{delta_text}",
+    )
+    if cache is not None:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    try:
+        response = _generate(model_name, prompt, generation_config, "summary_delta")
+    except LLMUnavailable:
+        return {"title": previous_title, "summary": previous_summary}
+    m = parse_json_payload(getattr(response, "text", ""))
+    if not isinstance(m, dict):
+        # keep what we had rather than losing the earlier summary
+        return {"title": previous_title, "summary": previous_summary}
+    if cache is not None:
+        cache.put(cache_key, m)
+    return m
+
+def _first_json(candidates: List[Optional[str]]) -> Any:
+    for cand in candidates:
+        if cand is None:
+            continue
         try:
-            return json.loads(m.group(1))
+            return json.loads(cand)
         except Exception:
-            pass
-    # try first (non-greedy) {...}
-    m = re.search(r"\{[\s\S]*?\}", raw)
-    if m:
+            continue
+    return None
+
+def parse_json_payload(raw: str):
+    # fenced ```json, then any fence, then the first {...}
+    return _first_json(json_candidates(raw) + [first_brace_object(raw)])
+
+def _parse_json_payload(raw: str) -> Optional[Dict[str, Any]]:
+    # as parse_json_payload, plus a direct parse last
+    return _first_json(json_candidates(raw) + [first_brace_object(raw), raw])
+
+def _parse_json_array_payload(raw: str) -> Optional[List[Dict[str, Any]]]:
+    """Array-aware _parse_json_payload: returns a list of objects or None."""
+    # fenced ```json first, then any fence
+    candidates: List[str] = json_candidates(raw)
+    # outermost [...] (greedy, arrays contain nested objects)
+    start, end = raw.find("["), raw.rfind("]")
+    if start != -1 and end > start:
+        candidates.append(raw[start:end + 1])
+    # direct parse last
+    candidates.append(raw)
+
+    for cand in candidates:
         try:
-            return json.loads(m.group(0))
+            data = json.loads(cand)
         except Exception:
-            pass
-    # direct parse last
-    try:
-        return json.loads(raw)
-    except Exception:
-        return None
+            continue
+        if isinstance(data, list) and all(isinstance(d, dict) for d in data):
+            return data
+    return None
 
 def _extract_code_blocks(txt: str) -> Tuple[str, str]:
     """
     Returns (before_code, after_code) as STRINGS (possibly "")
     so that a non-Optional Pydantic model won't fail.
     """
-    # collect all fenced code blocks
-    blocks = re.findall(r"```[a-zA-Z0-9_+\-#.\s]*\n([\s\S]*?)```", txt, re.DOTALL)
-    blocks = [b.strip() for b in blocks if b.strip()]
-    all_code = "\n\n".join(blocks) if blocks else ""
-
-    before_code, after_code = "", ""
-
-    # explicit before/after markers near code fences
-    before_matches = re.findall(
-        r"(?:^|\b)(?:before|old|original|current)\s*[:\-]*\s*```[a-zA-Z0-9_+\-#.\s]*\n([\s\S]*?)```",
-        txt, flags=re.IGNORECASE
-    )
-    after_matches = re.findall(
-        r"(?:^|\b)(?:after|new|updated|changed|fixed)\s*[:\-]*\s*```[a-zA-Z0-9_+\-#.\s]*\n([\s\S]*?)```",
-        txt, flags=re.IGNORECASE
-    )
-    if before_matches:
-        before_code = before_matches[0].strip()
-    if after_matches:
-        after_code = after_matches[0].strip()
-
-    # heuristic: exactly two blocks + change-y words -> treat as before/after
-    if len(blocks) == 2 and not before_code and not after_code:
-        if any(k in txt.lower() for k in ["before", "after", "change", "update", "modify", "fix", "replace", "refactor"]):
-            before_code, after_code = blocks[0], blocks[1]
-
-    # search_replace old/new hints
-    if not before_code and not after_code:
-        old_match = re.search(r'old_string["\']?\s*[:=]\s*["\']?([\s\S]*?)["\']?(?:\s*,|\s*})', txt, re.IGNORECASE)
-        new_match = re.search(r'new_string["\']?\s*[:=]\s*["\']?([\s\S]*?)["\']?(?:\s*,|\s*})', txt, re.IGNORECASE)
-        if old_match:
-            before_code = (old_match.group(1) or "").strip()
-        if new_match:
-            after_code = (new_match.group(1) or "").strip()
-
-    # final safety: ensure strings
-    return before_code or "", after_code or ""
+    with METRICS.timer("stage_seconds", stage="extract_code"):
+        return extract_before_after(txt)
 
 # ----------------------------
 # Semantic tags & type (no keywords)
 # ----------------------------
-def _semantic_tags_and_type(content: str) -> Tuple[List[str], str, List[str], List[str]]:
+def _semantic_tags_and_type(
+    content: str,
+    semantic: Optional[Dict[str, Any]] = None,
+) -> Tuple[List[str], str, List[str], List[str]]:
     """
     Use local semantic extractors to infer tags and a fallback 'type'.
+    `semantic` may carry precomputed {concept: sentences} from batch_semantic_matches;
+    otherwise the message is embedded on its own.
     Returns (tags, fallback_type, feature_sentences, bugfix_sentences).
     """
-    data_for_helpers = {
-        "messages": [{"content": content}],
-        "tag": "other",
-        "description": content[:240],
-    }
     feature_sentences = []
     bugfix_sentences = []
-    try:
-        feature_sentences = extract_functions(data_for_helpers, concept="feature_development") or []
-    except Exception:
-        pass
-    try:
-        bugfix_sentences = extract_bug_fixes(data_for_helpers, concept="bug_fix") or []
-    except Exception:
-        pass
+    if semantic is not None:
+        feature_sentences = semantic.get("feature_development") or []
+        bugfix_sentences = semantic.get("bug_fix") or []
+    else:
+        data_for_helpers = {
+            "messages": [{"content": content}],
+            "tag": "other",
+            "description": content[:240],
+        }
+        try:
+            feature_sentences = extract_functions(data_for_helpers, concept="feature_development") or []
+        except Exception as e:
+            METRICS.inc("errors_total", stage="semantic", cause=type(e).__name__)
+        try:
+            bugfix_sentences = extract_bug_fixes(data_for_helpers, concept="bug_fix") or []
+        except Exception as e:
+            METRICS.inc("errors_total", stage="semantic", cause=type(e).__name__)
 
     tags: List[str] = []
     if feature_sentences:
@@ -231,14 +377,115 @@ def _semantic_tags_and_type(content: str) -> Tuple[List[str], str, List[str], Li
     return tags, fallback_type, feature_sentences, bugfix_sentences
 
 
+def _semantic_message_result(
+    message: Dict[str, Any],
+    semantic: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """Build the semantic-only analysis of one message (the base every LLM result merges into)."""
+    content = str(message.get("content", "") or "")
+    ts = str(message.get("timestamp", "") or "")
+
+    # semantic pass (primary)
+    sem_tags, sem_type, feature_sents, bugfix_sents = _semantic_tags_and_type(content, semantic)
+
+    # code extraction from the message text
+    before_code, after_code = _extract_code_blocks(content)
+
+    return {
+        "content": content,
+        "timestamp": ts,
+        "type": sem_type,               # semantic fallback; may be overridden by LLM below
+        "tags": sem_tags[:],            # semantic tags are primary
+        "before_code": before_code,
+        "after_code": after_code,
+        "ai_model": "N/A",
+        "enrichment": {
+            "conventional_type": get_type_from_tag(sem_tags[0] if sem_tags else "other"),
+            "feature_sentences": feature_sents,
+            "bugfix_sentences": bugfix_sents,
+            "keywords": sem_tags[:],  # keep semantic tags as "keywords"
+        },
+    }
+
+def _merge_llm_analysis(
+    result: Dict[str, Any],
+    parsed: Dict[str, Any],
+    model_name: str,
+    prefer_semantics: bool = True,
+) -> Dict[str, Any]:
+    """Merge one parsed LLM object {type, tags, before_code, after_code} into a semantic result."""
+    llm_type = normalize_llm_type(parsed.get("type", result["type"]))
+    llm_tags = parsed.get("tags", [])
+    if not isinstance(llm_tags, list):
+        llm_tags = []
+
+    # prefer semantic tags; optionally union with LLM tags (dedup, length-bounded)
+    if prefer_semantics:
+        merged_tags = list(dict.fromkeys((result["tags"] or []) + [str(t) for t in llm_tags if t]))
+    else:
+        merged_tags = list(dict.fromkeys([str(t) for t in llm_tags if t] + (result["tags"] or [])))
+    merged_tags = merged_tags[:6]  # cap
+
+    # fill codes if LLM produced something better
+    llm_before = parsed.get("before_code")
+    llm_after = parsed.get("after_code")
+
+    before_code_final = str((llm_before if llm_before is not None else result["before_code"]) or "")
+    after_code_final = str((llm_after if llm_after is not None else result["after_code"]) or "")
+
+    result.update({
+        "type": llm_type or result["type"],
+        "tags": merged_tags,
+        "before_code": before_code_final,
+        "after_code": after_code_final,
+        "ai_model": model_name,
+    })
+
+    # refresh enrichment formatting if code changed
+    result["enrichment"]["conventional_type"] = get_type_from_tag(
+        merged_tags[0] if merged_tags else "other"
+    )
+    result["enrichment"]["keywords"] = merged_tags[:]
+    return result
+
+def _route_locally(result: Dict[str, Any], semantic: Optional[Dict[str, Any]]) -> bool:
+    """Label `result` without the LLM when the router is confident; True if the call can be skipped."""
+    route = route_message(result["content"], semantic)
+    ROUTING_STATS.record(route)
+    if route.use_llm:
+        return False
+    result["type"] = route.type
+    result["ai_model"] = ROUTER_MODEL
+    METRICS.inc("llm_calls_skipped_total", reason=route.reason)
+    return True
+
+def _response_text(response: Any) -> str:
+    # read text robustly
+    text = getattr(response, "text", "") or ""
+    if not text and getattr(response, "candidates", None):
+        parts: List[str] = []
+        for cand in response.candidates or []:
+            cobj = getattr(cand, "content", None) or {}
+            plist = getattr(cobj, "parts", None) or cobj.get("parts", []) or []
+            for p in plist:
+                maybe = (p.get("text") if isinstance(p, dict) else getattr(p, "text", None))
+                if isinstance(maybe, str):
+                    parts.append(maybe)
+        text = "\n".join(parts).strip()
+    return text
+
 def analyze_individual_message_with_gemini(
     message: Dict[str, Any],
     *,
     use_llm: bool = True,
     prefer_semantics: bool = True,
+    semantic: Optional[Dict[str, Any]] = None,
+    route: bool = True,
 ) -> Dict[str, Any]:
     """
     Semantic-first message analyzer with optional Gemini assist.
+    Pass `semantic` (one entry of batch_semantic_matches) to skip per-message embedding;
+    its similarity scores also let the router label obvious messages without Gemini.
     Always returns:
     {
       "content": str,
@@ -256,31 +503,8 @@ def analyze_individual_message_with_gemini(
       }
     }
     """
-    content = str(message.get("content", "") or "")
-    ts = str(message.get("timestamp", "") or "")
-
-    # semantic pass (primary)
-    sem_tags, sem_type, feature_sents, bugfix_sents = _semantic_tags_and_type(content)
-
-    # code extraction from the message text
-    before_code, after_code = _extract_code_blocks(content)
-
-    # base result
-    result: Dict[str, Any] = {
-        "content": content,
-        "timestamp": ts,
-        "type": sem_type,               # semantic fallback; may be overridden by LLM below
-        "tags": sem_tags[:],            # semantic tags are primary
-        "before_code": before_code,
-        "after_code": after_code,
-        "ai_model": "N/A",
-        "enrichment": {
-            "conventional_type": get_type_from_tag(sem_tags[0] if sem_tags else "other"),
-            "feature_sentences": feature_sents,
-            "bugfix_sentences": bugfix_sents,
-            "keywords": sem_tags[:],  # keep semantic tags as "keywords"
-        },
-    }
+    result = _semantic_message_result(message, semantic)
+    content = result["content"]
 
     # optional LLM assist
     if not use_llm:
@@ -290,11 +514,11 @@ def analyze_individual_message_with_gemini(
     if not api_key:
         # no key -> keep purely semantic result
         return result
+    if route and _route_locally(result, semantic):
+        return result
 
     try:
-        genai.configure(api_key=api_key)
         model_name = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
-        model = genai.GenerativeModel(model_name)
 
         prompt = f"""
 You are a precise code analysis assistant. Analyze <MESSAGE_CONTENT> and return ONLY JSON with keys:
@@ -308,24 +532,15 @@ You are a precise code analysis assistant. Analyze <MESSAGE_CONTENT> and return
 </MESSAGE_CONTENT>
 """.strip()
 
-        response = model.generate_content(
-            prompt,
-            generation_config={"temperature": 0.1, "max_output_tokens": 500},
-        )
+        cache = get_llm_cache()
+        cache_key = LLMCache.make_key(model_name, CLASSIFY_PROMPT_VERSION, CLASSIFY_GENERATION_CONFIG, content)
+        cached = cache.get(cache_key) if cache is not None else None
+        if cached is not None:
+            return _merge_llm_analysis(result, cached, model_name, prefer_semantics)
 
-        # read text robustly
-        text = getattr(response, "text", "") or ""
-        if not text and getattr(response, "candidates", None):
-            parts: List[str] = []
-            for cand in response.candidates or []:
-                cobj = getattr(cand, "content", None) or {}
-                plist = getattr(cobj, "parts", None) or cobj.get("parts", []) or []
-                for p in plist:
-                    maybe = (p.get("text") if isinstance(p, dict) else getattr(p, "text", None))
-                    if isinstance(maybe, str):
-                        parts.append(maybe)
-            text = "\n".join(parts).strip()
+        response = _generate(model_name, prompt, CLASSIFY_GENERATION_CONFIG, "classify")
 
+        text = _response_text(response)
         if not text:
             # LLM gave nothing; keep semantic result
             return result
@@ -333,79 +548,378 @@ You are a precise code analysis assistant. Analyze <MESSAGE_CONTENT> and return
         parsed = _parse_json_payload(text)
         if not parsed:
             # unparseable; keep semantic result but mark type for visibility
+            METRICS.inc("errors_total", stage="classify", cause="unparseable_response")
             result["type"] = "parsing-failed"
             return result
 
-        # merge LLM outputs
-        llm_type = normalize_llm_type(parsed.get("type", result["type"]))
-        llm_tags = parsed.get("tags", [])
-        if not isinstance(llm_tags, list):
-            llm_tags = []
+        if cache is not None:
+            cache.put(cache_key, parsed)
+        return _merge_llm_analysis(result, parsed, model_name, prefer_semantics)
 
-        # prefer semantic tags; optionally union with LLM tags (dedup, length-bounded)
-        if prefer_semantics:
-            merged_tags = list(dict.fromkeys((result["tags"] or []) + [str(t) for t in llm_tags if t]))
-        else:
-            merged_tags = list(dict.fromkeys([str(t) for t in llm_tags if t] + (result["tags"] or [])))
-        merged_tags = merged_tags[:6]  # cap
-
-        # fill codes if LLM produced something better
-        llm_before = parsed.get("before_code")
-        llm_after = parsed.get("after_code")
-
-        before_code_final = str((llm_before if llm_before is not None else result["before_code"]) or "")
-        after_code_final = str((llm_after if llm_after is not None else result["after_code"]) or "")
-
-        result.update({
-            "type": llm_type or result["type"],
-            "tags": merged_tags,
-            "before_code": before_code_final,
-            "after_code": after_code_final,
-            "ai_model": model_name,
-        })
-
-        # refresh enrichment formatting if code changed
-        result["enrichment"]["conventional_type"] = get_type_from_tag(
-            merged_tags[0] if merged_tags else "other"
-        )
-        result["enrichment"]["keywords"] = merged_tags[:]
+    except LLMUnavailable:
+        # rate limited / unhealthy beyond retries: the semantic result stands (ai_model stays "N/A")
         return result
-
     except Exception as e:
         # keep semantic result, mark type for visibility
+        METRICS.inc("errors_total", stage="classify", cause=type(e).__name__)
         result["type"] = "error"
         return result
 
-@mcp.tool()
-async def save_chat_history(
+# ----------------------------
+# Batched classification (several messages per prompt)
+# ----------------------------
+def _estimate_tokens(text: str) -> int:
+    # ~4 characters per token is close enough for budgeting prompts
+    return len(text) // 4 + 1
+
+def plan_classification_batches(
+    messages: List[Dict[str, Any]],
+    token_budget: Optional[int] = None,
+    max_batch_size: Optional[int] = None,
+) -> List[List[int]]:
+    """
+    Group message indices into consecutive batches whose combined content stays
+    under `token_budget` (GEMINI_BATCH_TOKEN_BUDGET). A message larger than the
+    budget gets a batch of its own.
+    """
+    budget = token_budget or int(os.getenv("GEMINI_BATCH_TOKEN_BUDGET", "6000"))
+    size_cap = max_batch_size or int(os.getenv("GEMINI_BATCH_MAX_MESSAGES", "20"))
+
+    batches: List[List[int]] = []
+    current: List[int] = []
+    used = 0
+    for idx, m in enumerate(messages):
+        cost = _estimate_tokens(str(m.get("content", "") or ""))
+        if current and (used + cost > budget or len(current) >= size_cap):
+            batches.append(current)
+            current, used = [], 0
+        current.append(idx)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+def _classify_chunk(model_name: str, contents: List[str]) -> Optional[List[Dict[str, Any]]]:
+    """One batched classification request; returns the parsed JSON array (or None)."""
+    blocks = "\n".join(
+        f'<MESSAGE index="{n}">\n{content}\n</MESSAGE>' for n, content in enumerate(contents)
+    )
+    prompt = f"""
+You are a precise code analysis assistant. Analyze each <MESSAGE> below independently and return ONLY a JSON array
+with exactly {len(contents)} objects, in the same order as the messages. Each object has keys:
+- "index": the message index
+- "type": one of "code-change", "question", "clarification", "discussion"
+- "tags": list of 0-3 short technical keywords
+- "before_code": raw code for pre-change state if present
+- "after_code": raw code for post-change state if present
+
+{blocks}
+""".strip()
+
+    response = _generate(
+        model_name,
+        prompt,
+        {
+            "temperature": CLASSIFY_BATCH_GENERATION_CONFIG["temperature"],
+            "max_output_tokens": CLASSIFY_BATCH_GENERATION_CONFIG["max_output_tokens_per_message"] * len(contents),
+        },
+        "classify_batch",
+    )
+    return _parse_json_array_payload(_response_text(response))
+
+def analyze_messages_batch_with_gemini(
+    messages: List[Dict[str, Any]],
+    *,
+    prefer_semantics: bool = True,
+    semantics: Optional[List[Optional[Dict[str, Any]]]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Classify several messages with a single Gemini prompt (more than
+    GEMINI_MAX_OUTPUT_TOKENS can answer at once are split into several). The model returns a JSON array with one {type, tags, before_code, after_code}
+    object per message, merged with the same semantic-first rules as
+    analyze_individual_message_with_gemini. Messages already in the LLM cache are
+    not sent; a malformed or short array falls back to one call per message.
+    """
+    if semantics is None:
+        semantics = [None] * len(messages)
+
+    api_key = os.getenv("GEMINI_API_KEY", "").strip()
+    if not api_key:
+        return [_semantic_message_result(m, s) for m, s in zip(messages, semantics)]
+
+    model_name = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+    results = [_semantic_message_result(m, s) for m, s in zip(messages, semantics)]
+
+    # serve what we can from the router and the cache; only the rest go to the model.
+    # batched verdicts come from a different prompt, so they are cached under their own version
+    cache = get_llm_cache()
+    keys = [
+        LLMCache.make_key(model_name, CLASSIFY_BATCH_PROMPT_VERSION, CLASSIFY_BATCH_GENERATION_CONFIG, r["content"])
+        for r in results
+    ]
+    pending: List[int] = []
+    for i, r in enumerate(results):
+        if _route_locally(r, semantics[i]):
+            continue
+        cached = cache.get(keys[i]) if cache is not None else None
+        if cached is not None:
+            _merge_llm_analysis(r, cached, model_name, prefer_semantics)
+        else:
+            pending.append(i)
+
+    def per_message(indices: List[int]) -> List[Dict[str, Any]]:
+        for i in indices:
+            results[i] = analyze_individual_message_with_gemini(
+                messages[i], prefer_semantics=prefer_semantics, semantic=semantics[i], route=False
+            )
+        return results
+
+    if len(pending) <= 1:
+        return per_message(pending)
+
+    # keep every request under the model's output limit; larger groups go in chunks
+    output_limit = int(os.getenv("GEMINI_MAX_OUTPUT_TOKENS", "8192"))
+    chunk_size = max(1, output_limit // CLASSIFY_BATCH_GENERATION_CONFIG["max_output_tokens_per_message"])
+    for start in range(0, len(pending), chunk_size):
+        chunk = pending[start:start + chunk_size]
+        if len(chunk) == 1:
+            per_message(chunk)
+            continue
+        try:
+            parsed = _classify_chunk(model_name, [results[i]["content"] for i in chunk])
+        except LLMUnavailable:
+            # retrying message by message would only add load; keep the semantic results
+            return results
+        except Exception as e:
+            METRICS.inc("errors_total", stage="classify_batch", cause=type(e).__name__)
+            parsed = None
+
+        if not parsed or len(parsed) != len(chunk):
+            METRICS.inc("llm_batch_fallbacks_total")
+            per_message(chunk)
+            continue
+
+        # honour explicit indices when the model reorders entries
+        by_index: Dict[int, Dict[str, Any]] = {}
+        for pos, item in enumerate(parsed):
+            idx = item.get("index", pos)
+            by_index[idx if isinstance(idx, int) else pos] = item
+        if sorted(by_index) != list(range(len(chunk))):
+            per_message(chunk)
+            continue
+
+        for n, i in enumerate(chunk):
+            if cache is not None:
+                cache.put(keys[i], by_index[n])
+            _merge_llm_analysis(results[i], by_index[n], model_name, prefer_semantics)
+    return results
+
+async def _run_bounded(semaphore: asyncio.Semaphore, fn, *args, **kwargs):
+    """Run a blocking Gemini call in a worker thread, at most `semaphore` at a time."""
+    async with semaphore:
+        return await asyncio.to_thread(fn, *args, **kwargs)
+
+async def _timed_stage(stage: str, awaitable: Any) -> Any:
+    with METRICS.timer("stage_seconds", stage=stage):
+        return await awaitable
+
+async def _analyze_messages(
+    messages: List[Dict[str, Any]],
+    semaphore: asyncio.Semaphore,
+    batch_classification: bool = True,
+) -> Tuple[List[Dict[str, Any]], List[Any]]:
+    """
+    Embed + classify `messages`, concurrently and in message order.
+    Returns (analyzed messages, per-message embedding or None).
+    """
+    # embed every sentence of every message in one batch, off the event loop:
+    # sharded over the enrichment process pool when ENRICH_WORKERS > 0
+    contents = [str(m.get("content", "") or "") for m in messages]
+    try:
+        with METRICS.timer("stage_seconds", stage="embed"):
+            pool = get_enrichment_pool()
+            if pool is not None:
+                semantics, vectors = await pool.semantic_batch(contents)
+            else:
+                semantics, vectors = await asyncio.to_thread(
+                    batch_semantic_matches, contents, return_embeddings=True
+                )
+    except Exception:
+        semantics, vectors = [None] * len(messages), [None] * len(messages)
+
+    METRICS.inc("messages_classified_total", len(messages))
+    with METRICS.timer("stage_seconds", stage="classify"):
+        if batch_classification:
+            # several messages per prompt, packed up to GEMINI_BATCH_TOKEN_BUDGET
+            batches = plan_classification_batches(messages)
+            chunks = await asyncio.gather(*(
+                _run_bounded(
+                    semaphore,
+                    analyze_messages_batch_with_gemini,
+                    [messages[i] for i in batch],
+                    semantics=[semantics[i] for i in batch],
+                )
+                for batch in batches
+            ))
+            return [a for chunk in chunks for a in chunk], vectors
+
+        analyzed = await asyncio.gather(*(
+            _run_bounded(semaphore, analyze_individual_message_with_gemini, raw, semantic=semantic)
+            for raw, semantic in zip(messages, semantics)
+        ))
+        return list(analyzed), vectors
+
+async def _keyword_stage(
+    contents: List[str],
+    message_vectors: Optional[List[Any]] = None,
+) -> Optional[Tuple[List[List[str]], List[Tuple[str, float]]]]:
+    """
+    Batched KeyBERT pass over a conversation (see process.batch_keywords).
+    Returns (keywords per message, [(conversation keyword, score)]), or None when
+    keyword extraction is unavailable (counted under errors_total).
+    """
+    try:
+        with METRICS.timer("stage_seconds", stage="keywords"):
+            per_message, conversation = await asyncio.to_thread(batch_keywords, contents, message_vectors)
+    except Exception:
+        return None
+    return [[k for k, _ in kws] for kws in per_message], conversation
+
+def _set_message_keywords(messages: List[ChatMessage], keywords: List[List[str]]) -> None:
+    for m, kws in zip(messages, keywords):
+        m.enrichment = {**m.enrichment, "keywords": kws}
+
+def _index_conversation_vectors(
+    conversation_id: str,
+    log_name: str,
+    summary: str,
+    message_vectors: List[Any],
+    first_position: int = 0,
+) -> None:
+    """
+    Store the summary embedding and per-message embeddings for semantic search.
+    On append the new summary row supersedes the log's earlier one in the index.
+    """
+    vectors: List[Any] = []
+    metadata: List[Dict[str, Any]] = []
+    base = {"conversation_id": conversation_id, "log_name": log_name}
+    if summary:
+        vectors.append(get_semantic_model().encode([summary])[0])
+        metadata.append({**base, "kind": "summary", "position": -1})
+    for offset, vec in enumerate(message_vectors):
+        if vec is not None:
+            vectors.append(vec)
+            metadata.append({**base, "kind": "message", "position": first_position + offset})
+    if vectors:
+        from vector_index import get_vector_index
+        get_vector_index().add(np.vstack(vectors), metadata)
+
+def _to_chat_message(analyzed: Dict[str, Any]) -> ChatMessage:
+    return ChatMessage(
+        content=analyzed.get("content", ""),
+        timestamp=analyzed.get("timestamp", ""),
+        type=analyzed.get("type", "unknown"),
+        tags=analyzed.get("tags", []) or [],
+        ai_model=analyzed.get("ai_model", "N/A"),
+        before_code=analyzed.get("before_code"),
+        after_code=analyzed.get("after_code"),
+    )
+
+def find_existing_log(conversation_id: str) -> Optional[str]:
+    """Newest chat_logs file for `conversation_id` (file names sort by timestamp)."""
+    pattern = os.path.join(_THIS_DIR, "chat_logs", f"conversation_{glob.escape(conversation_id)}_*.json")
+    # the glob also matches ids that merely start with this one (abc -> abc_def)
+    exact = re.compile(rf"conversation_{re.escape(conversation_id)}_\d{{8}}_\d{{6}}\.json")
+    matches = sorted(p for p in glob.glob(pattern) if exact.fullmatch(os.path.basename(p)))
+    return matches[-1] if matches else None
+
+def _write_log_atomic(path: str, payload: Dict[str, Any]) -> None:
+    # write next to the target and rename, so readers never see a half-written log
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", suffix=".json", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(payload, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _message_key(m: Dict[str, Any]) -> Tuple[str, str]:
+    return str(m.get("content", "") or ""), str(m.get("timestamp", "") or "")
+
+async def process_chat_history(
     messages: List[Dict[str, Any]],
     conversation_id: Optional[str] = None,
     project_name: str = "MCP_Chat_Logger",
     use_ai_analysis: bool = True,
+    max_concurrency: Optional[int] = None,
+    batch_classification: bool = True,
+    append: bool = False,
 ) -> str:
+    """
+    Summarize, classify and save a conversation to chat_logs (the full pipeline;
+    save_chat_history runs this through the job queue unless wait=True).
+    With append=True and an existing log for `conversation_id`, only messages not
+    already in that log are analyzed, the summary is updated from the previous
+    summary plus the new messages, and the log is rewritten in place.
+    """
     ensure_logs_directory()
     require_gemini()  # hard fail fast
 
     if not conversation_id:
         conversation_id = str(uuid.uuid4())
 
-    # summarize conversation
-    ai_analysis = summarize_conversation_with_gemini(messages)
+    # summary + per-message classification run concurrently, capped by a semaphore
+    limit = max_concurrency or int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    existing_path = find_existing_log(conversation_id) if append else None
+    if existing_path:
+        with open(existing_path, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+        seen = {_message_key(m) for m in previous.get("messages") or []}
+        new_messages = [m for m in messages if _message_key(m) not in seen]
+        if not new_messages:
+            return f"Conversation already up to date: {existing_path}"
+
+        ai_analysis, (analyzed_messages, message_vectors) = await asyncio.gather(
+            _timed_stage("summary", _run_bounded(
+                semaphore,
+                summarize_conversation_delta_with_gemini,
+                previous.get("title") or "",
+                previous.get("summary") or "",
+                new_messages,
+            )),
+            _analyze_messages(new_messages, semaphore, batch_classification),
+        )
+        classified = [ChatMessage(**m) for m in previous.get("messages") or []]
+        first_new_position = len(classified)
+        classified.extend(_to_chat_message(a) for a in analyzed_messages)
+        project_name = previous.get("project_name") or project_name
+        out_path = existing_path
+    else:
+        ai_analysis, (analyzed_messages, message_vectors) = await asyncio.gather(
+            _timed_stage("summary", _run_bounded(semaphore, summarize_conversation_with_gemini, messages)),
+            _analyze_messages(messages, semaphore, batch_classification),
+        )
+        classified = [_to_chat_message(a) for a in analyzed_messages]
+        first_new_position = 0
+        out_path = os.path.join(_THIS_DIR, "chat_logs", f"conversation_{conversation_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+
     title = ai_analysis.get("title")
     summary = ai_analysis.get("summary")
 
-    classified: List[ChatMessage] = []
-    for raw in messages:
-        analyzed = analyze_individual_message_with_gemini(raw)
-        classified.append(ChatMessage(
-            content=analyzed.get("content", ""),
-            timestamp=analyzed.get("timestamp", ""),
-            type=analyzed.get("type", "unknown"),
-            tags=analyzed.get("tags", []) or [],
-            ai_model=analyzed.get("ai_model", "N/A"),
-            before_code=analyzed.get("before_code"),
-            after_code=analyzed.get("after_code"),
-        ))
+    # appended logs are re-keyworded as a whole; the earlier messages' sentence
+    # embeddings come from the embedding cache rather than the model
+    enrichment = dict(previous.get("enrichment") or {}) if existing_path else {}
+    keywords = await _keyword_stage(
+        [m.content for m in classified],
+        None if existing_path else message_vectors,
+    )
+    if keywords is not None:
+        _set_message_keywords(classified, keywords[0])
+        enrichment["keywords"] = [k for k, _ in keywords[1]]
 
     convo = ConversationSummary(
         id=conversation_id,
@@ -414,17 +928,340 @@ async def save_chat_history(
         summary=summary,
         messages=classified,
         message_count=len(classified),
+        enrichment=enrichment,
     )
 
     # Save (include both 'id' and 'conversation_id' for frontend compatibility)
     payload = convo.model_dump()
     payload["conversation_id"] = payload["id"]
-    out_path = os.path.join(_THIS_DIR, "chat_logs", f"conversation_{conversation_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
-    with open(out_path, "w", encoding="utf-8") as f:
-        json.dump(payload, f, indent=2, ensure_ascii=False)
+    with METRICS.timer("stage_seconds", stage="write_log"):
+        _write_log_atomic(out_path, payload)
+    log_name = os.path.splitext(os.path.basename(out_path))[0]
+    await _timed_stage("store_upsert", asyncio.to_thread(get_log_store().upsert_conversation, payload, log_name))
+    try:
+        await _timed_stage("vector_index", asyncio.to_thread(
+            _index_conversation_vectors,
+            conversation_id,
+            log_name,
+            summary or "",
+            message_vectors,
+            first_new_position,
+        ))
+    except Exception:
+        pass  # semantic search is best-effort (counted under errors_total); the log itself is saved
+
+    METRICS.inc("conversations_saved_total")
+    METRICS.flush()
+    routed = sum(1 for a in analyzed_messages if a.get("ai_model") == ROUTER_MODEL)
+    return (
+        f"Conversation saved and fully processed to: {out_path} "
+        f"({routed}/{len(analyzed_messages)} message(s) classified without an LLM call)"
+    )
+
+# ----------------------------
+# Streaming ingestion (bounded memory)
+# ----------------------------
+def _read_jsonl_chunks(stream: IO[str], chunk_size: int) -> Iterator[List[Dict[str, Any]]]:
+    """Yield lists of up to `chunk_size` message dicts from a JSONL stream (blank/invalid lines skipped)."""
+    chunk: List[Dict[str, Any]] = []
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            msg = json.loads(line)
+        except Exception:
+            continue
+        if isinstance(msg, dict):
+            chunk.append(msg)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def reduce_summaries_with_gemini(partials: List[Dict[str, str]]) -> Dict[str, str]:
+    """Reduce step of the map-reduce summary: merge per-chunk {title, summary} into one."""
+    partials = [p for p in partials if p.get("summary")]
+    if len(partials) <= 1:
+        return partials[0] if partials else {"title": "Empty Conversation", "summary": "No content to summarize."}
+    # the partial summaries are short, so the existing summarizer can merge them
+    return summarize_conversation_with_gemini(
+        [{"content": f"Part {i + 1}: {p.get('title', '')}. {p.get('summary', '')}"} for i, p in enumerate(partials)]
+    )
+
+def _write_log_streaming(path: str, header: Dict[str, Any], messages_path: str) -> None:
+    """Write the final JSON log by copying messages line by line from a JSONL spool file."""
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", suffix=".json", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as out, open(messages_path, "r", encoding="utf-8") as src:
+            head = json.dumps({k: v for k, v in header.items() if k != "messages"}, indent=2, ensure_ascii=False)
+            out.write(head[:-2] + ',\n  "messages": [')
+            for i, line in enumerate(src):
+                out.write(("," if i else "") + "\n    " + line.rstrip("\n"))
+            out.write("\n  ]\n}")
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _iter_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
+
+async def ingest_chat_history_stream(
+    stream: IO[str],
+    conversation_id: Optional[str] = None,
+    project_name: str = "MCP_Chat_Logger",
+    chunk_size: int = 200,
+    max_concurrency: Optional[int] = None,
+    batch_classification: bool = True,
+) -> str:
+    """
+    Ingest a conversation from a JSONL stream (one message object per line)
+    with memory bounded by `chunk_size`: each chunk is classified, embedded and
+    spooled to disk as it arrives, and gets its own summary; partial summaries
+    are folded together (map-reduce) every SUMMARY_REDUCE_FANIN chunks.
+    """
+    ensure_logs_directory()
+    require_gemini()  # hard fail fast
 
-    return f"Conversation saved and fully processed to: {out_path}"
+    if not conversation_id:
+        conversation_id = str(uuid.uuid4())
+    limit = max_concurrency or int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+    semaphore = asyncio.Semaphore(max(1, limit))
+    fan_in = max(2, int(os.getenv("SUMMARY_REDUCE_FANIN", "16")))
+
+    logs_dir = os.path.join(_THIS_DIR, "chat_logs")
+    log_name = f"conversation_{conversation_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    out_path = os.path.join(logs_dir, f"{log_name}.json")
+    spool_fd, spool_path = tempfile.mkstemp(prefix=".spool_", suffix=".jsonl", dir=logs_dir)
+
+    partials: List[Dict[str, str]] = []
+    keyword_scores: Dict[str, float] = {}  # conversation keywords of every chunk, best score kept
+    count = routed = 0
+    try:
+        with os.fdopen(spool_fd, "w", encoding="utf-8") as spool:
+            for chunk in _read_jsonl_chunks(stream, max(1, chunk_size)):
+                chunk_summary, (analyzed, vectors) = await asyncio.gather(
+                    _run_bounded(semaphore, summarize_conversation_with_gemini, chunk),
+                    _analyze_messages(chunk, semaphore, batch_classification),
+                )
+                routed += sum(1 for a in analyzed if a.get("ai_model") == ROUTER_MODEL)
+                chunk_messages = [_to_chat_message(a) for a in analyzed]
+                keywords = await _keyword_stage([m.content for m in chunk_messages], vectors)
+                if keywords is not None:
+                    _set_message_keywords(chunk_messages, keywords[0])
+                    for k, score in keywords[1]:
+                        keyword_scores[k] = max(score, keyword_scores.get(k, score))
+                for m in chunk_messages:
+                    spool.write(json.dumps(m.model_dump(), ensure_ascii=False) + "\n")
+                spool.flush()
+                try:
+                    await _timed_stage("vector_index", asyncio.to_thread(
+                        _index_conversation_vectors, conversation_id, log_name, "", vectors, count
+                    ))
+                except Exception:
+                    pass  # semantic search is best-effort
+                count += len(chunk)
+
+                partials.append(chunk_summary)
+                if len(partials) >= fan_in:
+                    partials = [await _run_bounded(semaphore, reduce_summaries_with_gemini, partials)]
+
+        final = await _run_bounded(semaphore, reduce_summaries_with_gemini, partials)
+        header = {
+            "id": conversation_id,
+            "project_name": project_name,
+            "title": final.get("title"),
+            "summary": final.get("summary"),
+            "message_count": count,
+            "enrichment": {
+                "keywords": sorted(keyword_scores, key=keyword_scores.get, reverse=True)[:10],
+            } if keyword_scores else {},
+            "conversation_id": conversation_id,
+        }
+        _write_log_streaming(out_path, header, spool_path)
+        await asyncio.to_thread(
+            get_log_store().upsert_conversation, header, log_name, None, _iter_jsonl(spool_path)
+        )
+        try:
+            await _timed_stage("vector_index", asyncio.to_thread(
+                _index_conversation_vectors, conversation_id, log_name, header["summary"] or "", [], count
+            ))
+        except Exception:
+            pass
+    finally:
+        if os.path.exists(spool_path):
+            os.remove(spool_path)
+        METRICS.flush()
+
+    return (
+        f"Streamed {count} message(s) and saved to: {out_path} "
+        f"({routed} classified without an LLM call)"
+    )
+
+@mcp.tool()
+async def ingest_chat_history_file(
+    path: str,
+    conversation_id: Optional[str] = None,
+    project_name: str = "MCP_Chat_Logger",
+    chunk_size: int = 200,
+) -> str:
+    """Stream a (possibly huge) conversation from a JSONL file, one message object per line, with flat memory use."""
+    with open(path, "r", encoding="utf-8") as f:
+        return await ingest_chat_history_stream(f, conversation_id, project_name, chunk_size)
+
+async def _run_job(job: Dict[str, Any]) -> Any:
+    if job["kind"] == "save_chat_history":
+        return await process_chat_history(**job["payload"])
+    raise ValueError(f"Unknown job kind: {job['kind']}")
+
+_worker_task: Optional[asyncio.Task] = None
+
+def _ensure_background_worker() -> None:
+    """Run a queue worker inside the MCP server's event loop (disable with CHAT_LOGGER_INPROCESS_WORKER=0)."""
+    global _worker_task
+    if os.getenv("CHAT_LOGGER_INPROCESS_WORKER", "1").strip() in ("0", "false", "no"):
+        return
+    if _worker_task is None or _worker_task.done():
+        _worker_task = asyncio.get_running_loop().create_task(run_worker(get_job_queue(), _run_job))
+
+@mcp.tool()
+async def save_chat_history(
+    messages: List[Dict[str, Any]],
+    conversation_id: Optional[str] = None,
+    project_name: str = "MCP_Chat_Logger",
+    use_ai_analysis: bool = True,
+    max_concurrency: Optional[int] = None,
+    batch_classification: bool = True,
+    append: bool = False,
+    wait: bool = False,
+) -> str:
+    """
+    Save a conversation to chat_logs. By default the raw messages are durably
+    queued and a job id is returned immediately; summarizing, classification
+    and embedding run in a worker (check progress with get_job_status).
+    Pass wait=True to run the pipeline inline and return the saved path.
+    """
+    if wait:
+        return await process_chat_history(
+            messages, conversation_id, project_name, use_ai_analysis,
+            max_concurrency, batch_classification, append,
+        )
+
+    require_gemini()  # hard fail fast, before anything is queued
+    if not conversation_id:
+        conversation_id = str(uuid.uuid4())
+    job_id = await asyncio.to_thread(
+        get_job_queue().enqueue,
+        "save_chat_history",
+        {
+            "messages": messages,
+            "conversation_id": conversation_id,
+            "project_name": project_name,
+            "use_ai_analysis": use_ai_analysis,
+            "max_concurrency": max_concurrency,
+            "batch_classification": batch_classification,
+            "append": append,
+        },
+    )
+    _ensure_background_worker()
+    return f"Conversation {conversation_id} queued for processing as job {job_id}"
+
+@mcp.tool()
+async def get_job_status(job_id: str) -> Dict[str, Any]:
+    """Status of a queued save: queued | running | done | failed, with attempts, result or last error."""
+    status = await asyncio.to_thread(get_job_queue().status, job_id)
+    if status is None:
+        return {"id": job_id, "status": "unknown"}
+    return status
+
+@mcp.tool()
+async def semantic_search_conversations(query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+    """Find past conversations semantically similar to `query` (e.g. "how did we fix this before")."""
+    from vector_index import search_conversations
+    return await asyncio.to_thread(search_conversations, query, top_k, get_log_store())
+
+@mcp.tool()
+async def get_llm_cache_stats() -> Dict[str, Any]:
+    """Hit/miss counters and size of the on-disk LLM response cache."""
+    cache = get_llm_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+@mcp.tool()
+async def get_metrics() -> Dict[str, Any]:
+    """Per-stage latency histograms, LLM call/token counters, cache lookups and errors by cause (this process)."""
+    return METRICS.snapshot()
+
+@mcp.tool()
+async def get_routing_stats() -> Dict[str, Any]:
+    """How many messages the pre-classifier labelled locally instead of calling Gemini, by reason."""
+    return ROUTING_STATS.snapshot()
+
+@mcp.tool()
+async def get_llm_client_status() -> Dict[str, Any]:
+    """Gemini client health: circuit breaker state and how full the request/token buckets are."""
+    if not os.getenv("GEMINI_API_KEY", "").strip():
+        return {"configured": False}
+    return get_gemini_client().snapshot()
+
+@mcp.tool()
+async def get_embedding_cache_stats() -> Dict[str, Any]:
+    """Sentence-embedding cache hit ratio (memory / disk), entry counts against their caps, and bytes used."""
+    return _embedding_cache_stats()
+
+# ---- Startup timings & warm-up ----
+STARTUP_TIMINGS: Dict[str, Any] = {"import_seconds": time.perf_counter() - _IMPORT_START}
+
+def _warm_up(delay: float) -> None:
+    """Load the embedding model and Gemini SDK in the background, after the handshake."""
+    time.sleep(delay)
+    start = time.perf_counter()
+    try:
+        get_concept_embeddings()  # loads the SentenceTransformer
+        genai.configure  # noqa: B018 - touching the proxy imports the SDK
+        STARTUP_TIMINGS["warmup_seconds"] = time.perf_counter() - start
+    except Exception as e:
+        STARTUP_TIMINGS["warmup_error"] = f"{type(e).__name__}: {e}"
+
+def start_warm_up() -> None:
+    """Opt out with CHAT_LOGGER_WARMUP=0; CHAT_LOGGER_WARMUP_DELAY sets the head start for the handshake."""
+    if os.getenv("CHAT_LOGGER_WARMUP", "1").strip() in ("0", "false", "no"):
+        return
+    delay = float(os.getenv("CHAT_LOGGER_WARMUP_DELAY", "0.5"))
+    threading.Thread(target=_warm_up, args=(delay,), name="chat-logger-warmup", daemon=True).start()
+
+@mcp.tool()
+async def get_startup_timings() -> Dict[str, Any]:
+    """Module import time, time until the server was ready, warm-up duration and per-dependency import times."""
+    return {**STARTUP_TIMINGS, "imports": dict(IMPORT_TIMINGS)}
 
 # ---- Entry ----
 if __name__ == "__main__":
-    mcp.run(transport="stdio")
+    if len(sys.argv) > 1 and sys.argv[1] == "worker":
+        # dedicated worker process: python chat_logger.py worker
+        asyncio.run(run_worker(get_job_queue(), _run_job))
+    elif len(sys.argv) > 1 and sys.argv[1] == "ingest":
+        # streaming ingestion: python chat_logger.py ingest <messages.jsonl | -> [project_name] [conversation_id]
+        source = sys.argv[2] if len(sys.argv) > 2 else "-"
+        project = sys.argv[3] if len(sys.argv) > 3 else "MCP_Chat_Logger"
+        convo_id = sys.argv[4] if len(sys.argv) > 4 else None
+        if source == "-":
+            print(asyncio.run(ingest_chat_history_stream(sys.stdin, convo_id, project)))
+        else:
+            with open(source, "r", encoding="utf-8") as f:
+                print(asyncio.run(ingest_chat_history_stream(f, convo_id, project)))
+    else:
+        STARTUP_TIMINGS["ready_seconds"] = time.perf_counter() - _IMPORT_START
+        print(
+            f"chat_logger ready in {STARTUP_TIMINGS['ready_seconds']:.3f}s "
+            f"(imports {STARTUP_TIMINGS['import_seconds']:.3f}s)",
+            file=sys.stderr,
+        )
+        start_warm_up()
+        mcp.run(transport="stdio")
@@ -0,0 +1,170 @@
+"""
+Single-pass tokenizer for Markdown code fences.
+
+Replaces the stack of `[\\s\\S]*?` regexes that used to rescan every message
+(all fences, "before" fences, "after" fences, JSON fences) and could backtrack
+badly on large pasted files. Each fence is found with str.find, so a message is
+scanned once, and every regex below only ever looks at a bounded slice.
+
+    python code_fences.py bench [--max-mb N]
+"""
+from typing import List, NamedTuple, Optional, Tuple
+import re
+import sys
+import time
+import argparse
+
+FENCE = "```"
+# info string after the opening fence: language plus optional attributes, up to the newline
+_INFO = re.compile(r"[A-Za-z0-9_+\-#. \t]*\r?\n")
+# last word before a fence, separated from it only by whitespace / ':' / '-'
+_LABEL = re.compile(r"\b([A-Za-z]+)[ \t]*[:\-]*\s*\Z")
+_LABEL_WINDOW = 80
+_CHANGE_HINT = re.compile(r"before|after|change|update|modify|fix|replace|refactor", re.IGNORECASE)
+# search_replace style tool calls: old_string="..." / "new_string": "..."
+_OLD_STRING = re.compile(r"""old_string["']?\s*[:=]\s*["']?([^,}]*?)["']?\s*[,}]""", re.IGNORECASE)
+_NEW_STRING = re.compile(r"""new_string["']?\s*[:=]\s*["']?([^,}]*?)["']?\s*[,}]""", re.IGNORECASE)
+
+BEFORE_LABELS = {"before", "old", "original", "current"}
+AFTER_LABELS = {"after", "new", "updated", "changed", "fixed"}
+
+
+class CodeBlock(NamedTuple):
+    lang: str    # info string, e.g. "python" ("" when absent)
+    label: str   # lower-cased word right before the fence, e.g. "before" ("" when absent)
+    start: int   # offset of the opening fence
+    end: int     # offset just past the closing fence
+    code: str    # body between the fences, stripped
+
+
+def tokenize_fences(text: str) -> List[CodeBlock]:
+    """All fenced code blocks in `text`, in order, in one left-to-right scan."""
+    blocks: List[CodeBlock] = []
+    pos, prev_end = 0, 0
+    while True:
+        open_at = text.find(FENCE, pos)
+        if open_at < 0:
+            break
+        info = _INFO.match(text, open_at + 3)
+        if info is None:
+            # not an opening fence (e.g. inline ``` or a 4th backtick); try the next position
+            pos = open_at + 1
+            continue
+        body_start = info.end()
+        close_at = text.find(FENCE, body_start)
+        if close_at < 0:
+            break  # unterminated: nothing later can close either
+
+        window = text[max(prev_end, open_at - _LABEL_WINDOW):open_at]
+        label = _LABEL.search(window)
+        blocks.append(CodeBlock(
+            lang=info.group(0).strip(),
+            label=label.group(1).lower() if label else "",
+            start=open_at,
+            end=close_at + 3,
+            code=text[body_start:close_at].strip(),
+        ))
+        pos = prev_end = close_at + 3
+    return blocks
+
+
+def extract_before_after(text: str, blocks: Optional[List[CodeBlock]] = None) -> Tuple[str, str]:
+    """
+    (before_code, after_code) from labelled fences, a two-block change
+    description, or search_replace old_string/new_string arguments; "" if none.
+    """
+    if blocks is None:
+        blocks = tokenize_fences(text)
+    blocks = [b for b in blocks if b.code]
+
+    before = next((b.code for b in blocks if b.label in BEFORE_LABELS), "")
+    after = next((b.code for b in blocks if b.label in AFTER_LABELS), "")
+
+    # exactly two blocks + change-y words -> treat as before/after
+    if len(blocks) == 2 and not before and not after and _CHANGE_HINT.search(text):
+        before, after = blocks[0].code, blocks[1].code
+
+    if not before and not after:
+        old_match = _OLD_STRING.search(text)
+        new_match = _NEW_STRING.search(text)
+        before = old_match.group(1).strip() if old_match else ""
+        after = new_match.group(1).strip() if new_match else ""
+    return before, after
+
+
+def json_candidates(text: str) -> List[str]:
+    """Fenced bodies worth trying with json.loads: ```json blocks first, then any other fence."""
+    blocks = tokenize_fences(text)
+    return (
+        [b.code for b in blocks if b.lang.lower() == "json"]
+        + [b.code for b in blocks if b.lang.lower() != "json"]
+    )
+
+
+def first_brace_object(text: str) -> Optional[str]:
+    """Same span as a lazy `\\{[\\s\\S]*?\\}` match, without the retry at every '{'."""
+    start = text.find("{")
+    end = text.find("}", start + 1) if start >= 0 else -1
+    return text[start:end + 1] if end >= 0 else None
+
+
+# ----------------------------
+# Benchmark
+# ----------------------------
+def _tool_output_message(size: int) -> str:
+    """A pasted tool result: prose, labelled before/after fences and a long log dump."""
+    line = "    result = compute(value, options={'retry': 3})  # line of pasted output\n"
+    body = line * max(1, size // len(line))
+    return (
+        "Fixed the retry loop. Before:\n```python\n" + body[: size // 4] + "```\n"
+        "After:\n```python\n" + body[: size // 4] + "```\n"
+        "Full tool output follows\n```\n" + body[: size // 2] + "```\n"
+    )
+
+
+def _pathological_message(size: int) -> str:
+    """Lots of fence openers that never close, and backtick runs."""
+    return ("```python\nx = 1 ` `` \n" * max(1, size // 24))[:size]
+
+
+def benchmark(max_mb: float = 8.0, repeat: int = 3) -> List[Tuple[str, int, float]]:
+    """(case, size, ns/char) for doubling message sizes; flat ns/char means linear time."""
+    rows = []
+    size = 64 * 1024
+    while size <= max_mb * 1024 * 1024:
+        for case, make in (("tool_output", _tool_output_message), ("pathological", _pathological_message)):
+            text = make(size)
+            best = float("inf")
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                extract_before_after(text)
+                best = min(best, time.perf_counter() - t0)
+            rows.append((case, len(text), best * 1e9 / len(text)))
+        size *= 2
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Code fence tokenizer utilities")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench = sub.add_parser("bench", help="time extraction on growing messages")
+    bench.add_argument("--max-mb", type=float, default=8.0)
+    bench.add_argument("--max-growth", type=float, default=3.0,
+                       help="fail if ns/char at the largest size exceeds the smallest by this factor")
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        rows = benchmark(args.max_mb)
+        for case, size, ns in rows:
+            print(f"{case:<13} {size / 1024:>9.0f} KiB  {ns:8.2f} ns/char")
+        worst = 1.0
+        for case in {r[0] for r in rows}:
+            per_char = [ns for c, _, ns in rows if c == case]
+            worst = max(worst, per_char[-1] / per_char[0])
+        print(f"ns/char growth, smallest -> largest: {worst:.2f}x")
+        if worst > args.max_growth:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
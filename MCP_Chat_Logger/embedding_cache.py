@@ -0,0 +1,266 @@
+"""
+Two-level cache for sentence embeddings.
+
+Keys are sha1(model name + normalised sentence). Level one is an in-memory
+LRU capped by entry count; level two is a fixed-capacity float16 memmap on
+disk with a small SQLite index (key -> slot, last access) that recycles the
+least-recently-used slots once full. Each slot also records the key that owns
+it in a parallel digest file; a writer clears it before overwriting the vector
+and sets it afterwards, and a reader keeps a row only if the digest matched its
+key both before and after reading, so a slot recycled by another process is
+never returned for the old key. Only misses reach the model, in one encode
+call per batch.
+
+Configuration: EMBED_CACHE_DIR, EMBED_CACHE_MEMORY_ITEMS, EMBED_CACHE_DISK_ROWS,
+EMBED_CACHE_DISABLED=1.
+"""
+from typing import Any, Callable, Dict, List, Optional, Sequence
+from collections import OrderedDict
+from functools import lru_cache
+import os
+import re
+import time
+import hashlib
+import sqlite3
+import threading
+import unicodedata
+import numpy as np
+
+from metrics import METRICS
+
+_THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CACHE_DIR = os.path.join(_THIS_DIR, "cache", "embeddings")
+_SPACES = re.compile(r"\s+")
+KEY_BYTES = 20  # sha1 digest
+
+
+def normalize_sentence(sentence: str) -> str:
+    return _SPACES.sub(" ", unicodedata.normalize("NFC", sentence or "")).strip()
+
+
+def sentence_key(model_name: str, sentence: str) -> bytes:
+    return hashlib.sha1(f"{model_name}\0{normalize_sentence(sentence)}".encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    def __init__(
+        self,
+        directory: str = DEFAULT_CACHE_DIR,
+        memory_items: int = 20000,
+        disk_rows: int = 200000,
+    ):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.memory_items = memory_items
+        self.disk_rows = disk_rows
+        self.vectors_path = os.path.join(directory, "vectors.f16")
+        self.keys_path = os.path.join(directory, "keys.bin")
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._memory_bytes = 0
+        self._matrix: Optional[np.memmap] = None
+        self._keys: Optional[np.memmap] = None
+        self._conn = sqlite3.connect(os.path.join(directory, "index.sqlite3"), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS slots (
+                key BLOB PRIMARY KEY,
+                slot INTEGER NOT NULL UNIQUE,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_slots_access ON slots(last_access);
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL);
+            """
+        )
+        row = self._conn.execute("SELECT value FROM meta WHERE name = 'disk_rows'").fetchone()
+        if row is None or int(row[0]) != disk_rows or not os.path.exists(self.keys_path):
+            # slot numbers depend on the capacity, and rows without digests cannot be
+            # verified; start over rather than remap
+            self._conn.executescript("DELETE FROM slots; DELETE FROM meta;")
+            self._conn.execute("INSERT INTO meta (name, value) VALUES ('disk_rows', ?)", (str(disk_rows),))
+            for path in (self.vectors_path, self.keys_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            with open(self.keys_path, "wb") as f:
+                f.truncate(disk_rows * KEY_BYTES)  # sparse; all-zero digests match no key
+        row = self._conn.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+        self.dim: Optional[int] = int(row[0]) if row else None
+
+    # ---- disk level ----
+    def _open_matrix(self, dim: int) -> np.memmap:
+        if self._matrix is None:
+            if self.dim is None:
+                self._conn.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('dim', ?)", (str(dim),))
+                self.dim = int(self._conn.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()[0])
+            size = self.disk_rows * self.dim * 2
+            if not os.path.exists(self.vectors_path) or os.path.getsize(self.vectors_path) < size:
+                with open(self.vectors_path, "ab") as f:
+                    f.truncate(size)  # sparse; slots are filled as they are used
+            self._matrix = np.memmap(self.vectors_path, dtype=np.float16, mode="r+", shape=(self.disk_rows, self.dim))
+            self._keys = np.memmap(self.keys_path, dtype=np.uint8, mode="r+", shape=(self.disk_rows, KEY_BYTES))
+        return self._matrix
+
+    def _slots(self, keys: List[bytes]) -> Dict[bytes, int]:
+        found: Dict[bytes, int] = {}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            marks = ",".join("?" * len(chunk))
+            for key, slot in self._conn.execute(f"SELECT key, slot FROM slots WHERE key IN ({marks})", chunk):
+                found[bytes(key)] = slot
+        return found
+
+    def _disk_get(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        if self.dim is None and keys:
+            row = self._conn.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+            self.dim = int(row[0]) if row else None  # another process may have stored the first vectors
+        if self.dim is None or not keys:
+            return {}
+        found = self._slots(keys)
+        if not found:
+            return {}
+        matrix = self._open_matrix(self.dim)
+        keys = list(found)
+        slots = np.fromiter((found[k] for k in keys), dtype=np.int64, count=len(keys))
+        expected = np.frombuffer(b"".join(keys), dtype=np.uint8).reshape(len(keys), KEY_BYTES)
+        # another process may recycle a slot while we read it: keep a row only if
+        # the slot's digest named our key both before and after the vector was read
+        before = self._keys[slots]
+        rows = np.asarray(matrix[slots], dtype=np.float32)
+        after = self._keys[slots]
+        valid = (before == expected).all(axis=1) & (after == expected).all(axis=1)
+        hits = {key: rows[i] for i, key in enumerate(keys) if valid[i]}
+        # recency on disk is refreshed only on disk hits, so memory-hot entries may age out there first
+        self._conn.executemany(
+            "UPDATE slots SET last_access = ? WHERE key = ?", [(time.time(), k) for k in hits]
+        )
+        return hits
+
+    def _disk_put(self, items: Dict[bytes, np.ndarray]) -> None:
+        if not items:
+            return
+        dim = len(next(iter(items.values())))
+        matrix = self._open_matrix(dim)
+        if matrix.shape[1] != dim:
+            return  # store was created for a different model dimension
+        now = time.time()
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            # another process may have stored some of these meanwhile; slots stay dense 0..used-1
+            present = self._slots(list(items))
+            items = {k: v for k, v in items.items() if k not in present}
+            used = self._conn.execute("SELECT COUNT(*) FROM slots").fetchone()[0]
+            fresh = min(len(items), self.disk_rows - used)
+            slots = list(range(used, used + fresh))
+            if len(slots) < len(items):
+                # full: recycle the least recently used slots
+                victims = self._conn.execute(
+                    "SELECT key, slot FROM slots ORDER BY last_access LIMIT ?", (len(items) - len(slots),)
+                ).fetchall()
+                self._conn.executemany("DELETE FROM slots WHERE key = ?", [(v[0],) for v in victims])
+                slots.extend(v[1] for v in victims)
+            rows = []
+            for (key, vector), slot in zip(items.items(), slots):
+                self._keys[slot] = 0  # readers of the previous owner now reject the row
+                matrix[slot] = vector.astype(np.float16)
+                self._keys[slot] = np.frombuffer(key, dtype=np.uint8)
+                rows.append((key, slot, now))
+            matrix.flush()
+            self._keys.flush()
+            self._conn.executemany("INSERT INTO slots (key, slot, last_access) VALUES (?, ?, ?)", rows)
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    # ---- memory level ----
+    def _remember(self, key: bytes, vector: np.ndarray) -> None:
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        self._memory[key] = vector
+        self._memory_bytes += vector.nbytes
+        while len(self._memory) > self.memory_items:
+            _, old = self._memory.popitem(last=False)
+            self._memory_bytes -= old.nbytes
+
+    # ---- public ----
+    def encode(self, encode_fn: Callable[[List[str]], Any], model_name: str, sentences: Sequence[str]) -> np.ndarray:
+        """
+        encode_fn(sentences) as float32 rows. encode_fn is called at most once,
+        with only the uncached sentences (each once), so a fully cached batch
+        never needs the model loaded.
+        """
+        keys = [sentence_key(model_name, s) for s in sentences]
+        found: Dict[bytes, np.ndarray] = {}
+        with self._lock:
+            for key in keys:
+                if key in self._memory and key not in found:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+            memory_hits = len(found)
+            missing = list(dict.fromkeys(k for k in keys if k not in found))
+            from_disk = self._disk_get(missing)
+            for key, vector in from_disk.items():
+                self._remember(key, vector)
+            found.update(from_disk)
+
+        todo: Dict[bytes, str] = {}
+        for key, sentence in zip(keys, sentences):
+            if key not in found and key not in todo:
+                todo[key] = sentence
+        if todo:
+            computed = np.asarray(encode_fn(list(todo.values())), dtype=np.float32)
+            fresh = {key: np.array(row) for key, row in zip(todo.keys(), computed)}
+            with self._lock:
+                for key, vector in fresh.items():
+                    self._remember(key, vector)
+                try:
+                    self._disk_put(fresh)
+                except (OSError, sqlite3.Error):
+                    pass  # the memory level still has them
+            found.update(fresh)
+
+        with self._lock:
+            self.hits_memory += memory_hits
+            self.hits_disk += len(from_disk)
+            self.misses += len(todo)
+        METRICS.inc("embedding_cache_lookups_total", memory_hits, result="memory_hit")
+        METRICS.inc("embedding_cache_lookups_total", len(from_disk), result="disk_hit")
+        METRICS.inc("embedding_cache_lookups_total", len(todo), result="miss")
+        if not keys:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return np.vstack([found[k] for k in keys])
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits_memory + self.hits_disk + self.misses
+            disk_entries = self._conn.execute("SELECT COUNT(*) FROM slots").fetchone()[0]
+            return {
+                "hits_memory": self.hits_memory,
+                "hits_disk": self.hits_disk,
+                "misses": self.misses,
+                "hit_ratio": ((self.hits_memory + self.hits_disk) / lookups) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "memory_items_cap": self.memory_items,
+                "memory_bytes": self._memory_bytes,
+                "disk_entries": disk_entries,
+                "disk_rows_cap": self.disk_rows,
+                "disk_bytes": sum(os.path.getsize(p) for p in (self.vectors_path, self.keys_path) if os.path.exists(p)),
+            }
+
+
+@lru_cache(maxsize=1)
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Process-wide cache; disabled with EMBED_CACHE_DISABLED=1."""
+    if os.getenv("EMBED_CACHE_DISABLED", "").strip() in ("1", "true", "yes"):
+        return None
+    return EmbeddingCache(
+        os.getenv("EMBED_CACHE_DIR") or DEFAULT_CACHE_DIR,
+        memory_items=int(os.getenv("EMBED_CACHE_MEMORY_ITEMS", "20000")),
+        disk_rows=int(os.getenv("EMBED_CACHE_DISK_ROWS", "200000")),
+    )
@@ -0,0 +1,197 @@
+"""
+Process pool for CPU-bound enrichment (sentence embedding + semantic tagging).
+
+Each worker loads the SentenceTransformer and concept embeddings once, in its
+initializer, so requests never pay for model loading. The MCP server uses the
+pool for the semantic pass when ENRICH_WORKERS > 0; the CLI re-enriches the
+whole chat_logs corpus in parallel after the tagging logic changes:
+
+    python enrich_pool.py reenrich [--workers N] [--log-dir DIR] [--reindex-vectors]
+"""
+from typing import Any, Dict, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+from datetime import datetime
+import os
+import json
+import shutil
+import tempfile
+import asyncio
+import argparse
+import multiprocessing
+
+_THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# tags produced by _semantic_tags_and_type; anything else in a saved log came from the LLM
+SEMANTIC_TAGS = {"function modify", "bug fixed", "question", "discussion"}
+
+
+def _init_worker(threads: int) -> None:
+    # read by whichever embedding backend loads (torch threads / ONNX Runtime intra-op threads)
+    os.environ["EMBED_THREADS"] = str(max(1, threads))
+    from process import get_concept_embeddings
+    get_concept_embeddings()  # loads the model once per worker
+
+
+def _semantic_shard(contents: List[str]) -> Tuple[List[Dict[str, Any]], List[Any]]:
+    from process import batch_semantic_matches
+    return batch_semantic_matches(contents, return_embeddings=True)
+
+
+def _reenrich_log(path: str, embed_summary: bool = False) -> Tuple[str, Dict[str, Any], List[Any], Any]:
+    """Recompute the semantic tags/type of every message in one saved log."""
+    from process import batch_semantic_matches, get_semantic_model
+    from chat_logger import _semantic_tags_and_type
+
+    with open(path, "r", encoding="utf-8") as f:
+        payload = json.load(f)
+    messages = payload.get("messages") or []
+    semantics, vectors = batch_semantic_matches(
+        [str(m.get("content", "") or "") for m in messages], return_embeddings=True
+    )
+    for m, semantic in zip(messages, semantics):
+        sem_tags, sem_type, _, _ = _semantic_tags_and_type(str(m.get("content", "") or ""), semantic)
+        llm_tags = [t for t in (m.get("tags") or []) if t not in SEMANTIC_TAGS]
+        m["tags"] = list(dict.fromkeys(sem_tags + llm_tags))[:6]
+        if (m.get("ai_model") or "N/A") == "N/A":
+            # no LLM verdict to keep; the semantic type is the classification
+            m["type"] = sem_type
+    summary = payload.get("summary") or ""
+    summary_vector = get_semantic_model().encode([summary])[0] if (embed_summary and summary) else None
+    return path, payload, vectors, summary_vector
+
+
+class EnrichmentPool:
+    def __init__(self, workers: int, threads_per_worker: int = 1, shard_size: int = 256):
+        self.workers = workers
+        self.shard_size = shard_size
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(threads_per_worker,),
+        )
+
+    async def semantic_batch(self, contents: List[str]) -> Tuple[List[Dict[str, Any]], List[Any]]:
+        """batch_semantic_matches(..., return_embeddings=True), sharded across workers."""
+        shards = [contents[i:i + self.shard_size] for i in range(0, len(contents), self.shard_size)] or [[]]
+        parts = await asyncio.gather(*(
+            asyncio.wrap_future(self._executor.submit(_semantic_shard, shard)) for shard in shards
+        ))
+        semantics: List[Dict[str, Any]] = []
+        vectors: List[Any] = []
+        for sem, vec in parts:
+            semantics.extend(sem)
+            vectors.extend(vec)
+        return semantics, vectors
+
+    def submit_log(self, path: str, embed_summary: bool = False):
+        return self._executor.submit(_reenrich_log, path, embed_summary)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
+
+
+@lru_cache(maxsize=1)
+def get_enrichment_pool() -> Optional[EnrichmentPool]:
+    """Shared pool when ENRICH_WORKERS > 0, otherwise None (enrich in-process)."""
+    workers = int(os.getenv("ENRICH_WORKERS", "0"))
+    if workers <= 0:
+        return None
+    return EnrichmentPool(
+        workers,
+        threads_per_worker=int(os.getenv("ENRICH_THREADS_PER_WORKER", "1")),
+        shard_size=int(os.getenv("ENRICH_SHARD_SIZE", "256")),
+    )
+
+
+def reenrich_corpus(log_dir: str, workers: int, reindex_vectors: bool = False) -> int:
+    """
+    Re-tag every JSON log in `log_dir` in parallel; the parent process does all writes.
+    With `reindex_vectors` the search index is rebuilt in a scratch directory and
+    swapped in at the end, so running servers keep searching the old one until then.
+    """
+    from chat_logger import _write_log_atomic
+    from log_store import get_log_store
+    from vector_index import VectorIndex, DEFAULT_INDEX_DIR
+
+    paths = sorted(
+        os.path.join(log_dir, name) for name in os.listdir(log_dir)
+        if name.endswith(".json") and not name.startswith(".")
+    )
+    index = None
+    if reindex_vectors:
+        index_dir = os.getenv("VECTOR_INDEX_DIR") or DEFAULT_INDEX_DIR
+        os.makedirs(index_dir, exist_ok=True)
+        # same parent, so the final os.replace of each file stays on one filesystem
+        index = VectorIndex(tempfile.mkdtemp(prefix=".rebuild_", dir=os.path.dirname(os.path.abspath(index_dir))))
+
+    pool = EnrichmentPool(workers)
+    store = get_log_store()
+    created = store.log_versions()  # keep each log's original position in the timeline
+    done = 0
+    try:
+        futures = [pool.submit_log(p, embed_summary=reindex_vectors) for p in paths]
+        for future in as_completed(futures):
+            try:
+                path, payload, vectors, summary_vector = future.result()
+            except Exception as e:
+                print(f"skipped: {e}")
+                continue
+            # the watcher re-imports logs modified after their stored created_at,
+            # so put the original mtime back after rewriting the file
+            mtime = os.stat(path).st_mtime
+            _write_log_atomic(path, payload)
+            os.utime(path, (mtime, mtime))
+            log_name = os.path.splitext(os.path.basename(path))[0]
+            store.upsert_conversation(
+                payload,
+                log_name,
+                created.get(log_name) or datetime.fromtimestamp(mtime).isoformat(timespec="seconds"),
+            )
+            if index is not None:
+                import numpy as np
+                conversation_id = str(payload.get("conversation_id") or payload.get("id") or log_name)
+                rows = [(-1, summary_vector)] + list(enumerate(vectors))
+                rows = [(i, v) for i, v in rows if v is not None]
+                if rows:
+                    index.add(
+                        np.vstack([v for _, v in rows]),
+                        [
+                            {
+                                "conversation_id": conversation_id,
+                                "log_name": log_name,
+                                "kind": "summary" if i < 0 else "message",
+                                "position": i,
+                            }
+                            for i, _ in rows
+                        ],
+                    )
+            done += 1
+            if done % 50 == 0:
+                print(f"{done}/{len(paths)} logs re-enriched")
+        if index is not None:
+            VectorIndex(index_dir).replace_with(index)
+    finally:
+        pool.shutdown()
+        if index is not None:
+            shutil.rmtree(index.directory, ignore_errors=True)
+    return done
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Parallel enrichment utilities")
+    sub = parser.add_subparsers(dest="command", required=True)
+    re_ = sub.add_parser("reenrich", help="recompute semantic tags for every saved log")
+    re_.add_argument("--log-dir", default=os.path.join(_THIS_DIR, "chat_logs"))
+    re_.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    re_.add_argument("--reindex-vectors", action="store_true", help="rebuild the semantic search index (swapped in once the run finishes)")
+    args = parser.parse_args()
+
+    if args.command == "reenrich":
+        count = reenrich_corpus(args.log_dir, args.workers, args.reindex_vectors)
+        print(f"Re-enriched {count} log(s) with {args.workers} worker(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+Durable SQLite-backed job queue for chat log ingestion.
+
+save_chat_history enqueues the raw messages and returns a job id; a worker
+(in the MCP server process, or `python chat_logger.py worker`) claims jobs,
+runs the enrichment pipeline and retries failures with exponential backoff.
+A claimed job holds a lease that the worker renews while the job runs, so only
+jobs from a crashed worker are picked up again; those count as attempts too.
+"""
+from typing import Any, Awaitable, Callable, Dict, Optional
+from functools import lru_cache
+import os
+import json
+import time
+import uuid
+import random
+import asyncio
+import sqlite3
+import threading
+
+_THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,          -- queued | running | done | failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    run_after REAL NOT NULL,
+    lease_until REAL,
+    lease_owner TEXT,              -- token of the claim holding the lease
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs(status, run_after);
+"""
+
+
+class JobQueue:
+    def __init__(
+        self,
+        path: str,
+        max_attempts: Optional[int] = None,
+        lease_seconds: float = 600.0,
+        backoff_base: float = 2.0,
+        backoff_cap: float = 300.0,
+    ):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.max_attempts = max_attempts or int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+        self.lease_seconds = lease_seconds
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(SCHEMA)
+        if "lease_owner" not in {r[1] for r in self._conn.execute("PRAGMA table_info(jobs)")}:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN lease_owner TEXT")
+
+    def enqueue(self, kind: str, payload: Dict[str, Any], job_id: Optional[str] = None) -> str:
+        job_id = job_id or str(uuid.uuid4())
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO jobs (id, kind, payload, status, run_after, created_at, updated_at)
+                VALUES (?, ?, ?, 'queued', ?, ?, ?)
+                """,
+                (job_id, kind, json.dumps(payload, ensure_ascii=False), now, now, now),
+            )
+        return job_id
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """
+        Atomically take the oldest ready job (or one whose lease expired).
+        Expired jobs that already used max_attempts are marked failed instead,
+        so a job that keeps crashing its worker is not retried forever.
+        """
+        now = time.time()
+        owner = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    """
+                    UPDATE jobs SET status = 'failed', lease_until = NULL, lease_owner = NULL, updated_at = ?,
+                                    error = 'lease expired after ' || attempts || ' attempt(s); the worker stopped mid-job'
+                    WHERE status = 'running' AND lease_until < ? AND attempts >= ?
+                    """,
+                    (now, now, self.max_attempts),
+                )
+                row = self._conn.execute(
+                    """
+                    SELECT * FROM jobs
+                    WHERE (status = 'queued' AND run_after <= ?)
+                       OR (status = 'running' AND lease_until < ?)
+                    ORDER BY run_after LIMIT 1
+                    """,
+                    (now, now),
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                self._conn.execute(
+                    """
+                    UPDATE jobs SET status = 'running', attempts = attempts + 1,
+                                    lease_until = ?, lease_owner = ?, updated_at = ?
+                    WHERE id = ?
+                    """,
+                    (now + self.lease_seconds, owner, now, row["id"]),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        job = dict(row)
+        job["attempts"] += 1
+        job["lease_owner"] = owner
+        job["payload"] = json.loads(job["payload"])
+        return job
+
+    def heartbeat(self, job_id: str, owner: str) -> bool:
+        """Extend a running job's lease; False if the lease was lost to another worker."""
+        now = time.time()
+        with self._lock:
+            cur = self._conn.execute(
+                """
+                UPDATE jobs SET lease_until = ?, updated_at = ?
+                WHERE id = ? AND status = 'running' AND lease_owner = ?
+                """,
+                (now + self.lease_seconds, now, job_id, owner),
+            )
+        return cur.rowcount > 0
+
+    def complete(self, job_id: str, result: Any, owner: Optional[str] = None) -> None:
+        """Record the result; with `owner`, only if that claim still holds the lease."""
+        with self._lock:
+            self._conn.execute(
+                """
+                UPDATE jobs SET status = 'done', result = ?, error = NULL, lease_until = NULL, lease_owner = NULL,
+                                updated_at = ?
+                WHERE id = ? AND (? IS NULL OR lease_owner = ?)
+                """,
+                (json.dumps(result, ensure_ascii=False), time.time(), job_id, owner, owner),
+            )
+
+    def fail(self, job_id: str, attempts: int, error: str, owner: Optional[str] = None) -> None:
+        """Reschedule with jittered exponential backoff, or give up after max_attempts."""
+        now = time.time()
+        if attempts >= self.max_attempts:
+            status, run_after = "failed", now
+        else:
+            delay = min(self.backoff_cap, self.backoff_base * (2 ** (attempts - 1)))
+            status, run_after = "queued", now + delay * random.uniform(0.5, 1.5)
+        with self._lock:
+            self._conn.execute(
+                """
+                UPDATE jobs SET status = ?, run_after = ?, error = ?, lease_until = NULL, lease_owner = NULL,
+                                updated_at = ?
+                WHERE id = ? AND (? IS NULL OR lease_owner = ?)
+                """,
+                (status, run_after, error, now, job_id, owner, owner),
+            )
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, kind, status, attempts, result, error, created_at, updated_at, run_after FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        out = dict(row)
+        out["result"] = json.loads(out["result"]) if out["result"] else None
+        return out
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {r[0]: r[1] for r in rows}
+
+
+async def _keep_lease(queue: JobQueue, job: Dict[str, Any]) -> None:
+    """Renew the job's lease every third of its length until cancelled (or the lease is lost)."""
+    while True:
+        await asyncio.sleep(queue.lease_seconds / 3)
+        if not await asyncio.to_thread(queue.heartbeat, job["id"], job["lease_owner"]):
+            return
+
+
+async def run_worker(
+    queue: JobQueue,
+    handler: Callable[[Dict[str, Any]], Awaitable[Any]],
+    poll_interval: float = 1.0,
+    stop: Optional[asyncio.Event] = None,
+) -> None:
+    """Claim and run jobs forever (or until `stop` is set)."""
+    while stop is None or not stop.is_set():
+        job = await asyncio.to_thread(queue.claim)
+        if job is None:
+            await asyncio.sleep(poll_interval)
+            continue
+        lease = asyncio.create_task(_keep_lease(queue, job))
+        try:
+            result = await handler(job)
+        except Exception as e:
+            await asyncio.to_thread(
+                queue.fail, job["id"], job["attempts"], f"{type(e).__name__}: {e}", job["lease_owner"]
+            )
+        else:
+            await asyncio.to_thread(queue.complete, job["id"], result, job["lease_owner"])
+        finally:
+            lease.cancel()
+
+
+@lru_cache(maxsize=1)
+def get_job_queue() -> JobQueue:
+    path = os.getenv("JOB_QUEUE_PATH") or os.path.join(_THIS_DIR, "cache", "jobs.sqlite3")
+    return JobQueue(path)
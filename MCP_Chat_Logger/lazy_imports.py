@@ -0,0 +1,43 @@
+"""
+Deferred imports for heavy dependencies (torch via sentence-transformers,
+scikit-learn, KeyBERT, google-generativeai, numpy), so the MCP server can
+answer the stdio handshake before any of them are loaded.
+"""
+from typing import Any, Dict
+import importlib
+import threading
+import time
+
+# module name -> seconds spent importing it (first access only)
+IMPORT_TIMINGS: Dict[str, float] = {}
+_lock = threading.Lock()
+
+
+def timed_import(name: str) -> Any:
+    with _lock:
+        if name in IMPORT_TIMINGS:
+            return importlib.import_module(name)
+        start = time.perf_counter()
+        module = importlib.import_module(name)
+        IMPORT_TIMINGS[name] = time.perf_counter() - start
+        return module
+
+
+class LazyModule:
+    """Stands in for `import name as alias`; the real import happens on first attribute access."""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def _load(self) -> Any:
+        if self._module is None:
+            self._module = timed_import(self._name)
+        return self._module
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._load(), attr)
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
@@ -0,0 +1,109 @@
+from typing import Any, Dict, Optional
+from functools import lru_cache
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from metrics import METRICS
+
+_THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class LLMCache:
+    """
+    Persistent, content-addressed cache for parsed LLM responses.
+    Entries live in a small SQLite file and are evicted least-recently-used
+    once the stored payload grows past `max_bytes`.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 64 * 1024 * 1024):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_access ON entries(last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, template_version: str, generation_config: Dict[str, Any], content: str) -> str:
+        h = hashlib.sha256()
+        for part in (model, template_version, json.dumps(generation_config, sort_keys=True), content):
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                METRICS.inc("llm_cache_lookups_total", result="miss")
+                return None
+            self.hits += 1
+            METRICS.inc("llm_cache_lookups_total", result="hit")
+            self._conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def put(self, key: str, value: Any) -> None:
+        payload = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, payload, len(payload), time.time()),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM entries ORDER BY last_access ASC"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+        }
+
+
+@lru_cache(maxsize=1)
+def get_llm_cache() -> Optional[LLMCache]:
+    """Process-wide cache; disabled with LLM_CACHE_DISABLED=1."""
+    if os.getenv("LLM_CACHE_DISABLED", "").strip() in ("1", "true", "yes"):
+        return None
+    path = os.getenv("LLM_CACHE_PATH") or os.path.join(_THIS_DIR, "cache", "llm_cache.sqlite3")
+    max_mb = float(os.getenv("LLM_CACHE_MAX_MB", "64"))
+    return LLMCache(path, max_bytes=int(max_mb * 1024 * 1024))
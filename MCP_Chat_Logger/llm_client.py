@@ -0,0 +1,215 @@
+"""
+Shared, rate-limited Gemini client.
+
+One GeminiClient per process configures the SDK once and reuses a
+GenerativeModel per model name. Every call first takes one request and its
+estimated tokens from two token buckets (GEMINI_RPM, GEMINI_TPM; 0 disables).
+429 / 5xx / timeout failures are retried with full-jitter exponential backoff
+(GEMINI_MAX_RETRIES); a 429 also empties the request bucket so every caller
+pauses rather than piling on. Consecutive 5xx / timeout failures open a circuit breaker
+(GEMINI_BREAKER_FAILURES, GEMINI_BREAKER_RESET_SECONDS), during which calls
+fail fast with LLMUnavailable so callers keep their semantic-only results.
+GEMINI_TIMEOUT bounds each request.
+"""
+from typing import Any, Callable, Dict, Optional
+import time
+import random
+import threading
+
+from metrics import METRICS
+
+# HTTP statuses (google.api_core exceptions carry them as .code) worth retrying
+RETRY_STATUS = {408, 429, 500, 502, 503, 504}
+RETRY_NAMES = {"DeadlineExceeded", "ServiceUnavailable", "ResourceExhausted", "TooManyRequests", "InternalServerError"}
+
+
+class LLMUnavailable(RuntimeError):
+    """The API is rate limited or unhealthy beyond what retries absorb; fall back to semantic results."""
+
+
+class TokenBucket:
+    """`rate_per_minute` units refilled continuously, up to `capacity` (default: one minute's worth)."""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self._level = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount: float = 1.0) -> float:
+        """Block until `amount` units (capped at capacity) are available; returns seconds waited."""
+        if self.rate <= 0:
+            return 0.0
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._level >= amount:
+                    self._level -= amount
+                    return waited
+                delay = (amount - self._level) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def drain(self) -> None:
+        with self._lock:
+            self._refill()
+            self._level = min(self._level, 0.0)
+
+    @property
+    def level(self) -> float:
+        with self._lock:
+            self._refill()
+            return self._level
+
+
+class CircuitBreaker:
+    """closed -> open after `failure_threshold` consecutive failures; one probe call after `reset_seconds`."""
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half-open" if time.monotonic() - self._opened_at >= self.reset_seconds else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_seconds or self._probing:
+                return False
+            self._probing = True  # let a single call test the API
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_throttled(self) -> None:
+        """A rate-limit answer: says nothing about health, but ends a probe."""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    METRICS.inc("llm_circuit_opened_total")
+                self._opened_at = time.monotonic()
+
+
+def is_retryable(error: BaseException) -> bool:
+    code = getattr(error, "code", None)
+    if isinstance(code, int) and code in RETRY_STATUS:
+        return True
+    return isinstance(error, (TimeoutError, ConnectionError)) or type(error).__name__ in RETRY_NAMES
+
+
+class GeminiClient:
+    def __init__(
+        self,
+        genai: Any,
+        api_key: str,
+        requests_per_minute: float = 60,
+        tokens_per_minute: float = 1_000_000,
+        max_retries: int = 5,
+        timeout: float = 60.0,
+        backoff_base: float = 1.0,
+        backoff_cap: float = 32.0,
+        breaker: Optional[CircuitBreaker] = None,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        genai.configure(api_key=api_key)
+        self._genai = genai
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.breaker = breaker or CircuitBreaker()
+        self._sleep = sleep
+        self._models: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def model(self, model_name: str) -> Any:
+        with self._lock:
+            if model_name not in self._models:
+                self._models[model_name] = self._genai.GenerativeModel(model_name)
+            return self._models[model_name]
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    def generate(
+        self,
+        model_name: str,
+        prompt: str,
+        generation_config: Dict[str, Any],
+        estimated_tokens: int,
+        kind: str = "llm",
+    ) -> Any:
+        """
+        model.generate_content with rate limiting, retries and the circuit breaker.
+        Raises LLMUnavailable when the breaker is open or retries are exhausted;
+        other errors (bad request, auth) propagate unchanged.
+        """
+        model = self.model(model_name)
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                raise LLMUnavailable("Gemini circuit breaker is open")
+            waited = self.requests.acquire(1) + self.tokens.acquire(estimated_tokens)
+            if waited:
+                METRICS.observe("llm_rate_limit_wait_seconds", waited, kind=kind)
+            try:
+                response = model.generate_content(
+                    prompt, generation_config=generation_config, request_options={"timeout": self.timeout}
+                )
+            except Exception as e:
+                if not is_retryable(e):
+                    self.breaker.record_success()  # the API answered; the request itself is at fault
+                    raise
+                METRICS.inc("llm_retries_total", kind=kind, cause=type(e).__name__)
+                if getattr(e, "code", None) == 429 or type(e).__name__ in ("ResourceExhausted", "TooManyRequests"):
+                    # over quota, not unhealthy: everyone waits for the next refill
+                    self.requests.drain()
+                    self.breaker.record_throttled()
+                else:
+                    self.breaker.record_failure()
+                if attempt == self.max_retries:
+                    raise LLMUnavailable(f"Gemini failed after {attempt + 1} attempt(s): {e}") from e
+                self._sleep(self._backoff(attempt))
+                continue
+            self.breaker.record_success()
+            return response
+        raise LLMUnavailable("Gemini retries exhausted")  # not reached
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "circuit": self.breaker.state,
+            "request_bucket": round(self.requests.level, 2),
+            "token_bucket": round(self.tokens.level, 2),
+            "requests_per_minute": self.requests.rate * 60,
+            "tokens_per_minute": self.tokens.rate * 60,
+            "models": sorted(self._models),
+        }
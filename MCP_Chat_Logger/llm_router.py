@@ -0,0 +1,170 @@
+"""
+Confidence-gated routing in front of the Gemini classifier.
+
+Messages whose label is obvious from cheap signals (empty text, short
+acknowledgements, plain questions that score low against every semantic
+concept and contain no code) are labelled locally; everything else still
+goes to the LLM. Tune with ROUTER_MAX_CONCEPT_SIM / ROUTER_MAX_QUESTION_CHARS,
+disable with ROUTER_DISABLED=1, and check agreement against saved LLM labels:
+
+    python llm_router.py eval [--log-dir DIR] [--min-agreement 0.98]
+"""
+from typing import Any, Dict, List, NamedTuple, Optional
+import os
+import re
+import sys
+import json
+import argparse
+import threading
+
+_THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+ROUTER_MODEL = "router"  # ai_model recorded for messages labelled without the LLM
+
+_ACK = re.compile(
+    r"(?:ok(?:ay)?|k|thanks?(?: you)?|thx|ty|got it|great|perfect|cool|nice|lgtm|"
+    r"sounds good|looks good|yes|yep|yeah|no|nope|sure|done|will do|makes sense)"
+    r"[\s!.,:)]*(?:thanks?(?: you)?)?(?: again)?[\s!.]*",
+    re.IGNORECASE,
+)
+_QUESTION_START = re.compile(
+    r"(?:how|what|why|when|where|which|who|can|could|does|do|is|are|should|would|will)\b",
+    re.IGNORECASE,
+)
+# anything that hints at code or a change request keeps the message on the LLM path
+_CODE_OR_CHANGE = re.compile(
+    r"`|\w\(|[{}\[\];=<>]|\w\.\w|\w_\w|/\w|"
+    r"\b(?:fix\w*|bug\w*|error\w*|exception\w*|crash\w*|implement\w*|refactor\w*|add\w*|"
+    r"chang\w*|updat\w*|renam\w*|remov\w*|delet\w*|replac\w*|modif\w*|patch\w*)\b",
+    re.IGNORECASE,
+)
+
+
+class Route(NamedTuple):
+    use_llm: bool
+    type: Optional[str]  # label to apply when use_llm is False
+    reason: str
+
+
+class RoutingStats:
+    """Thread-safe counters: messages sent to the LLM vs labelled locally, by reason."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts: Dict[str, int] = {}
+
+    def record(self, route: Route) -> None:
+        key = "llm" if route.use_llm else route.reason
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self.counts)
+        total = sum(counts.values())
+        skipped = total - counts.get("llm", 0)
+        return {
+            "messages": total,
+            "llm_calls_skipped": skipped,
+            "skip_ratio": (skipped / total) if total else 0.0,
+            "by_reason": counts,
+        }
+
+
+ROUTING_STATS = RoutingStats()
+
+
+def route_message(content: str, semantic: Optional[Dict[str, Any]] = None) -> Route:
+    """
+    Decide whether `content` needs the LLM. `semantic` is one entry of
+    process.batch_semantic_matches; without its "scores" a message is only
+    skipped on structural grounds.
+    """
+    if os.getenv("ROUTER_DISABLED", "").strip() in ("1", "true", "yes"):
+        return Route(True, None, "disabled")
+
+    text = (content or "").strip()
+    if not text:
+        return Route(False, "discussion", "empty")
+    if "```" in text or "\n" in text:
+        return Route(True, None, "structured")
+    if len(text) <= 40 and _ACK.fullmatch(text):
+        return Route(False, "discussion", "acknowledgement")
+
+    scores = (semantic or {}).get("scores") or {}
+    max_sim = float(os.getenv("ROUTER_MAX_CONCEPT_SIM", "0.3"))
+    max_chars = int(os.getenv("ROUTER_MAX_QUESTION_CHARS", "160"))
+    if (
+        scores
+        and max(scores.values()) < max_sim
+        and len(text) <= max_chars
+        and text.endswith("?")
+        and text.count("?") == 1
+        and _QUESTION_START.match(text)
+        and not _CODE_OR_CHANGE.search(text)
+    ):
+        return Route(False, "question", "plain-question")
+    return Route(True, None, "uncertain")
+
+
+# ----------------------------
+# Offline agreement check
+# ----------------------------
+def evaluate(log_dir: str) -> Dict[str, Any]:
+    """Replay saved LLM-labelled messages through the router and compare labels."""
+    from process import batch_semantic_matches, normalize_llm_type
+
+    contents: List[str] = []
+    labels: List[str] = []
+    for name in sorted(os.listdir(log_dir)):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(log_dir, name), "r", encoding="utf-8") as f:
+                messages = json.load(f).get("messages") or []
+        except Exception:
+            continue
+        for m in messages:
+            if (m.get("ai_model") or "N/A") in ("N/A", ROUTER_MODEL):
+                continue  # no LLM verdict to compare against
+            contents.append(str(m.get("content", "") or ""))
+            labels.append(normalize_llm_type(m.get("type", "")))
+
+    semantics = batch_semantic_matches(contents) if contents else []
+    skipped = agreed = 0
+    disagreements: List[Dict[str, str]] = []
+    for content, label, semantic in zip(contents, labels, semantics):
+        route = route_message(content, semantic)
+        if route.use_llm:
+            continue
+        skipped += 1
+        if route.type == label:
+            agreed += 1
+        elif len(disagreements) < 20:
+            disagreements.append({"content": content[:120], "llm": label, "router": route.type})
+    return {
+        "messages": len(contents),
+        "skipped": skipped,
+        "skip_ratio": (skipped / len(contents)) if contents else 0.0,
+        "agreement": (agreed / skipped) if skipped else 1.0,
+        "disagreements": disagreements,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="LLM routing utilities")
+    sub = parser.add_subparsers(dest="command", required=True)
+    ev = sub.add_parser("eval", help="compare router labels with saved LLM labels")
+    ev.add_argument("--log-dir", default=os.path.join(_THIS_DIR, "chat_logs"))
+    ev.add_argument("--min-agreement", type=float, default=0.98)
+    args = parser.parse_args()
+
+    if args.command == "eval":
+        report = evaluate(args.log_dir)
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        if report["agreement"] < args.min_agreement:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+"""
+Compact columnar export of the chat_logs corpus.
+
+Every column of the conversations and messages tables is stored in its own
+file as zlib-compressed row groups, with a JSON offsets index per column, so
+readers decompress only the columns (and row groups) they ask for. before/after
+code is content-addressed into a separate `code` table, so a block repeated
+across snapshots is stored once. Conversation and message `enrichment` (e.g.
+KeyBERT keywords) is kept as a JSON value per row, so a round trip loses nothing
+the JSON logs hold. Stdlib only (pyarrow is not a dependency).
+
+    python log_export.py export [--log-dir DIR] [--out DIR] [--row-group N]
+    python log_export.py info [DIR]
+    python log_export.py dump [DIR] messages type,ai_model      # JSONL of selected columns
+"""
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from bisect import bisect_right
+from datetime import datetime
+import os
+import sys
+import json
+import zlib
+import shutil
+import hashlib
+import argparse
+
+_THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_LOG_DIR = os.path.join(_THIS_DIR, "chat_logs")
+DEFAULT_EXPORT_DIR = os.path.join(_THIS_DIR, "chat_logs_export")
+
+FORMAT = "chat-log-columns"
+VERSION = 1
+
+CONVERSATION_COLUMNS = (
+    "log_name", "id", "project_name", "title", "summary",
+    "message_count", "created_at", "message_start", "message_rows", "enrichment",
+)
+MESSAGE_COLUMNS = (
+    "conversation", "position", "content", "timestamp", "type", "tags", "ai_model",
+    "before_code", "after_code",  # ids into the code table, -1 for none
+    "enrichment",
+)
+CODE_COLUMNS = ("text",)
+CODE_REF_COLUMNS = ("before_code", "after_code")
+
+
+class _ColumnWriter:
+    def __init__(self, path: str, row_group: int, level: int):
+        self.path = path
+        self.row_group = row_group
+        self.level = level
+        self._file = open(path + ".bin", "wb")
+        self._buffer: List[Any] = []
+        self._index: List[Tuple[int, int, int]] = []  # (offset, length, rows)
+        self._offset = 0
+
+    def append(self, value: Any) -> None:
+        self._buffer.append(value)
+        if len(self._buffer) >= self.row_group:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._buffer:
+            return
+        data = zlib.compress(json.dumps(self._buffer, ensure_ascii=False).encode("utf-8"), self.level)
+        self._file.write(data)
+        self._index.append((self._offset, len(data), len(self._buffer)))
+        self._offset += len(data)
+        self._buffer = []
+
+    def close(self) -> None:
+        self._flush()
+        self._file.close()
+        with open(self.path + ".idx.json", "w", encoding="utf-8") as f:
+            json.dump(self._index, f)
+
+
+class _TableWriter:
+    def __init__(self, directory: str, columns: Sequence[str], row_group: int, level: int):
+        os.makedirs(directory, exist_ok=True)
+        self.columns = tuple(columns)
+        self.rows = 0
+        self._writers = {c: _ColumnWriter(os.path.join(directory, c), row_group, level) for c in columns}
+
+    def append(self, row: Dict[str, Any]) -> int:
+        for c in self.columns:
+            self._writers[c].append(row.get(c))
+        self.rows += 1
+        return self.rows - 1
+
+    def close(self) -> None:
+        for w in self._writers.values():
+            w.close()
+
+
+def export_corpus(
+    log_dir: str = DEFAULT_LOG_DIR,
+    out_dir: str = DEFAULT_EXPORT_DIR,
+    row_group: int = 4096,
+    level: int = 6,
+) -> Dict[str, Any]:
+    """
+    Write every JSON log in `log_dir` (oldest first) to a columnar export at
+    `out_dir`, replacing any previous export only once the new one is complete.
+    Returns the manifest.
+    """
+    tmp_dir = out_dir.rstrip(os.sep) + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    conversations = _TableWriter(os.path.join(tmp_dir, "conversations"), CONVERSATION_COLUMNS, row_group, level)
+    messages = _TableWriter(os.path.join(tmp_dir, "messages"), MESSAGE_COLUMNS, row_group, level)
+    code = _TableWriter(os.path.join(tmp_dir, "code"), CODE_COLUMNS, row_group, level)
+    code_ids: Dict[bytes, int] = {}
+    code_refs = 0
+    source_bytes = 0
+
+    def code_id(text: Any) -> int:
+        nonlocal code_refs
+        if not text:
+            return -1
+        code_refs += 1
+        digest = hashlib.sha1(str(text).encode("utf-8")).digest()
+        if digest not in code_ids:
+            code_ids[digest] = code.append({"text": str(text)})
+        return code_ids[digest]
+
+    paths = [
+        os.path.join(log_dir, n) for n in os.listdir(log_dir) if n.endswith(".json") and not n.startswith(".")
+    ] if os.path.isdir(log_dir) else []
+    for path in sorted(paths, key=os.path.getmtime):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception:
+            continue
+        source_bytes += os.path.getsize(path)
+        log_messages = data.get("messages") or []
+        row = conversations.rows
+        start = messages.rows
+        for position, m in enumerate(log_messages):
+            messages.append({
+                "conversation": row,
+                "position": position,
+                "content": m.get("content"),
+                "timestamp": m.get("timestamp"),
+                "type": m.get("type"),
+                "tags": m.get("tags") or [],
+                "ai_model": m.get("ai_model"),
+                "before_code": code_id(m.get("before_code")),
+                "after_code": code_id(m.get("after_code")),
+                "enrichment": m.get("enrichment") or {},
+            })
+        conversations.append({
+            "log_name": os.path.splitext(os.path.basename(path))[0],
+            "id": str(data.get("conversation_id") or data.get("id") or ""),
+            "project_name": data.get("project_name"),
+            "title": data.get("title"),
+            "summary": data.get("summary"),
+            "message_count": int(data.get("message_count") or len(log_messages)),
+            "created_at": datetime.fromtimestamp(os.path.getmtime(path)).isoformat(timespec="seconds"),
+            "message_start": start,
+            "message_rows": len(log_messages),
+            "enrichment": data.get("enrichment") or {},
+        })
+
+    for table in (conversations, messages, code):
+        table.close()
+    manifest = {
+        "format": FORMAT,
+        "version": VERSION,
+        "compression": "zlib",
+        "row_group": row_group,
+        "tables": {
+            "conversations": {"rows": conversations.rows, "columns": list(CONVERSATION_COLUMNS)},
+            "messages": {"rows": messages.rows, "columns": list(MESSAGE_COLUMNS)},
+            "code": {"rows": code.rows, "columns": list(CODE_COLUMNS)},
+        },
+        "code_references": code_refs,
+        "source_bytes": source_bytes,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    with open(os.path.join(tmp_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    old_dir = out_dir.rstrip(os.sep) + ".old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(out_dir):
+        os.replace(out_dir, old_dir)
+    os.replace(tmp_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return manifest
+
+
+class CorpusReader:
+    """Column-selective reader for an export_corpus directory."""
+
+    def __init__(self, path: str = DEFAULT_EXPORT_DIR):
+        self.path = path
+        with open(os.path.join(path, "manifest.json"), "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("format") != FORMAT or self.manifest.get("version") != VERSION:
+            raise ValueError(f"{path} is not a {FORMAT} v{VERSION} export")
+        self._indexes: Dict[Tuple[str, str], Tuple[List[List[int]], List[int]]] = {}
+        self._code: Optional[List[str]] = None
+
+    def rows(self, table: str) -> int:
+        return int(self.manifest["tables"][table]["rows"])
+
+    def has_column(self, table: str, column: str) -> bool:
+        """False for columns added after an export was written (e.g. enrichment)."""
+        return column in self.manifest["tables"][table]["columns"]
+
+    def _index(self, table: str, column: str) -> Tuple[List[List[int]], List[int]]:
+        key = (table, column)
+        if key not in self._indexes:
+            if column not in self.manifest["tables"][table]["columns"]:
+                raise KeyError(f"unknown column {table}.{column}")
+            with open(os.path.join(self.path, table, column + ".idx.json"), "r", encoding="utf-8") as f:
+                groups = json.load(f)
+            starts, total = [], 0
+            for _, _, rows in groups:
+                starts.append(total)
+                total += rows
+            self._indexes[key] = (groups, starts)
+        return self._indexes[key]
+
+    def column(self, table: str, column: str, start: int = 0, stop: Optional[int] = None) -> Iterator[Any]:
+        """Values of one column for rows [start, stop), decompressing only the row groups involved."""
+        groups, starts = self._index(table, column)
+        stop = self.rows(table) if stop is None else min(stop, self.rows(table))
+        if start >= stop:
+            return
+        g = max(0, bisect_right(starts, start) - 1)
+        with open(os.path.join(self.path, table, column + ".bin"), "rb") as f:
+            while g < len(groups) and starts[g] < stop:
+                offset, length, _ = groups[g]
+                f.seek(offset)
+                values = json.loads(zlib.decompress(f.read(length)))
+                lo = max(start - starts[g], 0)
+                hi = min(stop - starts[g], len(values))
+                yield from values[lo:hi]
+                g += 1
+
+    def read(
+        self,
+        table: str,
+        columns: Iterable[str],
+        start: int = 0,
+        stop: Optional[int] = None,
+        resolve_code: bool = True,
+    ) -> Iterator[Dict[str, Any]]:
+        """Rows as dicts holding only `columns`; code ids become text unless resolve_code=False."""
+        columns = list(columns)
+        iterators = [self.column(table, c, start, stop) for c in columns]
+        resolve = [resolve_code and table == "messages" and c in CODE_REF_COLUMNS for c in columns]
+        for values in zip(*iterators):
+            yield {
+                c: (self.code(v) if r else v)
+                for c, v, r in zip(columns, values, resolve)
+            }
+
+    def code(self, code_id: int) -> str:
+        if code_id is None or code_id < 0:
+            return ""
+        if self._code is None:
+            self._code = list(self.column("code", "text"))
+        return self._code[code_id]
+
+    def conversation_messages(self, row: int, columns: Iterable[str]) -> List[Dict[str, Any]]:
+        """Messages of one conversation (by row), via its message_start offset."""
+        start = next(self.column("conversations", "message_start", row, row + 1))
+        count = next(self.column("conversations", "message_rows", row, row + 1))
+        return list(self.read("messages", columns, start, start + count))
+
+
+def _disk_usage(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, n)) for root, _, names in os.walk(path) for n in names)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Columnar export of chat logs")
+    sub = parser.add_subparsers(dest="command", required=True)
+    exp = sub.add_parser("export", help="write chat_logs as a compressed columnar export")
+    exp.add_argument("--log-dir", default=DEFAULT_LOG_DIR)
+    exp.add_argument("--out", default=DEFAULT_EXPORT_DIR)
+    exp.add_argument("--row-group", type=int, default=4096)
+    info = sub.add_parser("info", help="show an export's manifest and size")
+    info.add_argument("path", nargs="?", default=DEFAULT_EXPORT_DIR)
+    dump = sub.add_parser("dump", help="print selected columns of a table as JSONL")
+    dump.add_argument("path", nargs="?", default=DEFAULT_EXPORT_DIR)
+    dump.add_argument("table", choices=("conversations", "messages", "code"))
+    dump.add_argument("columns", help="comma-separated column names")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        manifest = export_corpus(args.log_dir, args.out, args.row_group)
+        size = _disk_usage(args.out)
+        tables = manifest["tables"]
+        print(
+            f"Exported {tables['conversations']['rows']} log(s), {tables['messages']['rows']} message(s), "
+            f"{tables['code']['rows']} unique code block(s) of {manifest['code_references']}: "
+            f"{manifest['source_bytes']} -> {size} bytes"
+        )
+    elif args.command == "info":
+        reader = CorpusReader(args.path)
+        print(json.dumps({**reader.manifest, "bytes": _disk_usage(args.path)}, indent=2))
+    elif args.command == "dump":
+        reader = CorpusReader(args.path)
+        for row in reader.read(args.table, [c.strip() for c in args.columns.split(",") if c.strip()]):
+            sys.stdout.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,943 @@
+"""
+SQLite-backed store for chat logs.
+
+save_chat_history writes every saved conversation here (in addition to the
+JSON file), and the dashboard reads from it instead of loading every JSON log.
+Only the standard library is used so the Flask app can import it without the
+ML dependencies.
+
+Message text and before/after code are stored once per distinct value in a
+content-addressed `blobs` table; messages reference them by hash, so
+re-saved snapshots of a conversation add little. Only the newest snapshot of
+each conversation id is flagged `is_latest` and shown by the dashboard;
+`project_rollups` keeps per-project counters over those snapshots.
+
+One-time import of existing logs:
+    python log_store.py import [chat_logs_dir]
+Collapse older snapshots (files are moved to chat_logs/archive):
+    python log_store.py dedupe [chat_logs_dir] [--dry-run]
+Recompute the per-project rollups (kept up to date on every write):
+    python log_store.py rollups [chat_logs_dir]
+"""
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+from functools import lru_cache
+from datetime import datetime
+from pathlib import Path
+import os
+import re
+import json
+import shutil
+import hashlib
+import base64
+import sqlite3
+import time
+import argparse
+import threading
+
+_THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_LOG_DIR = os.path.join(_THIS_DIR, "chat_logs")
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    pk INTEGER PRIMARY KEY AUTOINCREMENT,
+    log_name TEXT NOT NULL UNIQUE,
+    id TEXT NOT NULL,
+    project_name TEXT,
+    title TEXT,
+    summary TEXT,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL,
+    is_latest INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS idx_conversations_project ON conversations(project_name, created_at);
+CREATE INDEX IF NOT EXISTS idx_conversations_id ON conversations(id, created_at);
+CREATE INDEX IF NOT EXISTS idx_conversations_created ON conversations(created_at);
+
+-- enrichment.keywords of each saved log, in rank order, for keyword filters
+CREATE TABLE IF NOT EXISTS conversation_keywords (
+    conversation_pk INTEGER NOT NULL REFERENCES conversations(pk) ON DELETE CASCADE,
+    rank INTEGER NOT NULL,
+    keyword TEXT NOT NULL,
+    PRIMARY KEY (conversation_pk, rank)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_conversation_keywords ON conversation_keywords(keyword, conversation_pk);
+
+-- per-project counters over latest snapshots, maintained by upsert/delete so
+-- dashboard stats never scan messages. metric: conversations, messages,
+-- code_changes (key ''), type, tag, day_conversations, day_messages (key = value / YYYY-MM-DD)
+CREATE TABLE IF NOT EXISTS project_rollups (
+    project_name TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value INTEGER NOT NULL,
+    PRIMARY KEY (project_name, metric, key)
+) WITHOUT ROWID;
+
+-- single row bumped by triggers on every conversation write, from any process;
+-- store_id changes if the database is recreated. HTTP validators are built on it.
+CREATE TABLE IF NOT EXISTS store_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    store_id TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    modified_at INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO store_version (id, store_id, version, modified_at)
+VALUES (1, lower(hex(randomblob(8))), 0, CAST(strftime('%s', 'now') AS INTEGER));
+CREATE TRIGGER IF NOT EXISTS conversations_version_ai AFTER INSERT ON conversations BEGIN
+    UPDATE store_version SET version = version + 1, modified_at = CAST(strftime('%s', 'now') AS INTEGER) WHERE id = 1;
+END;
+CREATE TRIGGER IF NOT EXISTS conversations_version_au AFTER UPDATE ON conversations BEGIN
+    UPDATE store_version SET version = version + 1, modified_at = CAST(strftime('%s', 'now') AS INTEGER) WHERE id = 1;
+END;
+CREATE TRIGGER IF NOT EXISTS conversations_version_ad AFTER DELETE ON conversations BEGIN
+    UPDATE store_version SET version = version + 1, modified_at = CAST(strftime('%s', 'now') AS INTEGER) WHERE id = 1;
+END;
+
+-- sha1(text) -> text, shared by every message / snapshot that uses it
+CREATE TABLE IF NOT EXISTS blobs (
+    hash BLOB PRIMARY KEY,
+    text TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+MESSAGES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    conversation_pk INTEGER NOT NULL REFERENCES conversations(pk) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    content_hash BLOB,
+    timestamp TEXT,
+    type TEXT,
+    tags TEXT,
+    ai_model TEXT,
+    before_hash BLOB,
+    after_hash BLOB,
+    PRIMARY KEY (conversation_pk, position)
+)
+"""
+
+# created after _migrate() has added is_latest to stores from older versions
+LATEST_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_conversations_latest ON conversations(is_latest, created_at);
+CREATE INDEX IF NOT EXISTS idx_conversations_project_latest ON conversations(project_name, is_latest, created_at);
+"""
+
+_MESSAGE_SELECT = """
+    SELECT COALESCE(bc.text, '') AS content, m.timestamp, m.type, m.tags, m.ai_model,
+           COALESCE(bb.text, '') AS before_code, COALESCE(ba.text, '') AS after_code
+    FROM messages m
+    LEFT JOIN blobs bc ON bc.hash = m.content_hash
+    LEFT JOIN blobs bb ON bb.hash = m.before_hash
+    LEFT JOIN blobs ba ON ba.hash = m.after_hash
+"""
+
+# One row per conversation (title/summary, position -1) and one per message
+# (content/code) in search_docs, indexed by an external-content FTS5 table
+# keyed on its rowid. Triggers keep the index in step, so dropping a
+# conversation's rows is an indexed delete rather than a scan of the index.
+FTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS search_docs (
+    id INTEGER PRIMARY KEY,
+    conversation_pk INTEGER NOT NULL REFERENCES conversations(pk) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    title TEXT NOT NULL DEFAULT '',
+    summary TEXT NOT NULL DEFAULT '',
+    content TEXT NOT NULL DEFAULT '',
+    code TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_search_docs_conversation ON search_docs(conversation_pk, position);
+CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5(
+    title,
+    summary,
+    content,
+    code,
+    content = 'search_docs',
+    content_rowid = 'id',
+    tokenize = 'unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS search_docs_ai AFTER INSERT ON search_docs BEGIN
+    INSERT INTO search_fts (rowid, title, summary, content, code)
+    VALUES (new.id, new.title, new.summary, new.content, new.code);
+END;
+CREATE TRIGGER IF NOT EXISTS search_docs_ad AFTER DELETE ON search_docs BEGIN
+    INSERT INTO search_fts (search_fts, rowid, title, summary, content, code)
+    VALUES ('delete', old.id, old.title, old.summary, old.content, old.code);
+END;
+"""
+
+
+class LogStore:
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(SCHEMA)
+        self._conn.execute(MESSAGES_SCHEMA)
+        self._migrate()
+        self._conn.executescript(LATEST_INDEXES)
+        if self._conn.execute("SELECT 1 FROM conversations LIMIT 1").fetchone() and not self._conn.execute(
+            "SELECT 1 FROM project_rollups LIMIT 1"
+        ).fetchone():
+            self.rebuild_rollups()  # store written before rollups existed
+        try:
+            legacy = self._conn.execute("SELECT sql FROM sqlite_master WHERE name = 'search_fts'").fetchone()
+            if legacy is not None and "content_rowid" not in legacy[0]:
+                # self-contained index from older versions: rebuilt below by the backfill
+                self._conn.execute("DROP TABLE search_fts")
+            self._conn.executescript(FTS_SCHEMA)
+            self.fts_enabled = True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5; search() reports it as unavailable
+            self.fts_enabled = False
+        self._conn.commit()
+        if self.fts_enabled:
+            self._backfill_search_index()
+
+    def _migrate(self) -> None:
+        """Bring stores written by older versions (inline message text, no is_latest) up to date."""
+        with self._lock, self._conn:
+            conversation_columns = {r[1] for r in self._conn.execute("PRAGMA table_info(conversations)")}
+            message_columns = {r[1] for r in self._conn.execute("PRAGMA table_info(messages)")}
+            if "is_latest" in conversation_columns and "content" not in message_columns:
+                return
+            self._conn.execute("BEGIN")  # one transaction: DDL would otherwise autocommit
+            if "is_latest" not in conversation_columns:
+                self._conn.execute("ALTER TABLE conversations ADD COLUMN is_latest INTEGER NOT NULL DEFAULT 0")
+                self._conn.execute(
+                    """
+                    UPDATE conversations SET is_latest = (pk = (
+                        SELECT c2.pk FROM conversations c2 WHERE c2.id = conversations.id
+                        ORDER BY c2.created_at DESC, c2.pk DESC LIMIT 1
+                    ))
+                    """
+                )
+            if "content" not in message_columns:
+                return
+            self._conn.execute("ALTER TABLE messages RENAME TO messages_inline")
+            self._conn.execute(MESSAGES_SCHEMA)
+            cursor = self._conn.execute(
+                """
+                SELECT conversation_pk, position, content, timestamp, type, tags, ai_model, before_code, after_code
+                FROM messages_inline
+                """
+            )
+            while True:
+                rows = cursor.fetchmany(1000)
+                if not rows:
+                    break
+                by_pk: Dict[int, List[Tuple[int, Dict[str, Any]]]] = {}
+                for r in rows:
+                    m = dict(r)
+                    m["tags"] = json.loads(m["tags"] or "[]")
+                    by_pk.setdefault(m["conversation_pk"], []).append((m["position"], m))
+                for pk, batch in by_pk.items():
+                    self._insert_messages(pk, batch, search=False)
+            self._conn.execute("DROP TABLE messages_inline")
+
+    # ---- writes ----
+    def upsert_conversation(
+        self,
+        payload: Dict[str, Any],
+        log_name: str,
+        created_at: Optional[str] = None,
+        messages: Optional[Iterable[Dict[str, Any]]] = None,
+    ) -> int:
+        """
+        Insert or replace one saved log (identified by its file stem).
+        `messages` may be any iterable (e.g. a generator over a large file); it is
+        consumed once, in batches, instead of payload["messages"].
+        """
+        created_at = created_at or datetime.now().isoformat(timespec="seconds")
+        if messages is None:
+            messages = payload.get("messages") or []
+            message_count = int(payload.get("message_count") or len(messages))
+        else:
+            message_count = int(payload.get("message_count") or 0)
+        conversation_id = str(payload.get("conversation_id") or payload.get("id") or log_name)
+        with self._lock, self._conn:
+            for latest_pk in self._latest_pks(conversation_id):
+                self._apply_rollup(latest_pk, -1)  # while its messages still exist
+            old = self._conn.execute("SELECT pk FROM conversations WHERE log_name = ?", (log_name,)).fetchone()
+            if old is not None and self.fts_enabled:
+                self._conn.execute("DELETE FROM search_docs WHERE conversation_pk = ?", (old[0],))
+            self._conn.execute("DELETE FROM conversations WHERE log_name = ?", (log_name,))
+            cur = self._conn.execute(
+                """
+                INSERT INTO conversations (log_name, id, project_name, title, summary, message_count, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    log_name,
+                    conversation_id,
+                    payload.get("project_name"),
+                    payload.get("title"),
+                    payload.get("summary"),
+                    message_count,
+                    created_at,
+                ),
+            )
+            pk = cur.lastrowid
+            keywords = (payload.get("enrichment") or {}).get("keywords") or []
+            self._conn.executemany(
+                "INSERT INTO conversation_keywords (conversation_pk, rank, keyword) VALUES (?, ?, ?)",
+                [(pk, rank, str(k)) for rank, k in enumerate(keywords)],
+            )
+            if self.fts_enabled:
+                self._insert_search_rows([(payload.get("title") or "", payload.get("summary") or "", "", "", pk, -1)])
+
+            batch: List[Tuple[int, Dict[str, Any]]] = []
+            for item in enumerate(messages):
+                batch.append(item)
+                if len(batch) >= 500:
+                    self._insert_messages(pk, batch)
+                    batch = []
+            if batch:
+                self._insert_messages(pk, batch)
+            self._refresh_latest(conversation_id)
+            for latest_pk in self._latest_pks(conversation_id):
+                self._apply_rollup(latest_pk, +1)
+        return pk
+
+    def _refresh_latest(self, conversation_id: str) -> None:
+        """Flag only the newest snapshot of `conversation_id` as latest."""
+        self._conn.execute(
+            """
+            UPDATE conversations SET is_latest = (pk = (
+                SELECT pk FROM conversations WHERE id = ? ORDER BY created_at DESC, pk DESC LIMIT 1
+            ))
+            WHERE id = ?
+            """,
+            (conversation_id, conversation_id),
+        )
+
+    def _latest_pks(self, conversation_id: str) -> List[int]:
+        return [r[0] for r in self._conn.execute(
+            "SELECT pk FROM conversations WHERE id = ? AND is_latest = 1", (conversation_id,)
+        )]
+
+    def _apply_rollup(self, pk: int, sign: int) -> None:
+        """Add (sign=+1) or remove (sign=-1) one snapshot's contribution to its project's rollups."""
+        row = self._conn.execute("SELECT project_name, created_at FROM conversations WHERE pk = ?", (pk,)).fetchone()
+        if row is None:
+            return
+        project = row[0] or ""
+        day = (row[1] or "")[:10]
+        counts: Dict[Tuple[str, str], int] = {("conversations", ""): 1, ("day_conversations", day): 1}
+        messages = 0
+        for msg_type, tags, has_diff in self._conn.execute(
+            """
+            SELECT type, tags, before_hash IS NOT NULL AND after_hash IS NOT NULL
+            FROM messages WHERE conversation_pk = ?
+            """,
+            (pk,),
+        ):
+            messages += 1
+            key = ("type", msg_type or "unknown")
+            counts[key] = counts.get(key, 0) + 1
+            for tag in set(json.loads(tags or "[]")):
+                counts[("tag", str(tag))] = counts.get(("tag", str(tag)), 0) + 1
+            if has_diff:
+                counts[("code_changes", "")] = counts.get(("code_changes", ""), 0) + 1
+        counts[("messages", "")] = messages
+        counts[("day_messages", day)] = messages
+        self._conn.executemany(
+            """
+            INSERT INTO project_rollups (project_name, metric, key, value) VALUES (?, ?, ?, ?)
+            ON CONFLICT (project_name, metric, key) DO UPDATE SET value = value + excluded.value
+            """,
+            [(project, metric, key, sign * n) for (metric, key), n in counts.items() if n],
+        )
+        if sign < 0:
+            self._conn.execute("DELETE FROM project_rollups WHERE project_name = ? AND value <= 0", (project,))
+
+    def rebuild_rollups(self) -> int:
+        """Recompute every project rollup from the latest snapshots. Returns the number of snapshots counted."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM project_rollups")
+            pks = [r[0] for r in self._conn.execute("SELECT pk FROM conversations WHERE is_latest = 1")]
+            for pk in pks:
+                self._apply_rollup(pk, +1)
+        return len(pks)
+
+    def _insert_messages(self, pk: int, batch: List[Tuple[int, Dict[str, Any]]], search: bool = True) -> None:
+        blobs: Dict[bytes, str] = {}
+        rows = []
+        for pos, m in batch:
+            content_hash = _blob_hash(m.get("content"), blobs)
+            before_hash = _blob_hash(m.get("before_code"), blobs)
+            after_hash = _blob_hash(m.get("after_code"), blobs)
+            rows.append((
+                pk,
+                pos,
+                content_hash,
+                m.get("timestamp"),
+                m.get("type"),
+                json.dumps(m.get("tags") or []),
+                m.get("ai_model"),
+                before_hash,
+                after_hash,
+            ))
+        self._conn.executemany("INSERT OR IGNORE INTO blobs (hash, text) VALUES (?, ?)", list(blobs.items()))
+        self._conn.executemany(
+            """
+            INSERT INTO messages (conversation_pk, position, content_hash, timestamp, type, tags, ai_model, before_hash, after_hash)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            rows,
+        )
+        if search and self.fts_enabled:
+            self._insert_search_rows([_message_search_row(pk, pos, m) for pos, m in batch])
+
+    def _insert_search_rows(self, rows: List[Tuple[Any, ...]]) -> None:
+        self._conn.executemany(
+            "INSERT INTO search_docs (title, summary, content, code, conversation_pk, position) VALUES (?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+
+    def _index_conversation(
+        self,
+        pk: int,
+        title: Optional[str],
+        summary: Optional[str],
+        messages: List[Dict[str, Any]],
+    ) -> None:
+        rows = [(title or "", summary or "", "", "", pk, -1)]
+        rows.extend(_message_search_row(pk, pos, m) for pos, m in enumerate(messages))
+        self._insert_search_rows(rows)
+
+    def _backfill_search_index(self) -> None:
+        """Index conversations stored before the search index existed."""
+        with self._lock, self._conn:
+            missing = self._conn.execute(
+                """
+                SELECT pk, title, summary FROM conversations
+                WHERE pk NOT IN (SELECT conversation_pk FROM search_docs WHERE position = -1)
+                """
+            ).fetchall()
+            for row in missing:
+                self._index_conversation(row["pk"], row["title"], row["summary"], self._messages_for(row["pk"]))
+
+    def import_json_logs(self, log_dir: str = DEFAULT_LOG_DIR) -> int:
+        """Import JSON logs not yet in the store. Returns the number imported."""
+        p = Path(log_dir)
+        if not p.is_dir():
+            return 0
+        with self._lock:
+            known = {r[0] for r in self._conn.execute("SELECT log_name FROM conversations")}
+        imported = 0
+        for fpath in p.glob("*.json"):
+            # dotfiles are temporaries of an in-progress atomic write
+            if fpath.name.startswith(".") or fpath.stem in known:
+                continue
+            try:
+                with fpath.open("r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except Exception:
+                continue
+            created_at = datetime.fromtimestamp(fpath.stat().st_mtime).isoformat(timespec="seconds")
+            self.upsert_conversation(data, fpath.stem, created_at)
+            imported += 1
+        return imported
+
+    def import_export(self, export_dir: str) -> int:
+        """
+        Import a log_export directory (logs not yet in the store), reading only
+        the columns the store keeps. Returns the number imported.
+        """
+        from itertools import islice
+        from log_export import CorpusReader
+
+        reader = CorpusReader(export_dir)
+        with self._lock:
+            known = {r[0] for r in self._conn.execute("SELECT log_name FROM conversations")}
+        message_columns = ["content", "timestamp", "type", "tags", "ai_model", "before_code", "after_code"]
+        conversation_columns = [
+            "log_name", "id", "project_name", "title", "summary", "message_count", "created_at", "message_rows",
+        ]
+        if reader.has_column("conversations", "enrichment"):
+            conversation_columns.append("enrichment")  # keywords for the keyword filter
+        messages = reader.read("messages", message_columns)
+        imported = 0
+        for convo in reader.read("conversations", conversation_columns):
+            batch = islice(messages, convo["message_rows"])  # messages are stored in conversation order
+            if convo["log_name"] in known:
+                for _ in batch:
+                    pass
+                continue
+            self.upsert_conversation(convo, convo["log_name"], convo["created_at"], messages=batch)
+            imported += 1
+        return imported
+
+    def delete_log(self, log_name: str) -> bool:
+        """Remove one saved log (and its messages / search rows); blobs are left for gc_blobs()."""
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT pk, id FROM conversations WHERE log_name = ?", (log_name,)).fetchone()
+            if row is None:
+                return False
+            for latest_pk in self._latest_pks(row[1]):
+                self._apply_rollup(latest_pk, -1)
+            if self.fts_enabled:
+                self._conn.execute("DELETE FROM search_docs WHERE conversation_pk = ?", (row[0],))
+            self._conn.execute("DELETE FROM conversations WHERE pk = ?", (row[0],))
+            self._refresh_latest(row[1])
+            for latest_pk in self._latest_pks(row[1]):
+                self._apply_rollup(latest_pk, +1)
+        return True
+
+    def gc_blobs(self) -> int:
+        """Drop blobs no message references any more. Returns the number removed."""
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                """
+                DELETE FROM blobs WHERE hash NOT IN (
+                    SELECT content_hash FROM messages WHERE content_hash IS NOT NULL
+                    UNION SELECT before_hash FROM messages WHERE before_hash IS NOT NULL
+                    UNION SELECT after_hash FROM messages WHERE after_hash IS NOT NULL
+                )
+                """
+            )
+            return cur.rowcount
+
+    def collapse_snapshots(self, log_dir: Optional[str] = None, dry_run: bool = False) -> Dict[str, int]:
+        """
+        Keep only the latest snapshot of every conversation: older rows are
+        deleted and, if `log_dir` is given, their JSON files are moved to
+        <log_dir>/archive (outside the watched directory).
+        """
+        with self._lock:
+            stale = [r[0] for r in self._conn.execute("SELECT log_name FROM conversations WHERE is_latest = 0")]
+        moved = 0
+        if not dry_run:
+            archive = os.path.join(log_dir, "archive") if log_dir else None
+            for log_name in stale:
+                if archive:
+                    src = os.path.join(log_dir, log_name + ".json")
+                    if os.path.exists(src):
+                        os.makedirs(archive, exist_ok=True)
+                        shutil.move(src, os.path.join(archive, log_name + ".json"))
+                        moved += 1
+                self.delete_log(log_name)
+        blobs = 0 if dry_run else self.gc_blobs()
+        return {"snapshots": len(stale), "files_archived": moved, "blobs_removed": blobs}
+
+    # ---- reads ----
+    def log_versions(self) -> Dict[str, str]:
+        """{log_name: created_at} for every stored log."""
+        with self._lock:
+            return {r[0]: r[1] for r in self._conn.execute("SELECT log_name, created_at FROM conversations")}
+
+    def data_version(self) -> Tuple[str, int, int]:
+        """(store id, write counter, unix time of the last write); persistent and shared by every process."""
+        with self._lock:
+            row = self._conn.execute("SELECT store_id, version, modified_at FROM store_version WHERE id = 1").fetchone()
+        return row[0], row[1], row[2]
+
+    def _messages_for(self, pk: int) -> List[Dict[str, Any]]:
+        rows = self._conn.execute(
+            _MESSAGE_SELECT + " WHERE m.conversation_pk = ? ORDER BY m.position",
+            (pk,),
+        ).fetchall()
+        out = []
+        for r in rows:
+            m = dict(r)
+            m["tags"] = json.loads(m["tags"] or "[]")
+            out.append(m)
+        return out
+
+    def list_conversations(
+        self,
+        project_name: Optional[str] = None,
+        limit: Optional[int] = None,
+        include_messages: bool = False,
+        latest_only: bool = True,
+    ) -> List[Dict[str, Any]]:
+        """Saved logs, newest first, optionally for one project (only the latest snapshots by default)."""
+        sql = "SELECT * FROM conversations"
+        where: List[str] = []
+        args: List[Any] = []
+        if latest_only:
+            where.append("is_latest = 1")
+        if project_name is not None:
+            where.append("project_name = ?")
+            args.append(project_name)
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY created_at DESC, pk DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            args.append(int(limit))
+        with self._lock:
+            rows = [dict(r) for r in self._conn.execute(sql, args).fetchall()]
+            if include_messages:
+                for r in rows:
+                    r["messages"] = self._messages_for(r["pk"])
+        return rows
+
+    def page_conversations(
+        self,
+        project_name: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: int = 50,
+        keyword: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        One page of conversation metadata (no message bodies), newest first,
+        latest snapshot per conversation id only, optionally only conversations
+        whose enrichment keywords include `keyword`.
+        `cursor` is the opaque value returned as the second element by the
+        previous page; None is returned once there is nothing left.
+        """
+        where: List[str] = ["c.is_latest = 1"]
+        args: List[Any] = []
+        if project_name is not None:
+            where.append("c.project_name = ?")
+            args.append(project_name)
+        if keyword:
+            where.append("c.pk IN (SELECT conversation_pk FROM conversation_keywords WHERE keyword = ?)")
+            args.append(keyword.strip().lower())
+        if cursor:
+            created_at, pk = _decode_cursor(cursor)
+            where.append("(c.created_at < ? OR (c.created_at = ? AND c.pk < ?))")
+            args.extend([created_at, created_at, pk])
+        sql = """
+            SELECT c.*,
+                   (SELECT GROUP_CONCAT(DISTINCT m.type) FROM messages m
+                     WHERE m.conversation_pk = c.pk) AS message_types,
+                   EXISTS(SELECT 1 FROM messages m
+                     WHERE m.conversation_pk = c.pk AND m.before_hash IS NOT NULL AND m.after_hash IS NOT NULL) AS has_diff,
+                   (SELECT GROUP_CONCAT(k.keyword, char(31)) FROM
+                     (SELECT keyword FROM conversation_keywords WHERE conversation_pk = c.pk ORDER BY rank) k) AS keywords
+            FROM conversations c
+        """
+        sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY c.created_at DESC, c.pk DESC LIMIT ?"
+        args.append(int(limit) + 1)
+        with self._lock:
+            rows = [dict(r) for r in self._conn.execute(sql, args).fetchall()]
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor(rows[-1]["created_at"], rows[-1]["pk"])
+        for r in rows:
+            r["message_types"] = [t for t in (r["message_types"] or "").split(",") if t]
+            r["has_diff"] = bool(r["has_diff"])
+            r["keywords"] = (r["keywords"] or "").split("\x1f") if r["keywords"] else []
+        return rows, next_cursor
+
+    def search(
+        self,
+        query: str,
+        project_name: Optional[str] = None,
+        limit: int = 20,
+        offset: int = 0,
+        candidates: Optional[int] = None,
+    ) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Ranked full-text search over titles, summaries, message content and code.
+        Returns (hits, has_more); each hit names the conversation, the matching
+        message position (-1 for title/summary) and a snippet with **marked** terms.
+
+        bm25 ranks only the newest `candidates` matching rows (SEARCH_CANDIDATES,
+        default 2000), so common terms cost about as much as rare ones; the set is
+        widened when the filters leave too few hits for the requested page.
+        """
+        if not self.fts_enabled:
+            raise RuntimeError("Full-text search needs SQLite with FTS5")
+        match = _fts_query(query)
+        if not match:
+            return [], False
+
+        sql = """
+            SELECT c.id, c.project_name, c.title, c.summary, c.message_count, c.created_at,
+                   d.position,
+                   snippet(search_fts, -1, '**', '**', '...', 16) AS snippet,
+                   bm25(search_fts, 4.0, 2.0, 1.0, 1.0) AS score
+            FROM search_fts f
+            JOIN search_docs d ON d.id = f.rowid
+            JOIN conversations c ON c.pk = d.conversation_pk
+            WHERE search_fts MATCH ? AND f.rowid >= ? AND c.is_latest = 1
+        """
+        filters: List[Any] = []
+        if project_name is not None:
+            sql += " AND c.project_name = ?"
+            filters.append(project_name)
+        sql += " ORDER BY score LIMIT ? OFFSET ?"
+        wanted = int(limit) + 1
+        bound = candidates or int(os.getenv("SEARCH_CANDIDATES", "2000"))
+        with self._lock:
+            while True:
+                # rowids grow with insertion, so the newest `bound` matches are those at or above this one
+                newest = self._conn.execute(
+                    "SELECT rowid FROM search_fts WHERE search_fts MATCH ? ORDER BY rowid DESC LIMIT 1 OFFSET ?",
+                    (match, bound - 1),
+                ).fetchone()
+                floor = newest[0] if newest is not None else 0
+                rows = [
+                    dict(r) for r in self._conn.execute(sql, [match, floor, *filters, wanted, int(offset)]).fetchall()
+                ]
+                if len(rows) >= wanted or newest is None:
+                    break
+                bound *= 4
+        return rows[:limit], len(rows) > limit
+
+    def get_conversation(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """Latest saved version of a conversation, with its messages."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM conversations WHERE id = ? ORDER BY created_at DESC, pk DESC LIMIT 1",
+                (conversation_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            out = dict(row)
+            out["messages"] = self._messages_for(out["pk"])
+            out["keywords"] = [
+                r[0] for r in self._conn.execute(
+                    "SELECT keyword FROM conversation_keywords WHERE conversation_pk = ? ORDER BY rank", (out["pk"],)
+                )
+            ]
+        return out
+
+    def project_stats(self, project_name: str, bucket: str = "day", tag_limit: int = 20) -> Optional[Dict[str, Any]]:
+        """
+        Precomputed rollups for one project (latest snapshots only): totals, counts
+        by message type and tag, activity per day / week / month, and the latest
+        conversation. None if the project has no conversations.
+        """
+        if bucket not in ("day", "week", "month"):
+            raise ValueError("bucket must be day, week or month")
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT metric, key, value FROM project_rollups WHERE project_name = ?", (project_name,)
+            ).fetchall()
+            latest = self._conn.execute(
+                """
+                SELECT id, title, summary, message_count, created_at FROM conversations
+                WHERE project_name IS ? AND is_latest = 1
+                ORDER BY created_at DESC, pk DESC LIMIT 1
+                """,
+                (project_name or None,),
+            ).fetchone()
+        if not rows:
+            return None
+
+        totals: Dict[str, int] = {}
+        types: Dict[str, int] = {}
+        tags: Dict[str, int] = {}
+        activity: Dict[str, Dict[str, int]] = {}
+        for metric, key, value in rows:
+            if metric in ("conversations", "messages", "code_changes"):
+                totals[metric] = value
+            elif metric == "type":
+                types[key] = value
+            elif metric == "tag":
+                tags[key] = value
+            elif metric in ("day_conversations", "day_messages"):
+                entry = activity.setdefault(_time_bucket(key, bucket), {"conversations": 0, "messages": 0})
+                entry[metric[4:]] += value
+        top_tags = sorted(tags.items(), key=lambda kv: (-kv[1], kv[0]))[:tag_limit]
+        return {
+            "project_name": project_name,
+            "conversations": totals.get("conversations", 0),
+            "messages": totals.get("messages", 0),
+            "code_changes": totals.get("code_changes", 0),
+            "types": dict(sorted(types.items(), key=lambda kv: -kv[1])),
+            "tags": dict(top_tags),
+            "activity": [{"bucket": b, **counts} for b, counts in sorted(activity.items())],
+            "latest": dict(latest) if latest is not None else None,
+        }
+
+    def project_counts(self) -> List[Dict[str, Any]]:
+        """[{project_name, updates}] ordered by most recent activity; updates counts conversations, not snapshots."""
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT project_name, COUNT(*) AS updates, MAX(created_at) AS last_update
+                FROM conversations WHERE is_latest = 1
+                GROUP BY project_name ORDER BY last_update DESC
+                """
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+
+class LogDirectoryWatcher:
+    """
+    Keeps a LogStore in sync with a chat_logs directory by cheap polling.
+    Each poll lists *.json (not dotfiles) with their (mtime, size); only new or changed files
+    are parsed, vanished files are removed from the store. `generation` is
+    bumped and `last_modified` advanced whenever something changed; both are
+    per-process, so HTTP validators use LogStore.data_version() instead.
+    """
+
+    def __init__(self, store: LogStore, log_dir: str = DEFAULT_LOG_DIR, min_interval: float = 1.0):
+        self.store = store
+        self.log_dir = log_dir
+        self.min_interval = min_interval
+        self.generation = 0
+        self.last_modified = 0.0
+        self._seen: Optional[Dict[str, Tuple[float, int]]] = None
+        self._last_poll = 0.0
+        self._lock = threading.Lock()
+
+    def _scan(self) -> Dict[str, Tuple[float, int]]:
+        found: Dict[str, Tuple[float, int]] = {}
+        try:
+            with os.scandir(self.log_dir) as it:
+                for entry in it:
+                    # dotfiles are temporaries of an in-progress atomic write
+                    if entry.is_file() and entry.name.endswith(".json") and not entry.name.startswith("."):
+                        st = entry.stat()
+                        found[entry.name[:-5]] = (st.st_mtime, st.st_size)
+        except FileNotFoundError:
+            pass
+        return found
+
+    def _load(self, log_name: str, mtime: float) -> None:
+        try:
+            with open(os.path.join(self.log_dir, log_name + ".json"), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception:
+            return  # half-written or invalid; the next poll will retry if it changes
+        self.store.upsert_conversation(
+            data, log_name, datetime.fromtimestamp(mtime).isoformat(timespec="seconds")
+        )
+
+    def poll(self, force: bool = False) -> bool:
+        """Sync changes since the last poll (rate-limited to `min_interval`). Returns True if anything changed."""
+        with self._lock:
+            now = time.monotonic()
+            if not force and self._seen is not None and now - self._last_poll < self.min_interval:
+                return False
+            self._last_poll = now
+
+            current = self._scan()
+            first = self._seen is None
+            previous = self._seen or {}
+            touched = [name for name, sig in current.items() if previous.get(name) != sig]
+            removed = [name for name in previous if name not in current]
+
+            if touched:
+                stored = self.store.log_versions()
+                for name in touched:
+                    mtime = current[name][0]
+                    created_at = stored.get(name)
+                    # the logger upserts right after writing its JSON; only parse files the
+                    # store has not seen or that were edited after it stored them
+                    if created_at is None or datetime.fromtimestamp(int(mtime)) > datetime.fromisoformat(created_at):
+                        self._load(name, mtime)
+            for name in removed:
+                self.store.delete_log(name)
+
+            self._seen = current
+            changed = first or bool(touched or removed)
+            if changed:
+                self.generation += 1
+                newest = max((sig[0] for sig in current.values()), default=0.0)
+                self.last_modified = max(self.last_modified, newest, time.time() if removed else 0.0)
+            return changed
+
+
+def _blob_hash(text: Any, blobs: Dict[bytes, str]) -> Optional[bytes]:
+    """sha1 of `text` (None for empty), recording the blob to insert."""
+    if not text:
+        return None
+    text = str(text)
+    digest = hashlib.sha1(text.encode("utf-8")).digest()
+    blobs[digest] = text
+    return digest
+
+
+def _time_bucket(day: str, bucket: str) -> str:
+    """YYYY-MM-DD -> the day itself, its ISO week (YYYY-Www) or its month (YYYY-MM)."""
+    if bucket == "month":
+        return day[:7]
+    if bucket == "week":
+        try:
+            year, week, _ = datetime.strptime(day, "%Y-%m-%d").isocalendar()
+            return f"{year}-W{week:02d}"
+        except ValueError:
+            return day
+    return day
+
+
+def _message_search_row(pk: int, pos: int, m: Dict[str, Any]) -> Tuple[Any, ...]:
+    code = "\n".join(c for c in (m.get("before_code"), m.get("after_code")) if c)
+    return ("", "", m.get("content") or "", code, pk, pos)
+
+
+def _fts_query(query: str) -> str:
+    """Turn free text into a safe FTS5 query: every word required, last one as a prefix."""
+    terms = _WORD.findall(query or "")
+    if not terms:
+        return ""
+    quoted = [f'"{t}"' for t in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def _encode_cursor(created_at: str, pk: int) -> str:
+    return base64.urlsafe_b64encode(f"{created_at}|{pk}".encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        created_at, pk = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").rsplit("|", 1)
+        return created_at, int(pk)
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+
+
+def default_store_path(log_dir: str = DEFAULT_LOG_DIR) -> str:
+    return os.getenv("CHAT_LOG_DB") or os.path.join(log_dir, "chat_logs.sqlite3")
+
+
+@lru_cache(maxsize=None)
+def get_log_store(path: Optional[str] = None) -> LogStore:
+    return LogStore(path or default_store_path())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Chat log store utilities")
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="import existing JSON logs into the SQLite store")
+    imp.add_argument("log_dir", nargs="?", default=DEFAULT_LOG_DIR)
+    imp.add_argument("--db", default=None, help="store path (default: <log_dir>/chat_logs.sqlite3)")
+    imp.add_argument("--from-export", default=None, help="read a log_export.py directory instead of JSON files")
+    dedupe = sub.add_parser("dedupe", help="keep only the latest snapshot of each conversation")
+    dedupe.add_argument("log_dir", nargs="?", default=DEFAULT_LOG_DIR)
+    dedupe.add_argument("--db", default=None, help="store path (default: <log_dir>/chat_logs.sqlite3)")
+    dedupe.add_argument("--dry-run", action="store_true")
+    rollups = sub.add_parser("rollups", help="recompute the per-project rollups behind /api/projects/<name>/stats")
+    rollups.add_argument("log_dir", nargs="?", default=DEFAULT_LOG_DIR)
+    rollups.add_argument("--db", default=None, help="store path (default: <log_dir>/chat_logs.sqlite3)")
+    args = parser.parse_args()
+
+    if args.command == "import":
+        store = LogStore(args.db or default_store_path(args.log_dir))
+        if args.from_export:
+            count = store.import_export(args.from_export)
+        else:
+            count = store.import_json_logs(args.log_dir)
+        print(f"Imported {count} log(s) into {store.path}")
+    elif args.command == "dedupe":
+        store = LogStore(args.db or default_store_path(args.log_dir))
+        store.import_json_logs(args.log_dir)  # every snapshot on disk must be known before collapsing
+        result = store.collapse_snapshots(args.log_dir, dry_run=args.dry_run)
+        verb = "Would collapse" if args.dry_run else "Collapsed"
+        print(
+            f"{verb} {result['snapshots']} older snapshot(s); "
+            f"{result['files_archived']} file(s) archived, {result['blobs_removed']} unused blob(s) removed"
+        )
+    elif args.command == "rollups":
+        store = LogStore(args.db or default_store_path(args.log_dir))
+        count = store.rebuild_rollups()
+        print(f"Rebuilt rollups from {count} conversation(s) across {len(store.project_counts())} project(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+In-process counters and latency histograms for the logging pipeline.
+
+Recording is a dict update under a lock, cheap enough to leave on. Each process
+(MCP server, queue worker) periodically writes its snapshot to
+cache/metrics/<pid>.json so the dashboard can serve the combined view as
+Prometheus text at /metrics; the MCP server also exposes its own through the
+get_metrics tool. Disable file snapshots with METRICS_DIR="".
+"""
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from contextlib import contextmanager
+import os
+import json
+import time
+import tempfile
+import threading
+
+_THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_METRICS_DIR = os.path.join(_THIS_DIR, "cache", "metrics")
+PREFIX = "chat_logger_"
+
+# seconds; covers regex extraction (sub-ms) up to slow LLM calls
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _key(name: str, labels: Dict[str, Any]) -> _Key:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Metrics:
+    def __init__(self, snapshot_dir: Optional[str] = None, flush_interval: float = 5.0):
+        self.snapshot_dir = snapshot_dir
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._counters: Dict[_Key, float] = {}
+        self._histograms: Dict[_Key, List[float]] = {}  # bucket counts..., +Inf count, sum
+        self._last_flush = time.monotonic()
+
+    # ---- recording ----
+    def inc(self, name: str, value: float = 1.0, **labels: Any) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+        self._maybe_flush()
+
+    def observe(self, name: str, seconds: float, **labels: Any) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [0.0] * (len(BUCKETS) + 2)
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    hist[i] += 1
+            hist[len(BUCKETS)] += 1
+            hist[-1] += seconds
+        self._maybe_flush()
+
+    @contextmanager
+    def timer(self, name: str, **labels: Any) -> Iterator[None]:
+        """Observe the block's duration; exceptions are counted under errors_total and re-raised."""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.inc("errors_total", stage=labels.get("stage", name), cause=type(e).__name__)
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    # ---- reading ----
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "counters": [
+                    {"name": n, "labels": dict(l), "value": v} for (n, l), v in self._counters.items()
+                ],
+                "histograms": [
+                    {"name": n, "labels": dict(l), "buckets": h[:len(BUCKETS)], "count": h[len(BUCKETS)], "sum": h[-1]}
+                    for (n, l), h in self._histograms.items()
+                ],
+            }
+
+    def flush(self) -> None:
+        """Write this process's snapshot atomically to <snapshot_dir>/<pid>.json."""
+        self._last_flush = time.monotonic()
+        if not self.snapshot_dir:
+            return
+        try:
+            os.makedirs(self.snapshot_dir, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(prefix=".tmp_", suffix=".json", dir=self.snapshot_dir)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp, os.path.join(self.snapshot_dir, f"{os.getpid()}.json"))
+        except OSError:
+            pass  # metrics must never break the pipeline
+
+    def _maybe_flush(self) -> None:
+        if self.snapshot_dir and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+
+def merge_snapshots(snapshots: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Sum counters and histograms with the same name and labels."""
+    counters: Dict[_Key, float] = {}
+    histograms: Dict[_Key, Dict[str, Any]] = {}
+    for snap in snapshots:
+        for c in snap.get("counters", []):
+            key = _key(c["name"], c["labels"])
+            counters[key] = counters.get(key, 0.0) + c["value"]
+        for h in snap.get("histograms", []):
+            key = _key(h["name"], h["labels"])
+            acc = histograms.setdefault(key, {"buckets": [0.0] * len(BUCKETS), "count": 0.0, "sum": 0.0})
+            acc["buckets"] = [a + b for a, b in zip(acc["buckets"], h["buckets"])]
+            acc["count"] += h["count"]
+            acc["sum"] += h["sum"]
+    return {
+        "counters": [{"name": n, "labels": dict(l), "value": v} for (n, l), v in counters.items()],
+        "histograms": [{"name": n, "labels": dict(l), **h} for (n, l), h in histograms.items()],
+    }
+
+
+def read_snapshots(directory: Optional[str] = None, exclude_pid: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Every process snapshot in `directory` (optionally skipping one process, e.g. the caller's own)."""
+    directory = directory or DEFAULT_METRICS_DIR
+    snapshots = []
+    if not os.path.isdir(directory):
+        return snapshots
+    for name in os.listdir(directory):
+        if not name.endswith(".json") or name.startswith(".") or name == f"{exclude_pid}.json":
+            continue
+        try:
+            with open(os.path.join(directory, name), "r", encoding="utf-8") as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def _labels_text(labels: Dict[str, str], extra: Optional[Tuple[str, str]] = None) -> str:
+    items = sorted(labels.items()) + ([extra] if extra else [])
+    if not items:
+        return ""
+    escaped = (
+        f'{k}="' + str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for k, v in items
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _number(value: float) -> str:
+    """Full precision: `:g` keeps 6 digits, which hides small increments once a counter passes 1e6."""
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def render_prometheus(snapshot: Dict[str, Any]) -> str:
+    """Prometheus text exposition format (version 0.0.4)."""
+    lines: List[str] = []
+    typed = set()
+    for c in sorted(snapshot.get("counters", []), key=lambda c: (c["name"], sorted(c["labels"].items()))):
+        name = PREFIX + c["name"]
+        if name not in typed:
+            lines.append(f"# TYPE {name} counter")
+            typed.add(name)
+        lines.append(f"{name}{_labels_text(c['labels'])} {_number(c['value'])}")
+    for h in sorted(snapshot.get("histograms", []), key=lambda h: (h["name"], sorted(h["labels"].items()))):
+        name = PREFIX + h["name"]
+        if name not in typed:
+            lines.append(f"# TYPE {name} histogram")
+            typed.add(name)
+        for bound, count in zip(BUCKETS, h["buckets"]):
+            lines.append(f"{name}_bucket{_labels_text(h['labels'], ('le', f'{bound:g}'))} {_number(count)}")
+        lines.append(f"{name}_bucket{_labels_text(h['labels'], ('le', '+Inf'))} {_number(h['count'])}")
+        lines.append(f"{name}_sum{_labels_text(h['labels'])} {h['sum']:.6f}")
+        lines.append(f"{name}_count{_labels_text(h['labels'])} {_number(h['count'])}")
+    return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics(
+    snapshot_dir=os.getenv("METRICS_DIR", DEFAULT_METRICS_DIR),
+    flush_interval=float(os.getenv("METRICS_FLUSH_INTERVAL", "5")),
+)
@@ -0,0 +1,236 @@
+"""
+ONNX Runtime int8 backend for the sentence-embedding model (EMBED_BACKEND=onnx-int8).
+
+On first use the SentenceTransformer's transformer is exported to ONNX, its
+weights are dynamically quantized to int8 and the result is cached with the
+tokenizer under cache/onnx/<model>/; later runs need only onnxruntime and
+tokenizers, not torch. Pooling matches all-MiniLM-L6-v2 (attention-masked mean,
+then L2 normalisation). EMBED_THREADS sets ONNX Runtime's intra-op threads.
+
+    python onnx_embedder.py export [--force]
+    python onnx_embedder.py check [--log-dir DIR] [--limit N] [--min-agreement 0.99]
+"""
+from typing import Any, Dict, List, Optional
+from functools import lru_cache
+import os
+import sys
+import json
+import shutil
+import argparse
+import numpy as np
+
+_THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_ONNX_DIR = os.path.join(_THIS_DIR, "cache", "onnx")
+MODEL_FILE = "model-int8.onnx"
+INPUT_NAMES = ("input_ids", "attention_mask", "token_type_ids")
+
+
+def model_dir(model_name: str, root: str = DEFAULT_ONNX_DIR) -> str:
+    return os.path.join(root, model_name.replace("/", "__"))
+
+
+def export_model(model_name: str, out_dir: str) -> Dict[str, Any]:
+    """Export + int8-quantize `model_name` into `out_dir` (needs torch and sentence-transformers once)."""
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    st = SentenceTransformer(model_name, device="cpu")
+    transformer = st[0].auto_model.eval()
+    tokenizer = st[0].tokenizer
+
+    tmp_dir = out_dir.rstrip(os.sep) + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    tokenizer.save_pretrained(tmp_dir)  # writes tokenizer.json for the fast tokenizer
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    fp32_path = os.path.join(tmp_dir, "model-fp32.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(sample[name] for name in INPUT_NAMES),
+            fp32_path,
+            input_names=list(INPUT_NAMES),
+            output_names=["last_hidden_state", "pooler_output"],
+            dynamic_axes={
+                **{name: {0: "batch", 1: "sequence"} for name in INPUT_NAMES},
+                "last_hidden_state": {0: "batch", 1: "sequence"},
+            },
+            opset_version=14,
+        )
+    quantize_dynamic(fp32_path, os.path.join(tmp_dir, MODEL_FILE), weight_type=QuantType.QInt8)
+    os.remove(fp32_path)
+
+    meta = {
+        "model": model_name,
+        "max_length": int(st.max_seq_length),
+        "dim": int(st.get_sentence_embedding_dimension()),
+        "normalize": any(type(m).__name__ == "Normalize" for m in st),
+        "quantization": "dynamic-int8",
+    }
+    with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    return meta
+
+
+class OnnxEmbedder:
+    """encode(sentences) -> float32 (n, dim), like SentenceTransformer.encode."""
+
+    def __init__(self, directory: str, threads: int = 0, batch_size: int = 64):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.batch_size = batch_size
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.inter_op_num_threads = 1
+        if threads:
+            options.intra_op_num_threads = threads
+        self._session = ort.InferenceSession(
+            os.path.join(directory, MODEL_FILE), options, providers=["CPUExecutionProvider"]
+        )
+        self._inputs = {i.name for i in self._session.get_inputs()}
+        self._tokenizer = Tokenizer.from_file(os.path.join(directory, "tokenizer.json"))
+        self._tokenizer.enable_truncation(max_length=self.meta["max_length"])
+        pad_id = self._tokenizer.token_to_id("[PAD]") or 0
+        self._tokenizer.enable_padding(pad_id=pad_id, pad_token="[PAD]")
+
+    def encode(self, sentences: List[str], batch_size: Optional[int] = None, **_: Any) -> np.ndarray:
+        sentences = list(sentences)
+        out = np.zeros((len(sentences), self.meta["dim"]), dtype=np.float32)
+        if not sentences:
+            return out
+        size = batch_size or self.batch_size
+        # length-sorted batches keep padding (and wasted compute) small
+        order = sorted(range(len(sentences)), key=lambda i: len(sentences[i]))
+        for start in range(0, len(order), size):
+            idx = order[start:start + size]
+            encodings = self._tokenizer.encode_batch([sentences[i] for i in idx])
+            feed = {
+                "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+                "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+            }
+            hidden = self._session.run(["last_hidden_state"], {k: v for k, v in feed.items() if k in self._inputs})[0]
+            mask = feed["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            if self.meta.get("normalize", True):
+                pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            out[idx] = pooled
+        return out
+
+
+@lru_cache(maxsize=None)
+def get_onnx_embedder(model_name: str, threads: int = 0) -> OnnxEmbedder:
+    """Load the cached int8 model, exporting it first if this host has none yet."""
+    directory = model_dir(model_name, os.getenv("ONNX_MODEL_DIR") or DEFAULT_ONNX_DIR)
+    if not os.path.exists(os.path.join(directory, MODEL_FILE)):
+        export_model(model_name, directory)
+    return OnnxEmbedder(directory, threads=threads)
+
+
+# ---- accuracy check against the torch backend ----
+def _sample_contents(log_dir: str, limit: int) -> List[str]:
+    contents: List[str] = []
+    if os.path.isdir(log_dir):
+        for name in sorted(os.listdir(log_dir)):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(log_dir, name), "r", encoding="utf-8") as f:
+                    messages = json.load(f).get("messages") or []
+            except Exception:
+                continue
+            contents.extend(str(m.get("content", "") or "") for m in messages)
+            if len(contents) >= limit:
+                break
+    if not contents:
+        # no saved logs here: fall back to the benchmark's synthetic messages
+        import random
+        from benchmark import make_message
+        rng = random.Random(0)
+        contents = [make_message(rng, 400, 0.3) for _ in range(limit)]
+    return [c for c in contents if c.strip()][:limit]
+
+
+def check_backend(contents: List[str], backend: str = "onnx-int8", reference: str = "torch") -> Dict[str, Any]:
+    """
+    Compare `backend` with `reference` on the decisions the logger derives from
+    embeddings: router labels (from concept scores) and the top feature/bug-fix
+    sentence per message; plus raw sentence-embedding cosine similarity.
+    """
+    from process import SEMANTIC_CONCEPTS, _encode, batch_semantic_matches, split_sentences
+    from llm_router import route_message
+
+    expected = batch_semantic_matches(contents, backend=reference)
+    actual = batch_semantic_matches(contents, backend=backend)
+    route_agree = top_agree = decisions = 0
+    disagreements: List[Dict[str, Any]] = []
+    for content, e, a in zip(contents, expected, actual):
+        e_route, a_route = route_message(content, e), route_message(content, a)
+        same_route = (e_route.use_llm, e_route.type) == (a_route.use_llm, a_route.type)
+        route_agree += same_route
+        for concept in SEMANTIC_CONCEPTS:
+            decisions += 1
+            top_agree += e[concept][:1] == a[concept][:1]
+        if not same_route and len(disagreements) < 20:
+            disagreements.append({
+                "content": content[:120],
+                reference: e_route.type if not e_route.use_llm else "llm",
+                backend: a_route.type if not a_route.use_llm else "llm",
+            })
+
+    sentences = [s for c in contents for s in split_sentences(c)][:5000]
+    cosine = np.ones(0)
+    if sentences:
+        ref_vectors = np.asarray(_encode(sentences, reference), dtype=np.float32)
+        got_vectors = np.asarray(_encode(sentences, backend), dtype=np.float32)
+        cosine = (ref_vectors * got_vectors).sum(axis=1) / np.clip(
+            np.linalg.norm(ref_vectors, axis=1) * np.linalg.norm(got_vectors, axis=1), 1e-12, None
+        )
+    return {
+        "backend": backend,
+        "reference": reference,
+        "messages": len(contents),
+        "route_agreement": (route_agree / len(contents)) if contents else 1.0,
+        "top_sentence_agreement": (top_agree / decisions) if decisions else 1.0,
+        "sentences": len(sentences),
+        "cosine_mean": float(cosine.mean()) if cosine.size else 1.0,
+        "cosine_min": float(cosine.min()) if cosine.size else 1.0,
+        "disagreements": disagreements,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="ONNX int8 embedding backend")
+    sub = parser.add_subparsers(dest="command", required=True)
+    exp = sub.add_parser("export", help="export and quantize the semantic model into the local cache")
+    exp.add_argument("--force", action="store_true", help="re-export even if a cached model exists")
+    chk = sub.add_parser("check", help="compare tag decisions with the torch backend on a sample corpus")
+    chk.add_argument("--log-dir", default=os.path.join(_THIS_DIR, "chat_logs"))
+    chk.add_argument("--limit", type=int, default=2000)
+    chk.add_argument("--min-agreement", type=float, default=0.99)
+    args = parser.parse_args()
+
+    from process import SEMANTIC_MODEL_NAME
+
+    if args.command == "export":
+        directory = model_dir(SEMANTIC_MODEL_NAME, os.getenv("ONNX_MODEL_DIR") or DEFAULT_ONNX_DIR)
+        if args.force or not os.path.exists(os.path.join(directory, MODEL_FILE)):
+            export_model(SEMANTIC_MODEL_NAME, directory)
+        size = os.path.getsize(os.path.join(directory, MODEL_FILE))
+        print(f"{SEMANTIC_MODEL_NAME} -> {directory} ({size / 1e6:.1f} MB int8)")
+    elif args.command == "check":
+        report = check_backend(_sample_contents(args.log_dir, args.limit))
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        if min(report["route_agreement"], report["top_sentence_agreement"]) < args.min_agreement:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,21 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Callable, Optional, Protocol, Tuple, TYPE_CHECKING
 from functools import lru_cache
+import os
 import re
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
-from keybert import KeyBERT
+import time
+from lazy_imports import LazyModule, timed_import
+from metrics import METRICS
+
+if TYPE_CHECKING:
+    from keybert import KeyBERT
+
+# heavy (torch / scikit-learn) imports happen on first use, not at server start
+np = LazyModule("numpy")
+_pairwise = LazyModule("sklearn.metrics.pairwise")
+_embedding_cache = LazyModule("embedding_cache")
+_sklearn_text = LazyModule("sklearn.feature_extraction.text")
+
+SEMANTIC_MODEL_NAME = 'all-MiniLM-L6-v2'
 
 TAG_TO_TYPE_MAP = {
     'function added': 'feat',
@@ -20,41 +32,221 @@ SEMANTIC_CONCEPTS = {
     "bug_fix": "A developer is fixing, patching, or resolving a bug, error, issue, or problem in the software.",
 }
 
-@lru_cache(maxsize=1)
-def get_semantic_model() -> SentenceTransformer:
-    return SentenceTransformer('all-MiniLM-L6-v2')
+def cosine_similarity(a, b):
+    return _pairwise.cosine_similarity(a, b)
+
+# ---- Embedding backends ----
+class EmbeddingBackend(Protocol):
+    """Anything with SentenceTransformer's encode(sentences) -> (n, dim) array."""
+
+    def encode(self, sentences: List[str]) -> Any: ...
+
+def _embed_threads() -> int:
+    """EMBED_THREADS: intra-op threads for the embedding backend (0 = library default)."""
+    return max(0, int(os.getenv("EMBED_THREADS", "0")))
+
+def _torch_backend() -> EmbeddingBackend:
+    if _embed_threads():
+        timed_import("torch").set_num_threads(_embed_threads())
+    return timed_import("sentence_transformers").SentenceTransformer(SEMANTIC_MODEL_NAME)
+
+def _onnx_int8_backend() -> EmbeddingBackend:
+    # exported and quantized on first use, then loaded from cache/onnx
+    return timed_import("onnx_embedder").get_onnx_embedder(SEMANTIC_MODEL_NAME, threads=_embed_threads())
+
+EMBEDDING_BACKENDS: Dict[str, Callable[[], EmbeddingBackend]] = {
+    "torch": _torch_backend,
+    "onnx-int8": _onnx_int8_backend,
+}
+
+def embedding_backend_name() -> str:
+    """EMBED_BACKEND: one of EMBEDDING_BACKENDS (default torch)."""
+    return os.getenv("EMBED_BACKEND", "torch").strip().lower() or "torch"
+
+@lru_cache(maxsize=None)
+def get_embedding_backend(name: str) -> EmbeddingBackend:
+    if name not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown EMBED_BACKEND '{name}' (expected one of {', '.join(EMBEDDING_BACKENDS)})")
+    with METRICS.timer("model_load_seconds", model=SEMANTIC_MODEL_NAME, backend=name):
+        return EMBEDDING_BACKENDS[name]()
+
+def get_semantic_model() -> EmbeddingBackend:
+    """The configured embedding backend (loaded once per process)."""
+    return get_embedding_backend(embedding_backend_name())
 
 @lru_cache(maxsize=1)
-def get_kw_model() -> KeyBERT:
-    return KeyBERT(model=get_semantic_model())
+def get_kw_model() -> "KeyBERT":
+    model = get_semantic_model()
+    if embedding_backend_name() != "torch":
+        # KeyBERT only recognises SentenceTransformer models; wrap other backends
+        base = timed_import("keybert.backend").BaseEmbedder
+
+        class _BackendEmbedder(base):
+            def embed(self, documents, verbose=False):
+                return np.asarray(model.encode(list(documents)))
+
+        model = _BackendEmbedder()
+    return timed_import("keybert").KeyBERT(model=model)
 
 def get_type_from_tag(tag: str) -> str:
     return TAG_TO_TYPE_MAP.get(tag, 'Other')
 
-def find_semantic_matches(data: Dict[str, Any], analysis_type: str, top_n: int = 3) -> List[str]:
-    concept_text = SEMANTIC_CONCEPTS.get(analysis_type)
-    if not concept_text:
+@lru_cache(maxsize=None)
+def get_concept_embeddings(backend: Optional[str] = None) -> Dict[str, Any]:
+    """Encode every SEMANTIC_CONCEPTS entry once per process (and backend)."""
+    names = list(SEMANTIC_CONCEPTS.keys())
+    vectors = get_embedding_backend(backend or embedding_backend_name()).encode([SEMANTIC_CONCEPTS[n] for n in names])
+    return {name: vectors[i:i + 1] for i, name in enumerate(names)}
+
+def _concept_embedding(analysis_type: str, backend: Optional[str] = None):
+    if analysis_type not in SEMANTIC_CONCEPTS:
         raise ValueError(f"Analysis type '{analysis_type}' not found in SEMANTIC_CONCEPTS.")
+    return get_concept_embeddings(backend)[analysis_type]
+
+_SENTENCE_SPLIT = re.compile(r'[.!?]\s+')
+
+def split_sentences(content: str) -> List[str]:
+    return [s.strip() for s in _SENTENCE_SPLIT.split(content or '') if s.strip()]
 
-    MODEL = get_semantic_model()
-    concept_embedding = MODEL.encode([concept_text])
+def _encode(sentences: List[str], backend: Optional[str] = None):
+    """Embed sentences, going through the embedding cache so only unseen ones reach the model."""
+    backend = backend or embedding_backend_name()
+    start = time.perf_counter()
+    cache = _embedding_cache.get_embedding_cache()
+    if cache is None:
+        vectors = get_embedding_backend(backend).encode(sentences)
+    else:
+        # backends differ slightly (e.g. int8), so each gets its own cache keys
+        model_key = SEMANTIC_MODEL_NAME if backend == "torch" else f"{SEMANTIC_MODEL_NAME}/{backend}"
+        vectors = cache.encode(lambda batch: get_embedding_backend(backend).encode(batch), model_key, sentences)
+    METRICS.observe("embedding_seconds", time.perf_counter() - start, backend=backend)
+    METRICS.inc("sentences_embedded_total", len(sentences), backend=backend)
+    return vectors
+
+def get_embedding_cache_stats() -> Dict[str, Any]:
+    cache = _embedding_cache.get_embedding_cache()
+    return cache.stats() if cache is not None else {"enabled": False}
+
+def find_semantic_matches(data: Dict[str, Any], analysis_type: str, top_n: int = 3) -> List[str]:
+    concept_embedding = _concept_embedding(analysis_type)
 
     all_sentences: List[str] = []
     for msg in data.get('messages', []):
         content = msg.get('content', '') or ''
         if not content:
             continue
-        sentences = [s.strip() for s in re.split(r'[.!?]\s+', content) if s.strip()]
-        all_sentences.extend(sentences)
+        all_sentences.extend(split_sentences(content))
 
     if not all_sentences:
         return []
 
-    sentence_embeddings = MODEL.encode(all_sentences)
+    sentence_embeddings = _encode(all_sentences)
     sims = cosine_similarity(concept_embedding, sentence_embeddings)[0]
     ranked = sorted(zip(all_sentences, sims), key=lambda x: x[1], reverse=True)
     return [s for s, _ in ranked[:top_n]]
 
+def batch_semantic_matches(
+    contents: List[str],
+    analysis_types: Tuple[str, ...] = ("feature_development", "bug_fix"),
+    top_n: int = 10,
+    return_embeddings: bool = False,
+    backend: Optional[str] = None,
+):
+    """
+    Batched equivalent of calling find_semantic_matches once per message and concept.
+    All sentences of all messages are embedded in a single encode call and scored
+    against every concept with one similarity matrix; the ranking is then done per
+    message so the output matches the per-message path. Each entry also carries
+    "scores": {concept: best sentence similarity} (empty for empty messages).
+    With return_embeddings=True, also returns one vector per message (the
+    normalised mean of its sentence embeddings, None for empty messages).
+    `backend` overrides EMBED_BACKEND (used to compare backends).
+    """
+    concept_matrix = np.vstack([_concept_embedding(t, backend) for t in analysis_types])
+
+    sentences: List[str] = []
+    spans: List[Tuple[int, int]] = []
+    for content in contents:
+        start = len(sentences)
+        sentences.extend(split_sentences(content))
+        spans.append((start, len(sentences)))
+
+    results: List[Dict[str, Any]] = [{**{t: [] for t in analysis_types}, "scores": {}} for _ in contents]
+    if not sentences:
+        return (results, [None] * len(contents)) if return_embeddings else results
+
+    sentence_embeddings = _encode(sentences, backend)
+    sims = cosine_similarity(concept_matrix, sentence_embeddings)
+    for idx, (start, end) in enumerate(spans):
+        if start == end:
+            continue
+        local = sentences[start:end]
+        for row, analysis_type in enumerate(analysis_types):
+            ranked = sorted(zip(local, sims[row, start:end]), key=lambda x: x[1], reverse=True)
+            results[idx][analysis_type] = [s for s, _ in ranked[:top_n]]
+            results[idx]["scores"][analysis_type] = float(ranked[0][1])
+
+    if not return_embeddings:
+        return results
+    normed = sentence_embeddings / np.clip(
+        np.linalg.norm(sentence_embeddings, axis=1, keepdims=True), 1e-12, None
+    )
+    message_vectors = [normed[start:end].mean(axis=0) if end > start else None for start, end in spans]
+    return results, message_vectors
+
+KEYWORD_NGRAM_RANGE = (1, 2)
+
+def batch_keywords(
+    contents: List[str],
+    message_vectors: Optional[List[Any]] = None,
+    top_n: int = 6,
+    conversation_top_n: int = 10,
+) -> Tuple[List[List[Tuple[str, float]]], List[Tuple[str, float]]]:
+    """
+    KeyBERT keywords for every message and for the conversation as a whole, in one
+    extract_keywords call. The conversation is an extra document (all messages
+    joined); its embedding is the normalised mean of `message_vectors` (from
+    batch_semantic_matches(..., return_embeddings=True)), so documents are not
+    re-embedded. Candidate phrases are embedded once, through the embedding cache.
+    Returns (per-message [(keyword, score)], conversation [(keyword, score)]).
+    """
+    empty: Tuple[List[List[Tuple[str, float]]], List[Tuple[str, float]]] = ([[] for _ in contents], [])
+    if not any(c.strip() for c in contents):
+        return empty
+    docs = list(contents) + ["\n".join(contents)]
+
+    if message_vectors is None:
+        _, message_vectors = batch_semantic_matches(contents, return_embeddings=True)
+    present = [v for v in message_vectors if v is not None]
+    if not present:
+        return empty
+    dim = len(present[0])
+    conversation_vector = np.mean(np.vstack(present), axis=0)
+    conversation_vector = conversation_vector / max(float(np.linalg.norm(conversation_vector)), 1e-12)
+    doc_embeddings = np.vstack(
+        [v if v is not None else np.zeros(dim, dtype=np.float32) for v in message_vectors] + [conversation_vector]
+    )
+
+    # same vocabulary KeyBERT derives from the vectorizer, so the word embeddings line up
+    vectorizer = _sklearn_text.CountVectorizer(ngram_range=KEYWORD_NGRAM_RANGE, stop_words="english")
+    try:
+        words = list(vectorizer.fit(docs).get_feature_names_out())
+    except ValueError:
+        return empty  # nothing but stop words
+    word_embeddings = np.asarray(_encode(words))
+
+    keywords = get_kw_model().extract_keywords(
+        docs,
+        vectorizer=vectorizer,
+        use_mmr=True,
+        diversity=0.4,
+        top_n=max(top_n, conversation_top_n),
+        doc_embeddings=doc_embeddings,
+        word_embeddings=word_embeddings,
+    )
+    per_message = [list(k)[:top_n] for k in keywords[:-1]]
+    return per_message, list(keywords[-1])[:conversation_top_n]
+
 def extract_functions(data: Dict[str, Any], concept: str = "feature_development") -> List[str]:
     raw_sentences = find_semantic_matches(data, concept, top_n=10)
     return raw_sentences
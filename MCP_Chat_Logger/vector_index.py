@@ -0,0 +1,310 @@
+"""
+Append-only embedding store for semantic search over saved conversations.
+
+Vectors are L2-normalised and appended to a flat float16 file that is
+memory-mapped at query time; a JSONL sidecar holds one metadata row per
+vector. Exact search is a single matrix-vector product; past
+VECTOR_ANN_THRESHOLD vectors an in-memory IVF (k-means buckets) index is
+built and only the closest buckets are scored.
+"""
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+from contextlib import contextmanager
+from functools import lru_cache
+import os
+import json
+import threading
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+_THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_INDEX_DIR = os.path.join(_THIS_DIR, "chat_logs", "vectors")
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+@contextmanager
+def _file_lock(path: str) -> Iterator[None]:
+    """Exclusive lock on `path` shared by every process appending to the index."""
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class _IVFIndex:
+    """Coarse k-means partition; queries score only the `nprobe` nearest lists."""
+
+    def __init__(self, matrix: np.ndarray, n_lists: int, iterations: int = 10, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        n = matrix.shape[0]
+        sample = matrix[rng.choice(n, size=min(n, n_lists * 64), replace=False)].astype(np.float32)
+        centroids = sample[rng.choice(sample.shape[0], size=n_lists, replace=False)]
+        for _ in range(iterations):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(n_lists):
+                members = sample[assign == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids = _normalize(centroids)
+        self.centroids = centroids
+        self.size = n
+
+        # assign every vector in chunks to keep peak memory flat
+        assign = np.empty(n, dtype=np.int32)
+        for start in range(0, n, 65536):
+            block = matrix[start:start + 65536].astype(np.float32)
+            assign[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        order = np.argsort(assign, kind="stable")
+        bounds = np.searchsorted(assign[order], np.arange(n_lists + 1))
+        self.lists = [order[bounds[c]:bounds[c + 1]] for c in range(n_lists)]
+
+    def candidates(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        nearest = np.argsort(-(self.centroids @ query))[:nprobe]
+        return np.concatenate([self.lists[c] for c in nearest])
+
+
+class VectorIndex:
+    def __init__(
+        self,
+        directory: str = DEFAULT_INDEX_DIR,
+        ann_threshold: Optional[int] = None,
+        nprobe: Optional[int] = None,
+    ):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.vectors_path = os.path.join(directory, "embeddings.f16")
+        self.meta_path = os.path.join(directory, "meta.jsonl")
+        self.info_path = os.path.join(directory, "index.json")
+        self.lock_path = os.path.join(directory, "append.lock")
+        self.ann_threshold = ann_threshold or int(os.getenv("VECTOR_ANN_THRESHOLD", "200000"))
+        self.nprobe = nprobe or int(os.getenv("VECTOR_ANN_NPROBE", "8"))
+        self._lock = threading.Lock()
+        self._meta: List[Dict[str, Any]] = []
+        self._meta_offset = 0
+        self._meta_ino: Optional[int] = None
+        # appends re-embed a log's summary; only its newest summary row is searched
+        self._summary_rows: Dict[str, int] = {}
+        self._stale_rows: List[int] = []
+        self._ivf: Optional[_IVFIndex] = None
+        self.dim: Optional[int] = None
+        self._read_dim()
+
+    def _read_dim(self) -> None:
+        self.dim = None
+        if os.path.exists(self.info_path):
+            with open(self.info_path, "r", encoding="utf-8") as f:
+                self.dim = int(json.load(f)["dim"])
+
+    # ---- writes ----
+    def add(self, vectors: np.ndarray, metadata: List[Dict[str, Any]]) -> None:
+        """Append vectors with one metadata dict each (conversation_id, log_name, kind, position)."""
+        vectors = _normalize(vectors)
+        if len(vectors) != len(metadata):
+            raise ValueError("vectors and metadata must have the same length")
+        if not len(vectors):
+            return
+        # the MCP server's worker and CLI jobs may append at the same time
+        with self._lock, _file_lock(self.lock_path):
+            self._refresh_meta()
+            if self.dim is None:
+                self._read_dim()
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                with open(self.info_path, "w", encoding="utf-8") as f:
+                    json.dump({"dim": self.dim, "dtype": "float16"}, f)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"expected {self.dim}-d vectors, got {vectors.shape[1]}")
+            # no other writer is active, so anything past the last complete
+            # metadata row was torn by a crashed append: cut both files back to it
+            if os.path.exists(self.meta_path) and os.path.getsize(self.meta_path) > self._meta_offset:
+                os.truncate(self.meta_path, self._meta_offset)
+            aligned = len(self._meta) * self.dim * 2
+            if os.path.exists(self.vectors_path) and os.path.getsize(self.vectors_path) > aligned:
+                os.truncate(self.vectors_path, aligned)
+            # vectors first: readers only trust rows that also have metadata
+            with open(self.vectors_path, "ab") as f:
+                f.write(vectors.astype(np.float16).tobytes())
+            with open(self.meta_path, "a", encoding="utf-8") as f:
+                for m in metadata:
+                    f.write(json.dumps(m, ensure_ascii=False) + "\n")
+
+    def replace_with(self, source: "VectorIndex") -> None:
+        """
+        Swap the files of `source` (an index rebuilt in a scratch directory on the
+        same filesystem) in as this index's contents. Rows appended here meanwhile
+        for logs the rebuild does not cover are carried over first; readers in
+        other processes notice the swap on their next refresh.
+        """
+        with self._lock, _file_lock(self.lock_path):
+            self._refresh_meta()
+            matrix = self._matrix()
+            rebuilt = {m.get("log_name") for m in source._snapshot_meta()}
+            stale = set(self._stale_rows)
+            keep = [i for i, m in enumerate(self._meta[: 0 if matrix is None else matrix.shape[0]])
+                    if m.get("log_name") not in rebuilt and i not in stale]
+            if keep and source.dim in (None, self.dim):
+                source.add(np.asarray(matrix[keep], dtype=np.float32), [self._meta[i] for i in keep])
+            for name in ("index.json", "embeddings.f16", "meta.jsonl"):
+                target = os.path.join(self.directory, name)
+                if os.path.exists(os.path.join(source.directory, name)):
+                    os.replace(os.path.join(source.directory, name), target)
+                elif os.path.exists(target):
+                    os.remove(target)
+            self._refresh_meta()
+
+    # ---- reads ----
+    def _snapshot_meta(self) -> List[Dict[str, Any]]:
+        with self._lock, _file_lock(self.lock_path):
+            self._refresh_meta()
+            return list(self._meta)
+
+    def _refresh_meta(self) -> None:
+        ino = os.stat(self.meta_path).st_ino if os.path.exists(self.meta_path) else None
+        if ino != self._meta_ino or (ino is not None and os.path.getsize(self.meta_path) < self._meta_offset):
+            # the files were swapped by replace_with(): drop everything read from the old ones
+            self._meta, self._meta_offset, self._meta_ino, self._ivf = [], 0, ino, None
+            self._summary_rows, self._stale_rows = {}, []
+            self._read_dim()
+        if ino is None:
+            return
+        with open(self.meta_path, "rb") as f:
+            f.seek(self._meta_offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # partially written row; pick it up next time
+                m = json.loads(line)
+                if m.get("kind") == "summary":
+                    previous = self._summary_rows.get(m.get("log_name"))
+                    if previous is not None:
+                        self._stale_rows.append(previous)
+                    self._summary_rows[m.get("log_name")] = len(self._meta)
+                self._meta.append(m)
+                self._meta_offset += len(line)
+
+    def _matrix(self) -> Optional[np.ndarray]:
+        if self.dim is None or not os.path.exists(self.vectors_path):
+            return None
+        rows = os.path.getsize(self.vectors_path) // (self.dim * 2)
+        rows = min(rows, len(self._meta))
+        if rows == 0:
+            return None
+        return np.memmap(self.vectors_path, dtype=np.float16, mode="r", shape=(rows, self.dim))
+
+    def __len__(self) -> int:
+        with self._lock, _file_lock(self.lock_path):
+            self._refresh_meta()
+            matrix = self._matrix()
+        return 0 if matrix is None else matrix.shape[0]
+
+    def search(self, query: np.ndarray, top_k: int = 5) -> List[Dict[str, Any]]:
+        """
+        Top-k conversations by cosine similarity of their best-matching vector.
+        Returns [{conversation_id, log_name, score, kind, position}].
+        """
+        q = _normalize(query)[0]
+        # the file lock keeps a concurrent replace_with() from being seen half-done
+        with self._lock, _file_lock(self.lock_path):
+            self._refresh_meta()
+            matrix = self._matrix()
+            if matrix is None:
+                return []
+            meta = self._meta[: matrix.shape[0]]
+            stale = np.array([r for r in self._stale_rows if r < matrix.shape[0]], dtype=np.int64)
+            ivf = self._approximate_index(matrix)
+
+        if ivf is not None:
+            rows = ivf.candidates(q, self.nprobe)
+            # vectors appended since the IVF build are always scored exactly
+            rows = np.concatenate([rows, np.arange(ivf.size, matrix.shape[0])])
+            rows = rows[~np.isin(rows, stale)]
+            scores = matrix[rows].astype(np.float32) @ q
+        else:
+            rows = None
+            # score in blocks so the float16 memmap is never copied whole
+            scores = np.empty(matrix.shape[0], dtype=np.float32)
+            for start in range(0, matrix.shape[0], 65536):
+                block = matrix[start:start + 65536]
+                scores[start:start + len(block)] = block.astype(np.float32) @ q
+            scores[stale] = -np.inf
+
+        if not len(scores):
+            return []
+        # over-fetch so several hits from one conversation still leave k distinct ones
+        fetch = min(len(scores), max(top_k * 8, top_k))
+        best = np.argpartition(-scores, fetch - 1)[:fetch]
+        best = best[np.argsort(-scores[best])]
+
+        results: List[Dict[str, Any]] = []
+        seen = set()
+        for i in best:
+            row = int(rows[i]) if rows is not None else int(i)
+            if not np.isfinite(scores[i]):
+                break  # only superseded summaries are left
+            m = meta[row]
+            cid = m.get("conversation_id")
+            if cid in seen:
+                continue
+            seen.add(cid)
+            results.append({**m, "score": float(scores[i])})
+            if len(results) >= top_k:
+                break
+        return results
+
+    def _approximate_index(self, matrix: np.ndarray) -> Optional[_IVFIndex]:
+        n = matrix.shape[0]
+        if n < self.ann_threshold:
+            return None
+        # rebuild once the corpus has grown by a quarter since the last build
+        if self._ivf is None or n > self._ivf.size * 1.25:
+            self._ivf = _IVFIndex(matrix, n_lists=min(n, max(16, int(np.sqrt(n)))))
+        return self._ivf
+
+
+@lru_cache(maxsize=None)
+def get_vector_index(directory: Optional[str] = None) -> VectorIndex:
+    return VectorIndex(directory or os.getenv("VECTOR_INDEX_DIR") or DEFAULT_INDEX_DIR)
+
+
+def search_conversations(query: str, top_k: int = 5, store: Any = None) -> List[Dict[str, Any]]:
+    """
+    Embed `query` with the logger's MiniLM model and return the top-k saved
+    conversations, joined with title/summary from `store` (a LogStore) if given.
+    """
+    from process import get_semantic_model  # heavy; only needed when searching
+
+    hits = get_vector_index().search(get_semantic_model().encode([query])[0], top_k=top_k)
+    results = []
+    for hit in hits:
+        convo = (store.get_conversation(hit["conversation_id"]) if store is not None else None) or {}
+        results.append({
+            "conversation_id": hit["conversation_id"],
+            "project_name": convo.get("project_name"),
+            "title": convo.get("title"),
+            "summary": convo.get("summary"),
+            "score": round(hit["score"], 4),
+            "matched": hit["kind"],
+            "message_index": hit["position"] if hit["position"] >= 0 else None,
+        })
+    return results
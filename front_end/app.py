@@ -1,79 +1,269 @@
-from flask import Flask, jsonify, render_template
+from flask import Flask, g, jsonify, make_response, render_template, request
 from flask_cors import CORS
-from datetime import datetime, timedelta
+from datetime import datetime, timezone
 from pathlib import Path
-import json
+import hashlib
 import os
+import sys
+import time
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR / "MCP_Chat_Logger"))
+from log_store import LogStore, LogDirectoryWatcher, default_store_path
+from metrics import METRICS, merge_snapshots, read_snapshots, render_prometheus
 
 app = Flask(__name__)
 CORS(app)
 
-BASE_DIR = Path(__file__).resolve().parents[1]
 CHAT_LOGS_DIR = BASE_DIR / "MCP_Chat_Logger" / "chat_logs"
 app.config["CHAT_LOGS_DIR"] = str(CHAT_LOGS_DIR)
+app.config["CHAT_LOG_DB"] = default_store_path(str(CHAT_LOGS_DIR))
 
+_store = None
+_watcher = None
+
+# project aggregate, rebuilt only when the store's version changes
 cache = {
     'data': None,
-    'expiry': datetime.min
+    'version': None
 }
 
 @app.route("/")
 def index():
     return render_template("index.html")
 
-def process_log_files(log_dir):
-    """Reads all log files and processes them into project and summary data."""
-    p = Path(log_dir)
-    if not p.exists() or not p.is_dir():
-        return {"projects": [], "projectSummaries": []}
+def get_store():
+    """Open the log store once; the watcher's first poll imports any JSON logs it has not seen."""
+    global _store, _watcher
+    if _store is None:
+        _store = LogStore(app.config["CHAT_LOG_DB"])
+        _watcher = LogDirectoryWatcher(
+            _store,
+            app.config["CHAT_LOGS_DIR"],
+            min_interval=float(os.getenv("LOG_POLL_INTERVAL", "1.0")),
+        )
+    return _store
 
-    files = sorted(p.glob("*.json"), key=lambda f: f.stat().st_mtime, reverse=True)
+def get_watcher():
+    get_store()
+    return _watcher
 
-    project_summaries = []
-    for fpath in files:
-        try:
-            with fpath.open("r", encoding="utf-8") as f:
-                data = json.load(f)
-
-            project_summary = {
-                "id": data.get("id"),
-                "projectName": data.get("project_name"),
-                "title": data.get("title"),
-                "summary": data.get("summary"),
-                "messages": data.get("messages"),
-                "messageCount": data.get("message_count"),
-            }
-            project_summaries.append(project_summary)
-        except Exception as e:
-            continue
-        
-    # Aggregate projects
-    project_map = {}
-    for summary in project_summaries:
-        project_name = summary['projectName']
-        if project_name in project_map:
-            project_map[project_name]['updates'] += 1
-        else:
-            project_map[project_name] = {
-                'name': project_name,
-                'updates': 1,
-                'status': 'Active'
-            }
-    
+@app.before_request
+def sync_logs():
+    """Pick up new, changed or deleted log files before answering API calls."""
+    g.request_start = time.perf_counter()
+    if request.path.startswith("/api/"):
+        with METRICS.timer("stage_seconds", stage="dashboard_sync"):
+            get_watcher().poll()
+
+@app.after_request
+def record_request(response):
+    if request.path.startswith("/api/") and "request_start" in g:
+        METRICS.observe(
+            "http_request_seconds",
+            time.perf_counter() - g.request_start,
+            endpoint=request.url_rule.rule if request.url_rule else "unmatched",
+            status=response.status_code,
+        )
+    return response
+
+@app.route("/metrics")
+def metrics():
+    """Prometheus text: this dashboard process plus the logger/worker processes' latest snapshots."""
+    snapshot = merge_snapshots(read_snapshots(exclude_pid=os.getpid()) + [METRICS.snapshot()])
+    return app.response_class(render_prometheus(snapshot), mimetype="text/plain; version=0.0.4")
+
+def not_modified_or(build):
+    """
+    Answer with 304 when the client's ETag / Last-Modified still matches the
+    store's persistent version (the same across restarts and worker processes);
+    otherwise call `build()` and attach validators.
+    """
+    store_id, version, modified_at = get_store().data_version()
+    etag = hashlib.sha1(f"{store_id}:{version}:{request.full_path}".encode("utf-8")).hexdigest()
+    last_modified = datetime.fromtimestamp(modified_at, tz=timezone.utc)
+
+    if request.if_none_match.contains(etag) or (
+        not request.if_none_match and request.if_modified_since and request.if_modified_since >= last_modified
+    ):
+        response = app.response_class(status=304)
+    else:
+        response = build()
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.no_cache = True  # always revalidate
+    return response
+
+def summary_metadata(row):
+    """Lightweight listing entry: everything but the message bodies."""
     return {
-        'projects': list(project_map.values()),
-        'projectSummaries': project_summaries
+        "id": row["id"],
+        "projectName": row["project_name"],
+        "title": row["title"],
+        "summary": row["summary"],
+        "messageCount": row["message_count"],
+        "timestamp": row["created_at"],
+        "messageTypes": row["message_types"],
+        "hasDiff": row["has_diff"],
+        "keywords": row.get("keywords") or [],
     }
-    
+
+def get_project_list(store):
+    """Per-project update counts, recomputed only after the store changed."""
+    version = store.data_version()
+    if cache["data"] is not None and cache["version"] == version:
+        return cache["data"]
+
+    data = [
+        {'name': p['project_name'], 'updates': p['updates'], 'status': 'Active'}
+        for p in store.project_counts()
+    ]
+    cache["data"] = data
+    cache["version"] = version
+    return data
+
 @app.route("/api/projects")
 def get_projects():
-    if datetime.now() < cache["expiry"] and cache["data"] is not None:
-        return jsonify(cache["data"])
+    """
+    Paginated conversation listing without messages.
+    Query params: project (exact project name), keyword (one of a conversation's
+    enrichment keywords), cursor (from nextCursor), limit.
+    """
+    store = get_store()
+    project = request.args.get("project") or None
+    if project == "all":
+        project = None
+    limit = max(1, min(request.args.get("limit", 50, type=int), 500))
 
-    data = process_log_files(app.config["CHAT_LOGS_DIR"])
-    cache["data"] = data
-    cache["expiry"] = datetime.now() + timedelta(seconds=60)
-    return jsonify(data)
+    def build():
+        try:
+            rows, next_cursor = store.page_conversations(
+                project_name=project,
+                cursor=request.args.get("cursor") or None,
+                limit=limit,
+                keyword=request.args.get("keyword") or None,
+            )
+        except ValueError as e:
+            return make_response(jsonify({"error": str(e)}), 400)
+
+        return jsonify({
+            "projects": get_project_list(store),
+            "projectSummaries": [summary_metadata(r) for r in rows],
+            "nextCursor": next_cursor,
+        })
+
+    return not_modified_or(build)
+
+@app.route("/api/projects/<path:name>/stats")
+def get_project_stats(name):
+    """
+    Precomputed per-project rollups (no message scan): totals, counts by type and
+    tag, activity over time and the latest conversation.
+    Query params: bucket (day | week | month), tags (how many top tags).
+    """
+    bucket = request.args.get("bucket", "day")
+    tag_limit = max(1, min(request.args.get("tags", 20, type=int), 200))
+
+    def build():
+        try:
+            stats = get_store().project_stats(name, bucket=bucket, tag_limit=tag_limit)
+        except ValueError as e:
+            return make_response(jsonify({"error": str(e)}), 400)
+        if stats is None:
+            return make_response(jsonify({"error": "Project not found"}), 404)
+
+        latest = stats["latest"]
+        return jsonify({
+            "projectName": stats["project_name"],
+            "conversations": stats["conversations"],
+            "messages": stats["messages"],
+            "codeChanges": stats["code_changes"],
+            "messageTypes": stats["types"],
+            "tags": stats["tags"],
+            "activity": stats["activity"],
+            "latest": {
+                "id": latest["id"],
+                "title": latest["title"],
+                "summary": latest["summary"],
+                "messageCount": latest["message_count"],
+                "timestamp": latest["created_at"],
+            } if latest else None,
+        })
+
+    return not_modified_or(build)
+
+@app.route("/api/search")
+def search():
+    """
+    Ranked full-text search over titles, summaries, messages and code.
+    Query params: q, project, limit, offset.
+    """
+    query = (request.args.get("q") or "").strip()
+    project = request.args.get("project") or None
+    if project == "all":
+        project = None
+    limit = max(1, min(request.args.get("limit", 20, type=int), 100))
+    offset = max(0, request.args.get("offset", 0, type=int))
+    if not query:
+        return jsonify({"results": [], "nextOffset": None})
+
+    def build():
+        try:
+            hits, has_more = get_store().search(query, project_name=project, limit=limit, offset=offset)
+        except RuntimeError as e:
+            return make_response(jsonify({"error": str(e)}), 501)
+
+        results = [
+            {
+                "id": h["id"],
+                "projectName": h["project_name"],
+                "title": h["title"],
+                "summary": h["summary"],
+                "messageCount": h["message_count"],
+                "timestamp": h["created_at"],
+                "messageIndex": h["position"] if h["position"] >= 0 else None,
+                "snippet": h["snippet"],
+                "score": -h["score"],  # bm25: lower is better; flip so higher ranks first
+            }
+            for h in hits
+        ]
+        return jsonify({"results": results, "nextOffset": offset + limit if has_more else None})
+
+    return not_modified_or(build)
+
+@app.route("/api/semantic-search")
+def semantic_search():
+    """
+    Top-k conversations by embedding similarity to q (needs the logger's ML
+    dependencies: numpy + sentence-transformers). Query params: q, k.
+    """
+    query = (request.args.get("q") or "").strip()
+    top_k = max(1, min(request.args.get("k", 5, type=int), 50))
+    if not query:
+        return jsonify({"results": []})
+    try:
+        from vector_index import search_conversations
+    except ImportError as e:
+        return jsonify({"error": f"Semantic search unavailable: {e}"}), 501
+
+    results = search_conversations(query, top_k, get_store())
+    return jsonify({"results": results})
+
+@app.route("/api/conversations/<conversation_id>")
+def get_conversation(conversation_id):
+    """Latest saved version of one conversation, including its messages."""
+    def build():
+        row = get_store().get_conversation(conversation_id)
+        if row is None:
+            return make_response(jsonify({"error": "Conversation not found"}), 404)
+
+        detail = summary_metadata({**row, "message_types": [], "has_diff": False})
+        detail["messages"] = row["messages"]
+        detail["messageTypes"] = sorted({m["type"] for m in row["messages"] if m.get("type")})
+        detail["hasDiff"] = any(m.get("before_code") and m.get("after_code") for m in row["messages"])
+        return jsonify(detail)
+
+    return not_modified_or(build)
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5002)
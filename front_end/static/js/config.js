@@ -3,7 +3,10 @@
 const CONFIG = {
     // API endpoints
     API: {
-        PROJECTS: '/api/projects'
+        PROJECTS: '/api/projects',
+        CONVERSATIONS: '/api/conversations',
+        SEARCH: '/api/search',
+        PROJECT_STATS: (name) => `/api/projects/${encodeURIComponent(name)}/stats`
     },
     
     // UI constants
@@ -12,7 +15,8 @@ const CONFIG = {
         ANIMATION_DURATION: 200,
         MAX_FUNCTIONS_DISPLAY: 5,
         MAX_BUG_FIXES_DISPLAY: 5,
-        MAX_TAGS_DISPLAY: 6
+        MAX_TAGS_DISPLAY: 6,
+        PAGE_SIZE: 50
     },
     
     // Default values
@@ -8,32 +8,56 @@ class DataManager {
         this.allData = { projects: [], projectSummaries: [] };
         this.filteredProjects = [];
         this.selectedProject = null;
+        this.serverProjectFilter = 'all';
+        this.nextCursor = null;
     }
 
     /**
-     * Load project data from API
+     * Build the listing URL for one page of conversation metadata
      */
-    async loadData() {
-        try {
-            console.log('Starting to load data...');
-            const response = await fetch(CONFIG.API.PROJECTS);
-            console.log('API response status:', response.status);
+    buildProjectsUrl(cursor = null) {
+        const params = new URLSearchParams({ limit: CONFIG.UI.PAGE_SIZE });
+        if (this.serverProjectFilter && this.serverProjectFilter !== 'all') {
+            params.set('project', this.serverProjectFilter);
+        }
+        if (cursor) {
+            params.set('cursor', cursor);
+        }
+        return `${CONFIG.API.PROJECTS}?${params.toString()}`;
+    }
 
-            if (!response.ok) {
-                throw new Error('Failed to fetch project data');
-            }
+    /**
+     * Fetch one page of conversation metadata
+     */
+    async fetchPage(cursor = null) {
+        const response = await fetch(this.buildProjectsUrl(cursor));
+        console.log('API response status:', response.status);
 
-            const rawData = await response.json();
-            console.log('Raw data loaded:', rawData);
+        if (!response.ok) {
+            throw new Error('Failed to fetch project data');
+        }
 
-            // Process the project summaries to ensure they have all expected fields
-            if (rawData.projectSummaries) {
-                rawData.projectSummaries = rawData.projectSummaries.map((project, index) => {
-                    return this.processProjectData(project, index);
-                });
-            }
+        const rawData = await response.json();
+        const offset = cursor ? (this.allData.projectSummaries || []).length : 0;
+        rawData.projectSummaries = (rawData.projectSummaries || []).map((project, index) => {
+            return this.processProjectData(project, offset + index);
+        });
+        return rawData;
+    }
+
+    /**
+     * Load the first page of project data from API
+     * Only metadata is fetched; messages are loaded per conversation on selection
+     */
+    async loadData(projectFilter = this.serverProjectFilter) {
+        try {
+            console.log('Starting to load data...');
+            this.serverProjectFilter = projectFilter;
+            this.projectStats = new Map();
 
+            const rawData = await this.fetchPage();
             this.allData = rawData;
+            this.nextCursor = rawData.nextCursor || null;
             console.log('Processed data:', this.allData);
 
             this.filteredProjects = this.allData.projectSummaries || [];
@@ -45,6 +69,77 @@ class DataManager {
         }
     }
 
+    /**
+     * Append the next page of project data, if any
+     */
+    async loadMore() {
+        if (!this.nextCursor) {
+            return [];
+        }
+        const rawData = await this.fetchPage(this.nextCursor);
+        this.allData.projectSummaries = (this.allData.projectSummaries || []).concat(rawData.projectSummaries);
+        this.allData.projects = rawData.projects || this.allData.projects;
+        this.nextCursor = rawData.nextCursor || null;
+        return rawData.projectSummaries;
+    }
+
+    /**
+     * Whether more pages are available
+     */
+    hasMore() {
+        return Boolean(this.nextCursor);
+    }
+
+    /**
+     * Load messages for a conversation on demand and merge them into the project
+     */
+    async loadConversationDetail(project) {
+        if (!project || project.detailLoaded) {
+            return project;
+        }
+
+        const response = await fetch(`${CONFIG.API.CONVERSATIONS}/${encodeURIComponent(project.id)}`);
+        if (!response.ok) {
+            throw new Error('Failed to fetch conversation detail');
+        }
+
+        const detail = this.processProjectData(await response.json(), 0);
+        Object.assign(project, detail, { detailLoaded: true });
+        return project;
+    }
+
+    /**
+     * Run a server-side full-text search and show matching conversations
+     * Hits are collapsed to one entry per conversation, in rank order
+     */
+    async searchProjects(searchQuery, projectFilter = 'all', typeFilter = 'all') {
+        const params = new URLSearchParams({ q: searchQuery, limit: CONFIG.UI.PAGE_SIZE });
+        if (projectFilter !== 'all') {
+            params.set('project', projectFilter);
+        }
+
+        const response = await fetch(`${CONFIG.API.SEARCH}?${params.toString()}`);
+        if (!response.ok) {
+            throw new Error('Search failed');
+        }
+        const { results = [] } = await response.json();
+
+        const loaded = new Map((this.allData.projectSummaries || []).map(p => [p.id, p]));
+        const seen = new Set();
+        const matches = [];
+        results.forEach((hit, index) => {
+            if (seen.has(hit.id)) return;
+            seen.add(hit.id);
+            const project = loaded.get(hit.id) || this.processProjectData(hit, index);
+            matches.push(Object.assign(project, { snippet: hit.snippet }));
+        });
+
+        this.filteredProjects = matches.filter(
+            (project) => typeFilter === 'all' || project.type === typeFilter
+        );
+        return this.filteredProjects;
+    }
+
     /**
      * Filter projects based on search criteria
      */
@@ -88,6 +183,25 @@ class DataManager {
         return this.allData.projects;
     }
 
+    /**
+     * Fetch a project's precomputed rollups (type/tag counts, activity, latest conversation)
+     * Cached per project until the next full reload
+     */
+    async loadProjectStats(name) {
+        this.projectStats = this.projectStats || new Map();
+        if (!this.projectStats.has(name)) {
+            const request = fetch(CONFIG.API.PROJECT_STATS(name)).then((response) => {
+                if (!response.ok) {
+                    throw new Error('Failed to fetch project stats');
+                }
+                return response.json();
+            });
+            this.projectStats.set(name, request);
+            request.catch(() => this.projectStats.delete(name));
+        }
+        return this.projectStats.get(name);
+    }
+
     /**
      * Select a project
      */
@@ -281,8 +395,11 @@ class DataManager {
         }
 
         // Add some default tags based on message types if available
-        if (data.messages && Array.isArray(data.messages)) {
-            const messageTypes = [...new Set(data.messages.map(m => m.type).filter(Boolean))];
+        const hasMessages = Array.isArray(data.messages) && data.messages.length > 0;
+        if (hasMessages || Array.isArray(data.messageTypes)) {
+            const messageTypes = hasMessages
+                ? [...new Set(data.messages.map(m => m.type).filter(Boolean))]
+                : data.messageTypes;
             messageTypes.forEach(type => {
                 if (type && !tags.includes(type) && tags.length < CONFIG.UI.MAX_TAGS_DISPLAY) {
                     tags.push(type);
@@ -355,6 +472,7 @@ class DataManager {
             summary: data.summary || data.description || '',
             type: this.getTypeFromTag(data.tag || 'other'),
             timestamp: data.created_at || data.timestamp || new Date().toISOString(),
+            hasDiff: Boolean(data.hasDiff),
             aiModel: data.ai_model || CONFIG.DEFAULTS.AI_MODEL,
             functions: this.extractFunctions(data),
             bugFixes: this.extractBugFixes(data),
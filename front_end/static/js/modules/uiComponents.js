@@ -28,7 +28,7 @@ class UIComponents {
                     <i data-lucide="folder-open" class="w-4 h-4 text-gray-400"></i>
                     <div>
                         <div class="text-sm font-medium">${UIUtils.escapeHtml(project.name)}</div>
-                        <div class="text-xs text-gray-500">${UIUtils.escapeHtml(project.status)}</div>
+                        <div class="text-xs text-gray-500" data-project-stats>${UIUtils.escapeHtml(project.status)}</div>
                     </div>
                 </div>
                 <span class="text-xs bg-gray-100 text-gray-600 px-2 py-1 rounded-full">
@@ -45,6 +45,16 @@ class UIComponents {
             });
 
             projectsList.appendChild(projectDiv);
+
+            // rollups are precomputed server-side, so this stays cheap however long the history is
+            this.dataManager.loadProjectStats(project.name)
+                .then((stats) => {
+                    const statusLine = projectDiv.querySelector('[data-project-stats]');
+                    if (statusLine) {
+                        statusLine.textContent = `${stats.messages} messages · ${stats.codeChanges} code changes`;
+                    }
+                })
+                .catch((error) => console.error('Error loading project stats:', error));
         });
 
         UIUtils.initializeIcons();
@@ -61,6 +71,7 @@ class UIComponents {
 
         const filteredProjects = this.dataManager.getFilteredProjects();
         const selectedProject = this.dataManager.getSelectedProject();
+        const searchActive = Boolean(UIUtils.getElementById(CONFIG.ELEMENTS.SEARCH_INPUT)?.value?.trim());
 
         updateCount.textContent = filteredProjects.length;
         UIUtils.clearElement(updatesList);
@@ -80,6 +91,11 @@ class UIComponents {
                     <p class="text-xs text-gray-600 mt-1 ${CONFIG.CSS_CLASSES.LINE_CLAMP_1}">
                         ${UIUtils.renderMarkdown(project.summary)}
                     </p>
+                    ${searchActive && project.snippet ? `
+                        <p class="text-xs text-gray-500 mt-1 italic ${CONFIG.CSS_CLASSES.LINE_CLAMP_2}">
+                            ${UIUtils.renderMarkdown(project.snippet)}
+                        </p>
+                    ` : ''}
                 </div>
                 
                 <div class="flex items-center gap-2 text-xs mb-2">
@@ -91,7 +107,7 @@ class UIComponents {
                         ${UIUtils.getTypeIcon(project.type)}
                         ${UIUtils.escapeHtml(project.type)}
                     </span>
-                    ${(project.before_code && project.after_code) ? `
+                    ${(project.hasDiff || (project.before_code && project.after_code)) ? `
                         <span class="px-2 py-1 bg-blue-100 text-blue-700 rounded flex items-center gap-1" title="Contains before/after code changes">
                             <i data-lucide="git-compare" class="w-3 h-3"></i>
                             Diff
@@ -118,6 +134,25 @@ class UIComponents {
             updatesList.appendChild(updateDiv);
         });
 
+        if (this.dataManager.hasMore() && !searchActive) {
+            const loadMoreButton = UIUtils.createElement('button',
+                'w-full p-3 text-sm text-blue-600 hover:bg-gray-50 transition-colors'
+            );
+            loadMoreButton.textContent = 'Load more';
+            UIUtils.addEventListenerSafe(loadMoreButton, 'click', async () => {
+                loadMoreButton.disabled = true;
+                loadMoreButton.textContent = 'Loading...';
+                try {
+                    await this.dataManager.loadMore();
+                    this.applyClientFilters();
+                } catch (error) {
+                    console.error('Error loading more updates:', error);
+                    UIUtils.showError(error.message);
+                }
+            });
+            updatesList.appendChild(loadMoreButton);
+        }
+
         UIUtils.initializeIcons();
     }
 
@@ -322,15 +357,31 @@ class UIComponents {
             option.textContent = project.name;
             projectFilter.appendChild(option);
         });
+
+        // Keep the dropdown in sync with the server-side project filter
+        projectFilter.value = this.dataManager.serverProjectFilter || 'all';
     }
 
     /**
      * Select a project and update UI
      */
-    selectProject(project) {
+    async selectProject(project) {
         this.dataManager.selectProject(project);
         this.renderDetailView();
         this.renderUpdates(); // Re-render to update selected state
+
+        // Messages are fetched lazily; re-render once they arrive if still selected
+        if (!project.detailLoaded) {
+            try {
+                await this.dataManager.loadConversationDetail(project);
+                if (this.dataManager.getSelectedProject() === project) {
+                    this.renderDetailView();
+                }
+            } catch (error) {
+                console.error('Error loading conversation detail:', error);
+                UIUtils.showError(error.message);
+            }
+        }
     }
 
     /**
@@ -639,12 +690,41 @@ class UIComponents {
     /**
      * Handle filter changes
      */
-    handleFilterChange() {
+    async handleFilterChange() {
+        const projectFilter = UIUtils.getElementById(CONFIG.ELEMENTS.PROJECT_FILTER)?.value || 'all';
+
+        // Project filtering happens server-side; refetch the first page when it changes
+        if (projectFilter !== this.dataManager.serverProjectFilter) {
+            try {
+                await this.dataManager.loadData(projectFilter);
+            } catch (error) {
+                UIUtils.showError(error.message);
+                return;
+            }
+        }
+
+        this.applyClientFilters();
+    }
+
+    /**
+     * Apply search and type filters to the loaded pages and re-render
+     */
+    async applyClientFilters() {
         const searchQuery = UIUtils.getElementById(CONFIG.ELEMENTS.SEARCH_INPUT)?.value || '';
         const projectFilter = UIUtils.getElementById(CONFIG.ELEMENTS.PROJECT_FILTER)?.value || 'all';
         const typeFilter = UIUtils.getElementById(CONFIG.ELEMENTS.TYPE_FILTER)?.value || 'all';
 
-        this.dataManager.filterProjects(searchQuery, projectFilter, typeFilter);
+        if (searchQuery.trim()) {
+            // Search runs on the server so it covers messages and code, not just loaded pages
+            try {
+                await this.dataManager.searchProjects(searchQuery.trim(), projectFilter, typeFilter);
+            } catch (error) {
+                console.error('Search failed, falling back to loaded data:', error);
+                this.dataManager.filterProjects(searchQuery, projectFilter, typeFilter);
+            }
+        } else {
+            this.dataManager.filterProjects(searchQuery, projectFilter, typeFilter);
+        }
         this.renderUpdates();
     }
 }